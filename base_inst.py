@@ -2,13 +2,14 @@
 
 import sys
 import json
+import hashlib
 
 from collections import deque, defaultdict
 from dataclasses import dataclass, field
 from functools import cached_property
 from typing import List, Dict, Set, NamedTuple
 
-import networkx as nx
+import prof
 
 DEFAULT_DATA = 'data/nor1_critical_2.json'
 
@@ -56,18 +57,23 @@ class Base_train:
 class Base_inst:
 	trains: List[Base_train]
 	objs: List[Base_obj]
+	inst_hash: str
 
 
 	def __init__(self, jsn_file: str):
 		self.parse_json_file(jsn_file)
 
 
+	@prof.timed()
 	def parse_json_file(self, jsn_file: str):
 		self.trains = []
 		self.objs = []
 
-		with open(jsn_file, 'r') as fd:
-			jsn = json.load(fd)
+		with open(jsn_file, 'rb') as fd:
+			data = fd.read()
+
+		self.inst_hash = hashlib.sha1(data).hexdigest()
+		jsn = json.loads(data)
 		
 		for jsn_train in jsn['trains']:
 			self.parse_json_train(jsn_train)
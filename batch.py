@@ -0,0 +1,247 @@
+#!.venv/bin/python3
+
+import os
+import json
+import time
+import resource
+import argparse
+import multiprocessing as mp
+
+from queue import Empty
+from dataclasses import dataclass
+from typing import List, Dict
+
+from base_inst import Base_inst
+from bench import SOLVERS, get_instances, get_cached, put_cached, make_result
+from result_cache import Result_cache, CACHE_DIR
+
+
+# the most threads a backend makes use of, scip and the graph search run on one
+MAX_THREADS = { 'gurobi': 8, 'cpsat': 8, 'scip': 1, 'graph': 1 }
+
+# threads grow with the ops. the instances in data/ have up to about 46000 ops with half
+# of them below 3500, at this rate the testing instances stay on one thread, the median
+# instance gets 6 and the upper quarter all 8 of cpsat and gurobi
+OPS_PER_THREAD = 500
+
+
+@dataclass
+class Job:
+	id: int
+	solver: str
+	data: str
+	max_time: float
+	seed: int
+
+	inst_hash: str = ''
+	n_ops: int = 0
+	threads: int = 1
+
+	proc: mp.Process|None = None
+	time_start: float = 0.0
+
+	@property
+	def work(self):
+		return self.n_ops*self.max_time
+
+	@property
+	def deadline(self):
+		return self.time_start + self.max_time
+
+
+def run_job_worker(queue, job_id: int, solver: str, data: str, max_time: float, seed: int, threads: int, max_mem: int|None):
+	try:
+		# RLIMIT_DATA counts the heap, the address space would also count the thread stacks
+		# and arenas that multithreaded solvers reserve without using them
+		if max_mem is not None:
+			resource.setrlimit(resource.RLIMIT_DATA, (max_mem, max_mem))
+
+		queue.put((job_id, SOLVERS[solver](data, max_time, seed, threads)))
+	except MemoryError:
+		queue.put((job_id, { 'error': 'out of memory' }))
+	except Exception as e:
+		queue.put((job_id, { 'error': repr(e) }))
+
+
+class Batch:
+	jobs: List[Job]
+	insts: Dict[str, Base_inst]
+	n_cores: int
+	max_mem: int|None
+	grace_time: float
+	cache: Result_cache|None
+	out_file: str|None
+
+	def __init__(self, n_cores=None, max_mem=None, grace_time=10.0, cache=None, out_file=None):
+		self.jobs = []
+		self.insts = {}
+		self.n_cores = n_cores or len(os.sched_getaffinity(0))
+		self.max_mem = max_mem
+		self.grace_time = grace_time
+		self.cache = cache
+		self.out_file = out_file
+
+
+	def add(self, data: str, solver: str, max_time: float, seed: int):
+		if not data in self.insts:
+			self.insts[data] = Base_inst(data)
+
+		base_inst = self.insts[data]
+		job = Job(len(self.jobs), solver, data, max_time, seed, base_inst.inst_hash, sum(train.n_ops for train in base_inst.trains))
+
+		# threads grow with the size of the instance up to what the backend uses and the machine has
+		job.threads = max(1, min(job.n_ops//OPS_PER_THREAD, MAX_THREADS[solver], self.n_cores))
+		self.jobs.append(job)
+
+
+	def run(self) -> List[dict]:
+		# the largest jobs go first and always get their threads. while the largest waiting
+		# job does not fit, smaller ones fill the free cores if they are done by the time
+		# the running jobs leave enough cores for it. the threads of all running jobs never
+		# exceed the cores
+		ctx = mp.get_context('spawn')
+		queue = ctx.Queue()
+
+		pending = sorted(self.jobs, key=lambda job: -job.work)
+		running: Dict[int, Job] = {}
+		results = []
+		free = self.n_cores
+
+		out = open(self.out_file, 'w') if self.out_file else None
+
+		def finish(job: Job, rv: dict, cached=False):
+			nonlocal free
+			if not cached:
+				free += job.threads
+				running.pop(job.id)
+
+			result = self.make_result(job, rv, cached)
+			results.append(result)
+
+			print(f"[{len(results)}/{len(self.jobs)}] {result['instance']} {job.solver} seed {job.seed}, {job.threads} threads: "
+				f"{result['status']}, obj {result.get('obj')}, solve {result.get('solve_time', 0):.2f}s{' (cached)' if cached else ''}")
+
+			if out:
+				out.write(json.dumps(result) + '\n')
+				out.flush()
+
+		try:
+			while pending or running:
+				while pending and free > 0:
+					job = self.get_next(pending, running, free)
+					if job is None:
+						break
+
+					pending.remove(job)
+
+					rv = get_cached(self.cache, self.insts[job.data], self.get_config(job)) if self.cache else None
+					if rv is not None:
+						finish(job, rv, True)
+						continue
+
+					job.proc = ctx.Process(target=run_job_worker, daemon=True,
+						args=(queue, job.id, job.solver, job.data, job.max_time, job.seed, job.threads, self.max_mem))
+					job.time_start = time.time()
+					job.proc.start()
+
+					running[job.id] = job
+					free -= job.threads
+
+				if not running:
+					continue
+
+				try:
+					job_id, rv = queue.get(timeout=1.0)
+
+					if job_id in running:
+						running[job_id].proc.join(self.grace_time)
+						finish(running[job_id], rv)
+				except Empty:
+					pass
+
+				# hung solvers are killed, a crashed worker never reports back
+				for job in list(running.values()):
+					if time.time() > job.deadline + self.grace_time:
+						job.proc.terminate()
+						finish(job, { 'error': 'timeout' })
+					elif not job.proc.is_alive() and job.proc.exitcode != 0:
+						finish(job, { 'error': f'exit code {job.proc.exitcode}' })
+		finally:
+			for job in running.values():
+				job.proc.terminate()
+
+			if out:
+				out.close()
+
+		return results
+
+
+	def get_next(self, pending: List[Job], running: Dict[int, Job], free: int) -> Job|None:
+		head = pending[0]
+		if head.threads <= free:
+			return head
+
+		# the time the running jobs will have freed enough cores for the head
+		start = float('inf')
+		n_cores = free
+
+		for job in sorted(running.values(), key=lambda job: job.deadline):
+			n_cores += job.threads
+			if n_cores >= head.threads:
+				start = job.deadline
+				break
+
+		now = time.time()
+
+		return next((job for job in pending[1:] if job.threads <= free and now + job.max_time <= start), None)
+
+
+	def get_config(self, job: Job) -> dict:
+		return { 'runner': 'batch', 'solver': job.solver, 'max_time': job.max_time, 'seed': job.seed, 'threads': job.threads }
+
+
+	def make_result(self, job: Job, rv: dict, cached: bool) -> dict:
+		base_inst = self.insts[job.data]
+
+		if not cached:
+			put_cached(self.cache, job.data, base_inst, self.get_config(job), rv)
+
+		result = make_result(job.solver, job.data, job.seed, base_inst, rv, cached)
+		result['threads'] = job.threads
+
+		return result
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('data', nargs='*')
+	parser.add_argument('--solvers', default='cpsat,scip')
+	parser.add_argument('--families', default=None)
+	parser.add_argument('--seeds', default='0')
+	parser.add_argument('--max-time', type=float, default=60.0)
+	parser.add_argument('--cores', type=int, default=None)
+	parser.add_argument('--max-mem', type=float, default=None, help='GiB per job')
+	parser.add_argument('--out', default='batch.jsonl')
+	parser.add_argument('--cache', nargs='?', const=CACHE_DIR, default=None)
+	args = parser.parse_args(argv)
+
+	cache = Result_cache(args.cache) if args.cache else None
+	max_mem = int(args.max_mem*(1 << 30)) if args.max_mem else None
+	batch = Batch(args.cores, max_mem, cache=cache, out_file=args.out)
+
+	instances = args.data + (get_instances(args.families.split(',')) if args.families else [])
+
+	for data in instances:
+		for solver in args.solvers.split(','):
+			for seed in args.seeds.split(','):
+				batch.add(data, solver, args.max_time, int(seed))
+
+	print(f'{len(batch.jobs)} jobs on {batch.n_cores} cores')
+	time_start = time.time()
+
+	batch.run()
+	print(f'done: {time.time() - time_start:.2f}s')
+
+
+if __name__ == '__main__':
+	main()
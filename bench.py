@@ -0,0 +1,340 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+import multiprocessing as mp
+
+from queue import Empty
+from typing import List, Dict, Tuple, Callable
+
+from base_inst import Base_inst
+from instance import Instance
+from solution import Sol_checker
+from portfolio import ROOT_DIR, load_backend
+from result_cache import Result_cache, CACHE_DIR
+
+
+FAMILIES = {
+	'nor1_critical': 'data/nor1_critical_*.json',
+	'nor1_full': 'data/nor1_full_*.json',
+	'nor2': 'data/nor2_*.json',
+	'nor3': 'data/nor3_*.json',
+	'nor4_small': 'data/nor4_small_*.json',
+	'nor4_large': 'data/nor4_large_*.json',
+	'nor5_small': 'data/nor5_small_*.json',
+	'nor5_large': 'data/nor5_large_*.json',
+	'smi_close': 'data/smi_close_*.json',
+	'smi_headway': 'data/smi_headway_*.json',
+	'testing': 'data/testing/*.json',
+}
+
+
+# each runner returns the phase times, the events of the best solution and a lower bound.
+# threads 0 leaves the thread count to the backend
+def run_gurobi(data: str, max_time: float, seed: int, threads = 0) -> dict:
+	heur = load_backend('gurobi', 'heur')
+	rv = {}
+
+	time_start = time.time()
+	inst = heur.Instance(data)
+	rv['parse_time'] = time.time() - time_start
+
+	time_start = time.time()
+	h = heur.Heur(inst)
+	h.model.gm.Params.Seed = seed
+	h.model.gm.Params.Threads = threads
+	rv['build_time'] = time.time() - time_start
+
+	time_start = time.time()
+	rv['bound'] = h.solve(max_time)
+	rv['solve_time'] = time.time() - time_start
+
+	rv['iterations'] = h.n_iters
+	rv['events'] = h.model.get_jsn_events() if h.is_solved else None
+
+	return rv
+
+
+def run_cpsat(data: str, max_time: float, seed: int, threads = 0) -> dict:
+	solver = load_backend('cpsat', 'solver')
+	rv = {}
+
+	time_start = time.time()
+	inst = solver.Instance(data)
+	rv['parse_time'] = time.time() - time_start
+
+	time_start = time.time()
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+	s.solver.parameters.random_seed = seed
+	rv['build_time'] = time.time() - time_start
+
+	time_start = time.time()
+	is_feasible = s.solve(max_time, threads or 8)
+	rv['solve_time'] = time.time() - time_start
+
+	rv['iterations'] = s.solver.num_branches
+	rv['bound'] = s.solver.best_objective_bound if is_feasible or s.is_optimal() else None
+	rv['events'] = s.get_solution().get_jsn_events() if is_feasible else None
+
+	return rv
+
+
+def run_scip(data: str, max_time: float, seed: int, threads = 0) -> dict:
+	solver = load_backend('scip', 'solver')
+	rv = {}
+
+	time_start = time.time()
+	inst = solver.Instance(data)
+	rv['parse_time'] = time.time() - time_start
+
+	time_start = time.time()
+	s = solver.Solver(inst)
+	model, _ = s.make_model()
+	model.hideOutput()
+	model.setParam('limits/time', max_time)
+	model.setParam('randomization/randomseedshift', seed)
+	rv['build_time'] = time.time() - time_start
+
+	time_start = time.time()
+	model.optimize()
+	rv['solve_time'] = time.time() - time_start
+
+	# the scip objective leaves out increments, its dual bound is still a lower bound
+	rv['iterations'] = model.getNNodes()
+	rv['bound'] = model.getDualbound()
+	rv['events'] = s.get_jsn_events(model, model.getBestSol()) if model.getNSols() > 0 else None
+
+	return rv
+
+
+def run_graph(data: str, max_time: float, seed: int, threads = 0) -> dict:
+	# graph is written against the same instance api as the ortools code
+	graph = load_backend('cpsat', 'graph')
+	rv = {}
+
+	time_start = time.time()
+	inst = graph.Instance(data)
+	rv['parse_time'] = time.time() - time_start
+
+	time_start = time.time()
+	random.seed(seed)
+	g = graph.Heur(inst).make_graphs()
+	rv['build_time'] = time.time() - time_start
+
+	time_start = time.time()
+	is_solved = g.resolve_col()
+	rv['solve_time'] = time.time() - time_start
+
+	rv['iterations'] = None
+	rv['bound'] = None
+	rv['events'] = None
+
+	if is_solved:
+		_, start = g.make_order()
+		rv['events'] = [{ 'train': idx.train, 'operation': idx.op, 'time': start[idx] } for idx in g.nodes]
+
+	return rv
+
+
+SOLVERS: Dict[str, Callable] = {
+	'gurobi': run_gurobi,
+	'cpsat': run_cpsat,
+	'scip': run_scip,
+	'graph': run_graph,
+}
+
+
+def run_case_worker(queue, solver: str, data: str, max_time: float, seed: int):
+	try:
+		queue.put(SOLVERS[solver](data, max_time, seed))
+	except ImportError as e:
+		queue.put({ 'error': repr(e), 'import_error': True })
+	except Exception as e:
+		queue.put({ 'error': repr(e) })
+
+
+def run_case(solver: str, data: str, max_time: float, seed: int, grace_time=10.0, cache: Result_cache|None = None) -> dict:
+	base_inst = Base_inst(data)
+	config = { 'runner': 'bench', 'solver': solver, 'max_time': max_time, 'seed': seed }
+
+	rv = get_cached(cache, base_inst, config)
+	if rv is not None:
+		return make_result(solver, data, seed, base_inst, rv, True)
+
+	rv = run_case_process(solver, data, max_time, seed, grace_time)
+	put_cached(cache, data, base_inst, config, rv)
+
+	return make_result(solver, data, seed, base_inst, rv, False)
+
+
+def get_cached(cache: Result_cache|None, base_inst: Base_inst, config: dict) -> dict|None:
+	entry = cache.get(base_inst.inst_hash, config) if cache else None
+
+	return dict(entry['stats'], bound=entry['bound'], events=entry['events']) if entry is not None else None
+
+
+def put_cached(cache: Result_cache|None, data: str, base_inst: Base_inst, config: dict, rv: dict):
+	# timeouts and crashes are not cached, they may pass on the next run
+	if cache and not 'error' in rv:
+		stats = { k: v for k, v in rv.items() if not k in ('bound', 'events') }
+		obj, violations = check_events(data, rv['events'])
+
+		# invalid schedules are kept out of the cache, other runs would warm start from them
+		events = rv['events'] if not violations else None
+		cache.put(base_inst.inst_hash, config, obj, rv['bound'], events, stats)
+
+
+def check_events(data: str, events: List[dict]|None) -> Tuple[int|None, Dict[str, int]]:
+	# the objective and violations of a schedule as the checker sees them, backends model the
+	# instance differently and their own objectives are not compared
+	if events is None:
+		return None, {}
+
+	checker = Sol_checker(Instance(data))
+	sol = checker.make_solution(events)
+	violations = checker.check(sol)
+
+	return (checker.get_obj(sol) if not violations else None), violations
+
+
+def make_result(solver: str, data: str, seed: int, base_inst: Base_inst, rv: dict, cached: bool) -> dict:
+	result = { 'solver': solver, 'instance': os.path.relpath(data, ROOT_DIR), 'seed': seed, 'cached': cached }
+
+	if 'error' in rv:
+		result['status'] = rv['error']
+		result['import_error'] = rv.get('import_error', False)
+		return result
+
+	rv = dict(rv)
+	events = rv.pop('events')
+	result.update(rv)
+
+	result['obj'], violations = check_events(data, events)
+
+	if violations:
+		result['status'] = f'invalid {violations}'
+	else:
+		result['status'] = 'feasible' if events is not None else 'no solution'
+
+	if result['obj'] is not None and result['bound'] is not None:
+		result['gap'] = (result['obj'] - result['bound'])/max(abs(result['obj']), 1)
+
+	return result
+
+
+def run_case_process(solver: str, data: str, max_time: float, seed: int, grace_time: float) -> dict:
+	# a fresh process per case, backends do not share modules and a hung solver can be killed
+	ctx = mp.get_context('spawn')
+	queue = ctx.Queue()
+
+	proc = ctx.Process(target=run_case_worker, args=(queue, solver, data, max_time, seed), daemon=True)
+	proc.start()
+
+	try:
+		rv = queue.get(timeout=max_time + grace_time)
+	except Empty:
+		rv = { 'error': 'timeout' }
+
+	proc.join(grace_time)
+	if proc.is_alive():
+		proc.terminate()
+
+	return rv
+
+
+def get_instances(families: List[str]) -> List[str]:
+	instances = []
+
+	# a family without instances is a typo or a missing data directory, not an empty run
+	for family in families:
+		if not family in FAMILIES:
+			raise ValueError(f"unknown family {family}, one of {', '.join(FAMILIES)}")
+
+		files = sorted(glob.glob(os.path.join(ROOT_DIR, FAMILIES[family])))
+		if not files:
+			raise ValueError(f'no instances for family {family} at {FAMILIES[family]}')
+
+		instances += files
+
+	return instances
+
+
+def compare(results: List[dict], baseline: List[dict], time_tol=0.2, min_time=1.0) -> List[str]:
+	# returns the regressions against a stored baseline run
+	base = { (r['solver'], r['instance'], r['seed']): r for r in baseline }
+	regressions = []
+
+	for r in results:
+		b = base.get((r['solver'], r['instance'], r['seed']))
+		if b is None:
+			continue
+
+		name = f"{r['solver']} {r['instance']} seed {r['seed']}"
+
+		if b.get('obj') is not None and (r.get('obj') is None or r['obj'] > b['obj']):
+			regressions.append(f"{name}: obj {b['obj']} -> {r.get('obj')}")
+
+		for phase in ['parse_time', 'build_time', 'solve_time']:
+			if phase in b and phase in r and r[phase] > max(b[phase]*(1 + time_tol), b[phase] + min_time):
+				regressions.append(f'{name}: {phase} {b[phase]:.2f}s -> {r[phase]:.2f}s')
+
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--solvers', default='cpsat,scip')
+	parser.add_argument('--families', default='nor1_critical')
+	parser.add_argument('--seeds', default='0')
+	parser.add_argument('--max-time', type=float, default=60.0)
+	parser.add_argument('--out', default='bench.json')
+	parser.add_argument('--baseline', default=None)
+	parser.add_argument('--cache', nargs='?', const=CACHE_DIR, default=None)
+	args = parser.parse_args(argv)
+
+	cache = Result_cache(args.cache) if args.cache else None
+
+	config = {
+		'solvers': args.solvers.split(','),
+		'families': args.families.split(','),
+		'seeds': [int(x) for x in args.seeds.split(',')],
+		'max_time': args.max_time,
+	}
+
+	results = []
+
+	for data in get_instances(config['families']):
+		for solver in config['solvers']:
+			for seed in config['seeds']:
+				result = run_case(solver, data, config['max_time'], seed, cache=cache)
+				results.append(result)
+
+				# a backend that cannot be imported fails on every instance, the run is stopped
+				if result.get('import_error'):
+					sys.exit(f"{solver}: {result['status']}")
+
+				print(f"{result['instance']} {solver} seed {seed}: {result['status']}, obj {result.get('obj')}, "
+					f"gap {result.get('gap')}, solve {result.get('solve_time', 0):.2f}s{' (cached)' if result['cached'] else ''}")
+
+	with open(args.out, 'w') as fd:
+		json.dump({ 'config': config, 'results': results }, fd, indent=1)
+
+	if args.baseline:
+		with open(args.baseline, 'r') as fd:
+			regressions = compare(results, json.load(fd)['results'])
+
+		for reg in regressions:
+			print(f'regression {reg}')
+
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
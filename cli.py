@@ -0,0 +1,288 @@
+#!.venv/bin/python3
+
+import sys
+import json
+import argparse
+
+from result_cache import CACHE_DIR
+
+# nothing here imports a solver library, backends are loaded by the selected command
+
+
+def get_data(args, module) -> str:
+	data = args.data or module.DEFAULT_DATA
+	print(data)
+
+	return data
+
+
+def run_gurobi(args):
+	from portfolio import load_backend
+	heur = load_backend('gurobi', 'heur')
+
+	h = heur.Heur(heur.Instance(get_data(args, heur)))
+	h.solve(args.max_time)
+
+
+def run_cpsat(args):
+	from portfolio import load_backend
+	solver = load_backend('cpsat', 'solver')
+
+	inst = solver.Instance(get_data(args, solver))
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	if s.solve_stream(args.max_time, args.workers, out_file=args.out):
+		print(f'obj {s.solver.objective_value}, bound {s.solver.best_objective_bound}')
+	else:
+		print('no solution')
+
+
+def run_lns(args):
+	from portfolio import load_backend
+	lns = load_backend('cpsat', 'lns')
+
+	l = lns.Lns(lns.Instance(get_data(args, lns)), seed=args.seed, persistent=args.persistent, obj_type=lns.Obj_type.DELAY)
+	print(f'init: {l.best_obj}')
+
+	if args.procs > 1:
+		l.solve_parallel(args.max_time, args.procs)
+	else:
+		l.solve(args.max_time)
+
+	print(f'best: {l.best_obj}')
+
+
+def run_redispatch(args):
+	from portfolio import load_backend
+	redispatch = load_backend('cpsat', 'redispatch')
+
+	inst = redispatch.Instance(get_data(args, redispatch))
+	lns = redispatch.Lns(inst, obj_type=redispatch.Obj_type.DELAY)
+	print(f'init: {lns.best_obj}')
+
+	rd = redispatch.Redispatcher(inst, lns.best_sol, max_time=args.max_time, depth=args.depth)
+	redispatch.simulate(rd, args.updates, args.max_delay, args.seed)
+
+
+def run_groups(args):
+	from portfolio import load_backend
+	heuristic = load_backend('cpsat', 'heuristic')
+
+	heur = heuristic.Heuristic(heuristic.Instance(get_data(args, heuristic)), n_procs=args.procs)
+
+	if not heur.solve(args.group_time):
+		print('no schedule')
+
+
+def run_scip(args):
+	from portfolio import load_backend
+	solver = load_backend('scip', 'solver')
+
+	solver.Solver(solver.Instance(get_data(args, solver))).solve(args.max_time)
+
+
+def run_dive(args):
+	from portfolio import load_backend
+	heuristic = load_backend('scip', 'heuristic')
+
+	heuristic.Heur_solver(heuristic.Instance(get_data(args, heuristic))).solve()
+
+
+def run_graph(args):
+	# graph is written against the same instance api as the ortools code
+	from portfolio import load_backend
+	graph = load_backend('cpsat', 'graph')
+
+	graph.random.seed(args.seed)
+	g = graph.Heur(graph.Instance(get_data(args, graph))).make_graphs()
+	g.resolve_col()
+
+
+def run_portfolio(args):
+	import portfolio
+
+	cache = portfolio.Result_cache(args.cache) if args.cache else None
+	p = portfolio.Portfolio(get_data(args, portfolio), args.backends.split(','), args.max_time, out_file=args.out, cache=cache)
+	p.solve()
+
+	print(f'best: {p.best_obj} ({p.best_backend}), bound {p.bound}')
+
+
+def run_rolling(args):
+	import rolling
+
+	rh = rolling.Rolling_horizon(get_data(args, rolling), args.backends.split(','), args.window, args.overlap, args.window_time)
+	jsn_events = rh.solve()
+
+	if jsn_events is not None:
+		print(f'obj {rolling.get_jsn_obj(rh.base_inst, jsn_events)}')
+
+
+def run_decomp(args):
+	import decomp
+
+	d = decomp.Decomposition(get_data(args, decomp), args.backends.split(','), args.slack, args.max_size, args.cluster_time, args.procs)
+	jsn_events = d.solve()
+
+	if jsn_events is not None:
+		print(f'obj {decomp.get_jsn_obj(d.base_inst, jsn_events)}')
+
+
+def run_check(args):
+	import solution
+	import sol_file
+
+	inst = solution.Instance(get_data(args, solution))
+	checker = solution.Sol_checker(inst)
+
+	with open(args.sol, 'rb') as fd:
+		is_binary = fd.read(len(sol_file.MAGIC)) == sol_file.MAGIC
+
+	# a json solution, or json lines as streamed by cp-sat where the last line is the best
+	if not is_binary:
+		with open(args.sol, 'r') as fd:
+			lines = fd.read().strip().split('\n')
+
+		if lines == ['']:
+			print(f'{args.sol} holds no solution')
+			sys.exit(1)
+
+		try:
+			jsn_events = json.loads('\n'.join(lines))['events']
+		except json.JSONDecodeError:
+			jsn_events = json.loads(lines[-1])['events']
+	else:
+		reader = sol_file.Sol_reader(args.sol)
+		if reader.inst_hash != inst.base_inst.inst_hash:
+			print(f'{args.sol} belongs to another instance')
+			sys.exit(1)
+
+		jsn_events = reader.get_jsn_events()
+
+	sol = checker.make_solution(jsn_events)
+	print(f'violations {checker.check(sol)}, obj {checker.get_obj(sol)}')
+
+
+def run_info(args):
+	import instance
+
+	inst = instance.Instance(get_data(args, instance))
+	print(f'trains {inst.n_trains}, ops {inst.n_ops}, levels {inst.n_levels}, res {inst.n_res}')
+
+
+def run_generate(args):
+	import generator
+
+	if args.data:
+		with open(args.data, 'r') as fd:
+			jsn = generator.upscale(json.load(fd), args.factor, args.shift)
+	else:
+		jsn = generator.Generator(args.trains, args.sections, args.horizon, args.seed).generate()
+
+	generator.write_jsn(jsn, args.out)
+
+
+def run_bench(args):
+	import bench
+	bench.main(args.args)
+
+
+def run_batch(args):
+	import batch
+	batch.main(args.args)
+
+
+def make_parser() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser()
+	sub = parser.add_subparsers(dest='command', required=True)
+
+	def add_command(name, func, help, max_time=None):
+		p = sub.add_parser(name, help=help)
+		p.set_defaults(func=func)
+		p.add_argument('data', nargs='?', default=None)
+
+		if max_time is not None:
+			p.add_argument('--max-time', type=float, default=max_time)
+
+		return p
+
+	add_command('gurobi', run_gurobi, 'gurobi row generation (heur.Heur)', float('inf'))
+
+	p = add_command('cpsat', run_cpsat, 'cp-sat on the full instance', 60.0)
+	p.add_argument('--workers', type=int, default=8)
+	p.add_argument('--out', default=None)
+
+	p = add_command('lns', run_lns, 'cp-sat large neighbourhood search', 60.0)
+	p.add_argument('--procs', type=int, default=1)
+	p.add_argument('--seed', type=int, default=0)
+	p.add_argument('--persistent', action='store_true')
+
+	p = add_command('redispatch', run_redispatch, 'cp-sat re-dispatch of random delays', 1.0)
+	p.add_argument('--updates', type=int, default=10)
+	p.add_argument('--max-delay', type=int, default=300)
+	p.add_argument('--depth', type=int, default=1)
+	p.add_argument('--seed', type=int, default=0)
+
+	p = add_command('groups', run_groups, 'cp-sat train groups merged by collisions')
+	p.add_argument('--procs', type=int, default=1)
+	p.add_argument('--group-time', type=float, default=30.0)
+
+	add_command('scip', run_scip, 'scip with the resource constraint handler', 120.0)
+	add_command('dive', run_dive, 'scip dive and fix heuristic')
+
+	p = add_command('graph', run_graph, 'graph branching on collisions')
+	p.add_argument('--seed', type=int, default=0)
+
+	p = add_command('portfolio', run_portfolio, 'race the backends, sharing incumbents', 60.0)
+	p.add_argument('--backends', default='gurobi,cpsat,scip')
+	p.add_argument('--out', default=None)
+	p.add_argument('--cache', nargs='?', const=CACHE_DIR, default=None)
+
+	p = add_command('rolling', run_rolling, 'solve overlapping time windows one after another')
+	p.add_argument('--backends', default='cpsat')
+	p.add_argument('--window', type=int, default=3600)
+	p.add_argument('--overlap', type=int, default=1800)
+	p.add_argument('--window-time', type=float, default=30.0)
+
+	p = add_command('decomp', run_decomp, 'solve clusters of interacting trains in parallel and repair conflicts')
+	p.add_argument('--backends', default='cpsat')
+	p.add_argument('--slack', type=int, default=1800)
+	p.add_argument('--max-size', type=int, default=40)
+	p.add_argument('--cluster-time', type=float, default=30.0)
+	p.add_argument('--procs', type=int, default=4)
+
+	p = add_command('check', run_check, 'validate a stored solution')
+	p.add_argument('--sol', required=True)
+
+	add_command('info', run_info, 'load an instance')
+
+	# without data a random instance is generated, with data its trains are replicated
+	p = add_command('generate', run_generate, 'write a synthetic or upscaled instance')
+	p.add_argument('--out', required=True)
+	p.add_argument('--trains', type=int, default=12)
+	p.add_argument('--sections', type=int, default=40)
+	p.add_argument('--horizon', type=int, default=14400)
+	p.add_argument('--seed', type=int, default=0)
+	p.add_argument('--factor', type=int, default=10)
+	p.add_argument('--shift', type=int, default=None)
+
+	# the bench and batch options are parsed by their main
+	p = sub.add_parser('bench', help='benchmark suite, see bench.py --help', add_help=False)
+	p.set_defaults(func=run_bench)
+
+	p = sub.add_parser('batch', help='solve many instances in parallel, see batch.py --help', add_help=False)
+	p.set_defaults(func=run_batch)
+
+	return parser
+
+
+if __name__ == '__main__':
+	parser = make_parser()
+	args, rest = parser.parse_known_args()
+
+	if not args.command in ('bench', 'batch') and rest:
+		parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+	args.args = rest
+	args.func(args)
@@ -0,0 +1,246 @@
+#!.venv/bin/python3
+
+import sys
+import time
+
+import numpy as np
+
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Set, Tuple
+
+from base_inst import Base_inst, Base_train
+from disjoint_set import Disjoint_set
+from portfolio import get_jsn_obj
+from rolling import get_train_start, solve_sub_inst
+from sol_file import make_records
+from solution import get_overlapping
+
+
+DEFAULT_DATA = 'data/nor1_full_0.json'
+
+
+def get_earliest_starts(train: Base_train) -> List[int]:
+	# earliest start of every op over any path, ops are visited in topological order
+	n_in = [0]*train.n_ops
+	for op in train.ops:
+		for s in op.succ:
+			n_in[s] += 1
+
+	earliest = [op.start_lb for op in train.ops]
+	reached = [False]*train.n_ops
+	reached[0] = True
+	queue = deque([0])
+
+	while queue:
+		i = queue.popleft()
+		op = train.ops[i]
+
+		for s in op.succ:
+			t = max(earliest[i] + op.dur, train.ops[s].start_lb)
+			earliest[s] = t if not reached[s] else min(earliest[s], t)
+			reached[s] = True
+
+			n_in[s] -= 1
+			if n_in[s] == 0:
+				queue.append(s)
+
+	return earliest
+
+
+def get_res_intervals(base_inst: Base_inst, jsn_events: List[dict]) -> Dict[str, List[Tuple[int, int, int]]]:
+	# (lock, unlock, train) per resource, a train holds it from its first lock to its last release
+	intervals = {}
+
+	for rec in make_records(base_inst, jsn_events):
+		t = int(rec['train'])
+
+		for res in base_inst.trains[t].ops[rec['op']].res:
+			lock, unlock = int(rec['start']), int(rec['end']) + res.time
+			old = intervals.get((res.name, t))
+
+			intervals[res.name, t] = (min(old[0], lock), max(old[1], unlock)) if old else (lock, unlock)
+
+	res_intervals = defaultdict(list)
+	for (res, t), (lock, unlock) in intervals.items():
+		res_intervals[res].append((lock, unlock, t))
+
+	return res_intervals
+
+
+class Decomposition:
+	data: str
+	base_inst: Base_inst
+	backends: List[str]
+
+	slack: int
+	max_size: int
+	cluster_time: float
+	n_procs: int
+	repair_size: int
+	max_repairs: int
+	max_retries: int
+
+	clusters: List[List[int]]
+	events: Dict[int, List[dict]]
+
+	def __init__(self, data, backends=['cpsat'], slack=1800, max_size=40, cluster_time=30.0, n_procs=4, repair_size=8, max_repairs=5, max_retries=2):
+		self.data = data
+		self.base_inst = Base_inst(data)
+		self.backends = backends
+		self.slack = slack
+		self.max_size = max_size
+		self.cluster_time = cluster_time
+		self.n_procs = n_procs
+		self.repair_size = repair_size
+		self.max_repairs = max_repairs
+		self.max_retries = max_retries
+
+		self.events = {}
+
+
+	def make_interactions(self) -> Dict[Tuple[int, int], int]:
+		# trains interact on a resource if their earliest uses are at most slack apart,
+		# the weight is the number of such resources
+		uses = defaultdict(list)
+
+		for t, train in enumerate(self.base_inst.trains):
+			earliest = get_earliest_starts(train)
+			first_use = {}
+
+			for op, start in zip(train.ops, earliest):
+				for res in op.res:
+					first_use[res.name] = min(first_use.get(res.name, start), start)
+
+			for res, start in first_use.items():
+				uses[res].append((start, t))
+
+		weights = defaultdict(int)
+
+		for res_uses in uses.values():
+			res_uses.sort()
+
+			for i, (start1, t1) in enumerate(res_uses):
+				for start2, t2 in res_uses[i + 1:]:
+					if start2 - start1 > self.slack:
+						break
+
+					weights[min(t1, t2), max(t1, t2)] += 1
+
+		return weights
+
+
+	def make_clusters(self):
+		# components of the interaction graph, heaviest edges first and without
+		# growing a cluster over max_size, so only light edges are cut
+		weights = self.make_interactions()
+		ds = Disjoint_set(self.base_inst.n_trains)
+		cut = 0
+
+		for (t1, t2), w in sorted(weights.items(), key=lambda x: -x[1]):
+			c1, c2 = ds.find_set(t1), ds.find_set(t2)
+
+			if c1 != c2 and ds.size[c1] + ds.size[c2] > self.max_size:
+				cut += w
+			elif c1 != c2:
+				ds.union_set(c1, c2)
+
+		self.clusters = sorted(ds.get_sets(), key=len, reverse=True)
+		print(f'{len(self.clusters)} clusters, largest {len(self.clusters[0])}, cut weight {cut} of {sum(weights.values())}')
+
+
+	def solve(self) -> List[dict]|None:
+		self.make_clusters()
+		time_start = time.time()
+
+		with ThreadPoolExecutor(self.n_procs) as pool:
+			results = list(pool.map(lambda c: solve_sub_inst(self.base_inst, c, {}, self.backends, self.cluster_time, self.max_retries), self.clusters))
+
+		for cluster, cluster_events in zip(self.clusters, results):
+			if cluster_events is None:
+				print(f'cluster of {len(cluster)} trains: no solution')
+				return None
+
+			self.events.update(cluster_events)
+
+		print(f'clusters solved: {time.time() - time_start:.2f}s')
+
+		for k in range(self.max_repairs):
+			conflicts = self.get_conflicts()
+			if not conflicts:
+				return self.get_jsn_events()
+
+			if not self.repair(conflicts):
+				break
+
+		print('conflicts left')
+		return None
+
+
+	def get_conflicts(self) -> Set[int]:
+		# trains overlapping another train on some resource, by the rule of the checker
+		res_intervals = get_res_intervals(self.base_inst, self.get_jsn_events())
+		intervals = [(r, lock, unlock, t) for r, res in enumerate(res_intervals.values()) for lock, unlock, t in res]
+
+		if not intervals:
+			return set()
+
+		res, lock, unlock, train = np.array(intervals, dtype=np.int64).T
+
+		return set(int(t) for t in train[get_overlapping(res, lock, unlock)])
+
+
+	def repair(self, conflicts: Set[int]) -> bool:
+		# the conflicting trains are solved again in chunks by departure, each around the trains
+		# sharing a resource with it close in time, including the chunks repaired before it.
+		# later chunks are left out, anything pushed further shows up as a conflict again
+		order = sorted(conflicts, key=lambda t: get_train_start(self.base_inst.trains[t]))
+		repaired = set()
+
+		for k in range(0, len(order), self.repair_size):
+			time_start = time.time()
+			free = order[k:k + self.repair_size]
+			res_intervals = get_res_intervals(self.base_inst, self.get_jsn_events())
+
+			begin = min(get_train_start(self.base_inst.trains[t]) for t in free)
+			end = max(unlock for intervals in res_intervals.values() for _, unlock, t in intervals if t in free) + self.slack
+
+			neighbours = set()
+			for intervals in res_intervals.values():
+				if any(t in free for _, _, t in intervals):
+					neighbours.update(t for lock, unlock, t in intervals if unlock > begin and lock < end)
+
+			fixed = { t: self.events[t] for t in sorted(neighbours) if not t in conflicts or t in repaired }
+			repair_events = solve_sub_inst(self.base_inst, free, fixed, self.backends, self.cluster_time, self.max_retries)
+
+			if repair_events is None:
+				print(f'repair of {len(free)} trains, {len(fixed)} fixed: no solution')
+				return False
+
+			self.events.update(repair_events)
+			repaired.update(free)
+
+			print(f'repair of {len(free)} of {len(conflicts)} trains, {len(fixed)} fixed: {time.time() - time_start:.2f}s')
+
+		return True
+
+
+	def get_jsn_events(self) -> List[dict]:
+		jsn_events = [ev for events in self.events.values() for ev in events]
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	max_size = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+	cluster_time = float(sys.argv[3]) if len(sys.argv) > 3 else 30.0
+	backends = sys.argv[4].split(',') if len(sys.argv) > 4 else ['cpsat']
+	print(data)
+
+	decomp = Decomposition(data, backends, max_size=max_size, cluster_time=cluster_time)
+	jsn_events = decomp.solve()
+
+	if jsn_events is not None:
+		print(f'obj {get_jsn_obj(decomp.base_inst, jsn_events)}')
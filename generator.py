@@ -0,0 +1,189 @@
+#!.venv/bin/python3
+
+import sys
+import json
+import random
+
+from typing import List, Tuple
+
+
+class Generator:
+	rng: random.Random
+
+	n_trains: int
+	n_sections: int
+	horizon: int
+
+	# a section has one track per resource, branches are sections with alternative tracks
+	max_tracks: int
+	branch_prob: float
+	min_len: int
+
+	min_dur: int
+	max_dur: int
+	release_times: List[int]
+	release_prob: float
+
+	obj_prob: float
+	max_slack: int
+	increment_prob: float
+
+	def __init__(self, n_trains=12, n_sections=40, horizon=14400, seed=0, max_tracks=3, branch_prob=0.3, min_len=10,
+			min_dur=30, max_dur=300, release_times=[0, 5, 10, 30], release_prob=0.2, obj_prob=0.1, max_slack=120,
+			increment_prob=0.2):
+		self.rng = random.Random(seed)
+		self.n_trains = n_trains
+		self.n_sections = n_sections
+		self.horizon = horizon
+		self.max_tracks = max_tracks
+		self.branch_prob = branch_prob
+		self.min_len = min(min_len, n_sections)
+		self.min_dur = min_dur
+		self.max_dur = max_dur
+		self.release_times = release_times
+		self.release_prob = release_prob
+		self.obj_prob = obj_prob
+		self.max_slack = max_slack
+		self.increment_prob = increment_prob
+
+
+	def make_network(self) -> List[List[str]]:
+		# the resources of every section, in the order along the line
+		sections = []
+
+		for s in range(self.n_sections):
+			n_tracks = self.rng.randint(2, self.max_tracks) if self.rng.random() < self.branch_prob else 1
+			sections.append([f'r{s}_{k}' for k in range(n_tracks)])
+
+		return sections
+
+
+	def make_train(self, sections: List[List[str]]) -> Tuple[List[dict], List[Tuple[int, int]]]:
+		# a run over consecutive sections in either direction, every section is a level of ops
+		# with all ops of the next level as successors. returns the ops and (op, earliest start)
+		# of the ops at the end of every level
+		first = self.rng.randint(0, self.n_sections - self.min_len)
+		last = self.rng.randint(first + self.min_len, self.n_sections)
+		route = sections[first:last] if self.rng.random() < 0.5 else sections[first:last][::-1]
+
+		start = self.rng.randint(0, self.horizon)
+		ops = [{ 'start_ub': 0, 'min_duration': 0, 'successors': [] }]
+		prev = [0]
+		levels = []
+
+		for tracks in route:
+			dur = self.rng.randint(self.min_dur, self.max_dur)
+			level = []
+
+			for res in tracks:
+				jsn_res = { 'resource': res }
+				if self.rng.random() < self.release_prob:
+					jsn_res['release_time'] = self.rng.choice(self.release_times)
+
+				level.append(len(ops))
+				ops.append({ 'start_lb': start, 'min_duration': dur, 'resources': [jsn_res], 'successors': [] })
+
+			for i in prev:
+				ops[i]['successors'] = level
+
+			levels.append((level[0], start))
+			prev = level
+			start += dur
+
+		for i in prev:
+			ops[i]['successors'] = [len(ops)]
+
+		ops.append({ 'start_lb': start, 'min_duration': 0, 'successors': [] })
+		levels.append((len(ops) - 1, start))
+
+		return ops, levels
+
+
+	def make_obj(self, t: int, op: int, start: int) -> dict:
+		obj = { 'type': 'op_delay', 'train': t, 'operation': op, 'threshold': start + self.rng.randint(0, self.max_slack) }
+
+		# an op delay either costs per second or once, never both
+		if self.rng.random() < self.increment_prob:
+			obj['increment'] = self.rng.randint(1, 10)*60
+		else:
+			obj['coeff'] = self.rng.randint(1, 3)
+
+		return obj
+
+
+	def generate(self) -> dict:
+		sections = self.make_network()
+		jsn = { 'trains': [], 'objective': [] }
+
+		for t in range(self.n_trains):
+			ops, levels = self.make_train(sections)
+			jsn['trains'].append(ops)
+
+			# the arrival always counts, stops on the way sometimes
+			for op, start in levels[:-1]:
+				if self.rng.random() < self.obj_prob:
+					jsn['objective'].append(self.make_obj(t, op, start))
+
+			jsn['objective'].append(self.make_obj(t, *levels[-1]))
+
+		return jsn
+
+
+def get_span(jsn: dict) -> int:
+	starts = [op['start_lb'] for train in jsn['trains'] for op in train if 'start_lb' in op]
+
+	return max(starts) - min(starts) if starts else 0
+
+
+def upscale(jsn: dict, factor: int, shift: int|None = None) -> dict:
+	# factor copies of every train on the same resources, copy k runs k*shift later.
+	# the default shift keeps the density of the original, a smaller one congests it
+	if shift is None:
+		shift = get_span(jsn)
+
+	n_trains = len(jsn['trains'])
+	up = { 'trains': [], 'objective': [] }
+
+	for k in range(factor):
+		for train in jsn['trains']:
+			ops = []
+
+			for op in train:
+				op = dict(op)
+
+				for key in ('start_lb', 'start_ub'):
+					if key in op:
+						op[key] += k*shift
+
+				ops.append(op)
+
+			up['trains'].append(ops)
+
+		for obj in jsn['objective']:
+			up['objective'].append(dict(obj, train=obj['train'] + k*n_trains, threshold=obj.get('threshold', 0) + k*shift))
+
+	return up
+
+
+def write_jsn(jsn: dict, out_file: str):
+	with open(out_file, 'w') as fd:
+		json.dump(jsn, fd)
+
+	print(f"{out_file}: {len(jsn['trains'])} trains, {sum(len(train) for train in jsn['trains'])} ops")
+
+
+if __name__ == '__main__':
+	# generator.py out_file [n_trains] [seed] or generator.py out_file data factor [shift]
+	out_file = sys.argv[1] if len(sys.argv) > 1 else 'data/gen.json'
+
+	if len(sys.argv) > 2 and sys.argv[2].endswith('.json'):
+		with open(sys.argv[2], 'r') as fd:
+			jsn = json.load(fd)
+
+		factor = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+		shift = int(sys.argv[4]) if len(sys.argv) > 4 else None
+		write_jsn(upscale(jsn, factor, shift), out_file)
+	else:
+		n_trains = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+		seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+		write_jsn(Generator(n_trains, seed=seed).generate(), out_file)
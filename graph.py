@@ -113,10 +113,10 @@ class Graph:
 	
 	
 	def resolve_col(self, depth=0):
-		order, start = g.make_order()
+		order, start = self.make_order()
 
 		if len(order) < len(self.nodes):
-			print(f'{'  '*depth}cycle')
+			print(f'{"  "*depth}cycle')
 			return False
 
 		col = self.find_branch(start)
@@ -128,13 +128,13 @@ class Graph:
 		if start[s1] > start[s2]:
 			(s2, e2, t2), (s1, e1, t1) = col
 		
-		print(f'{'  '*depth}{e1} -> {s2}')
+		print(f'{"  "*depth}{e1} -> {s2}')
 		self.add_edge(e1, s2, t1)
 		if self.resolve_col(depth+1):
 			return True
 		self.remove_edge(e1, s2)
 
-		print(f'{'  '*depth}{e2} -> {s1}')
+		print(f'{"  "*depth}{e2} -> {s1}')
 		self.add_edge(e2, s1, t2)
 		if self.resolve_col(depth+1):
 			return True
@@ -1,10 +1,12 @@
 #!.venv/bin/python3
 import sys
+import time
 
 from gurobipy import GRB
 
 from instance import Instance
 from train_interval import Model
+import prof
 
 DEFAULT_DATA = 'data/nor1_critical_0.json'
 
@@ -13,6 +15,10 @@ class Heur():
 	inst: Instance
 	model: Model
 
+	n_iters: int
+	is_solved: bool
+
+	@prof.timed()
 	def __init__(self, inst):
 		self.inst = inst
 		self.model = Model(self.inst)
@@ -20,32 +26,90 @@ class Heur():
 		self.model.set_inst_obj()
 
 	
-	def solve(self):
+	@prof.timed()
+	def solve(self, max_time=float('inf'), client=None) -> float|None:
+		# returns the last lower bound, every iteration solves a relaxation of the full problem.
+		# resources are held at least 1s after every op (min_res_time), which is how the model
+		# keeps two trains from swapping at one instant
 		self.model.gm.Params.OutputFlag = 0
+		self.client = client
+
+		time_start = time.time()
+		bound = None
+
+		self.is_solved = False
 
 		it = 0
 
 		while True:
 			it += 1
-			self.model.gm.update()
-			self.model.gm.optimize()
-			self.model.gm.write('model.lp')
+			self.n_iters = it
+
+			time_left = max_time - (time.time() - time_start)
+			if time_left <= 0:
+				print(f'it {it} time limit')
+				break
+
+			self.model.gm.Params.TimeLimit = min(time_left, GRB.INFINITY)
+
+			if client is not None:
+				start = client.get_start()
+				if start is not None:
+					self.model.set_start(start[1])
+
+			with prof.timer('optimize'):
+				self.model.gm.update()
+				self.model.gm.optimize(self.callback if client else None)
+
+			with prof.timer('write_lp'):
+				self.model.gm.write('model.lp')
+
+			prof.count('heur_iterations')
 
 			if (self.model.gm.Status == GRB.INFEASIBLE):
 				print(f'it {it} infeasible')
 				break
 
-			collisions = self.get_col()
+			if (self.model.gm.Status != GRB.OPTIMAL):
+				print(f'it {it} stopped')
+				break
+
+			bound = self.model.gm.ObjBound
+			with prof.timer('get_col'):
+				collisions = self.get_col()
 
 			if len(collisions) == 0:
 				print(f'it {it} solved')
+				self.is_solved = True
+
+				if client is not None:
+					client.send(self.model.get_jsn_events(), bound)
 				break
 
+			if client is not None:
+				client.send(None, bound)
+
 			_, r, t1, t2 = min(collisions)
 
 			print(f'it {it} adding:', r, t1, t2)
 
 			self.model.add_cons_res_overlap(r, t1, t2)
+
+		return bound
+	
+	def callback(self, gm, where):
+		if self.client.is_stopped():
+			gm.terminate()
+			return
+
+		if where == GRB.Callback.MIPNODE and gm.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL:
+			start = self.client.get_start()
+
+			if start is not None:
+				values = self.model.get_start_values(start[1])
+				gm.cbSetSolution(list(values.keys()), list(values.values()))
+				gm.cbUseSolution()
+
 	
 	def get_col(self):
 		res_uses = self.model.get_result_res_uses()
@@ -10,6 +10,7 @@ from typing import List, Dict, Set
 
 from disjoint_set import Disjoint_set
 from base_inst import Base_inst
+import prof
 
 
 DEFAULT_DATA = 'data/smi_headway_5.json'
@@ -119,6 +120,7 @@ class Instance:
 		self.add_levels()
 
 
+	@prof.timed()
 	def add_trains_ops(self):
 		self.trains = []
 		self.ops = []
@@ -167,6 +169,7 @@ class Instance:
 			self.ops[base_obj.op + self.trains[base_obj.train].op_start].obj = obj
 
 
+	@prof.timed()
 	def add_levels(self):
 		self.levels = []
 
@@ -173,6 +173,12 @@ class Instance:
 
 		self.n_train_ops = [len(train_ops) for train_ops in self.ops]
 
+		# every op of the train one after the other, each holding its resources
+		self.max_train_dur = [
+			max(op.start_lb for op in train_ops) + sum(op.dur + max((res.time for res in op.res), default=0) + 1 for op in train_ops)
+			for train_ops in self.ops
+		]
+
 		for obj_jsn in jsn['objective']:
 			if obj_jsn['type'] != 'op_delay':
 				continue
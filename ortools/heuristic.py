@@ -1,15 +1,23 @@
 #!.venv/bin/python3
 
+import os
 import sys
+import json
+import heapq
 
 from collections import defaultdict
-from typing import List, Dict, Tuple, NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Set, Tuple, Iterable, NamedTuple
 
 from solver import Event, Solution, Solver
-from instance import Instance, Op, Op_idx
+from instance import Instance, Op_idx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from disjoint_set import Disjoint_set
+import prof
 
 
 DEFAULT_DATA = 'data/nor1_critical_0.json'
+CACHE_DIR = 'cache/heuristic'
 
 
 class Res_col(NamedTuple):
@@ -18,26 +26,51 @@ class Res_col(NamedTuple):
 	op2: Op_idx
 
 
+def solve_train(inst: Instance, t: int, num_workers=8) -> List[Event]:
+	solver = Solver(inst, None, free=[t])
+	solver.add_time_obj()
+	solver.solve(num_workers=num_workers)
+
+	return solver.get_solution().events[t]
+
+
+worker_inst: Instance = None
+
+def init_worker(inst: Instance):
+	global worker_inst
+	worker_inst = inst
+
+
+def solve_train_worker(t: int) -> List[Event]:
+	return solve_train(worker_inst, t, num_workers=1)
+
+
 class Heuristic:
 	inst: Instance
 	groups: List[Solution]
-	train_to_group: Dict[int, int]
-	collisions: List[Res_col]
+	collisions: Set[Res_col]
 	group_col_count: Dict[Tuple[int, int], int]
+	group_set: Disjoint_set
+	res_uses: Dict[int, Dict[Op_idx, Tuple[int, int]]]
 
-	def __init__(self, inst: Instance):
+	n_procs: int
+	cache_dir: str|None
+
+	def __init__(self, inst: Instance, n_procs=os.cpu_count(), cache_dir=CACHE_DIR):
 		self.inst = inst
+		self.n_procs = n_procs
+		self.cache_dir = cache_dir
 
 	
-	def solve(self):
+	def solve(self, group_time=float('inf')):
 		self.groups = []
 
-		for t in range(self.inst.n_trains):
-			solver = Solver(self.inst, None, free=[t])
-			solver.add_time_obj()
-			solver.solve()
-			self.groups.append(solver.get_solution())
+		for t, events in enumerate(self.solve_trains()):
+			sol = Solution()
+			sol.events = {t: events}
+			self.groups.append(sol)
 
+		self.group_set = Disjoint_set(self.inst.n_trains)
 
 		self.make_collisions()
 		self.count_collisions()
@@ -45,62 +78,202 @@ class Heuristic:
 		while self.group_col_count:
 			g1, g2 = max(self.group_col_count.keys(), key=lambda x: self.group_col_count[x])
 
-			print(self.groups[g1].events.keys(), self.groups[g1].events.keys())
+			print(f'merging {list(self.groups[g1].events.keys())} {list(self.groups[g2].events.keys())}, '
+				f'collisions {self.group_col_count[g1, g2]}')
+
+			if not self.merge_groups(g1, g2, group_time):
+				print('merged group infeasible')
+				return False
+
+		return True
+
+
+	@prof.timed()
+	def merge_groups(self, g1: int, g2: int, max_time=float('inf')) -> bool:
+		self.group_set.union_set(g1, g2)
+		g = self.group_set.find_set(g1)
+
+		sol = Solution()
+		sol.events = self.groups[g1].events | self.groups[g2].events
+		self.groups[g1] = self.groups[g2] = None
+
+		# only the merged group is re-solved, it has to make room for the schedules of the others
+		fixed = self.get_fixed(g)
+		curr_sol = Solution()
+		curr_sol.events = sol.events | { t: self.groups[self.get_group(t)].events[t] for t in fixed }
+
+		solver = Solver(self.inst, curr_sol, free=sorted(sol.events.keys()), fixed=fixed)
+		solver.add_time_obj()
+
+		if not solver.solve(max_time):
+			# the other schedules may leave no room, then the group is solved on its own
+			solver = Solver(self.inst, sol, free=sorted(sol.events.keys()))
+			solver.add_time_obj()
+
+			if not solver.solve(max_time):
+				return False
+
+		self.groups[g] = solver.get_solution()
+		self.update_collisions(g, sol)
+
+		return True
+
+
+	def get_fixed(self, g: int) -> List[int]:
+		# groups still colliding with each other cannot all be fixed, their intervals would
+		# overlap. the trains of a collision free subset of the other groups are returned
+		fixed_groups = []
+
+		for h, sol in enumerate(self.groups):
+			if sol is None or h == g:
+				continue
+
+			if all(not (min(h, k), max(h, k)) in self.group_col_count for k in fixed_groups):
+				fixed_groups.append(h)
+
+		return sorted(t for h in fixed_groups for t in self.groups[h].events.keys())
+
+
+	@prof.timed()
+	def solve_trains(self) -> List[List[Event]]:
+		train_events = [self.load_train(t) for t in range(self.inst.n_trains)]
+		todo = [t for t, events in enumerate(train_events) if events is None]
+
+		if self.n_procs > 1 and len(todo) > 1:
+			with ProcessPoolExecutor(self.n_procs, initializer=init_worker, initargs=(self.inst,)) as pool:
+				results = list(pool.map(solve_train_worker, todo))
+		else:
+			results = [solve_train(self.inst, t) for t in todo]
+
+		for t, events in zip(todo, results):
+			train_events[t] = events
+			self.store_train(t, events)
 
-			self.group_col_count = { 
-				(x1, x2): v 
-				for (x1, x2), v 
-				in self.group_col_count.items()
-				if x1 != g1 and x2 != g1 and x1 != g2 and x2 != g2
-			}
+		return train_events
 
 
+	def get_cache_file(self, t: int) -> str:
+		return os.path.join(self.cache_dir, self.inst.base_inst.inst_hash, f'{t}.json')
+
+
+	def load_train(self, t: int) -> List[Event]|None:
+		if self.cache_dir is None:
+			return None
+
+		try:
+			with open(self.get_cache_file(t), 'r') as fd:
+				jsn = json.load(fd)
+		except FileNotFoundError:
+			return None
+
+		return [Event(Op_idx(t, o), start, end) for o, start, end in jsn]
+
+
+	def store_train(self, t: int, events: List[Event]):
+		if self.cache_dir is None:
+			return
+
+		cache_file = self.get_cache_file(t)
+		os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+		with open(cache_file + '.tmp', 'w') as fd:
+			json.dump([(e.idx.op, e.start, e.end) for e in events], fd)
+
+		os.replace(cache_file + '.tmp', cache_file)
+
+
+	def get_group(self, t: int) -> int:
+		return self.group_set.find_set(t)
+
+
+	def get_res_uses(self, events: Iterable[Event]):
+		for ev in events:
+			op = self.inst.trains[ev.idx.train].ops[ev.idx.op]
+
+			for r in op.res:
+				yield r, ev.idx, ev.start, ev.end + self.inst.res_time(r, ev.idx, 1)
+
+
+	@prof.timed()
 	def make_collisions(self):
-		events: List[Event] = []
-		self.train_to_group = {}
+		self.collisions = set()
+		self.res_uses = defaultdict(dict)
 
-		for g, sol in enumerate(self.groups):
-			for t, evs in sol.events.items():
-				self.train_to_group[t] = g
-				events.extend(evs)
+		train_events = [evs for sol in self.groups if sol for evs in sol.events.values()]
 
-		events.sort(key=lambda x: (x.start, x.end))
+		# each train is sorted already, heap merge keeps the sweep O(n log trains)
+		events = heapq.merge(*train_events, key=lambda x: (x.start, x.end))
 
-		self.collisions = []
+		# a train may hold a resource with several ops at once, it is released with the last one
+		releases = []
+		res_locks: Dict[int, Dict[int, Tuple[Op_idx, int]]] = defaultdict(dict)
 
-		prev_op: Dict[int, Op] = {}
-		res_locks = defaultdict(list)
-		
 		for ev in events:
-			t, o = ev.idx
+			while releases and releases[0][0] <= ev.start:
+				_, r, idx = heapq.heappop(releases)
 
-			train = self.inst.trains[t]
-			op = train.ops[o]
+				lock, count = res_locks[r][idx.train]
+				if count == 1:
+					del res_locks[r][idx.train]
+				else:
+					res_locks[r][idx.train] = (lock, count - 1)
 
-			prev = prev_op.get(t, None)
-			
-			if prev:
-				for r in prev.res:
-					res_locks[r].remove(prev.idx)
+			for r, idx, start, release in self.get_res_uses([ev]):
+				self.res_uses[r][idx] = (start, release)
 
-			for r in op.res:
-				self.collisions.extend(Res_col(r, other, op.idx) for other in res_locks[r])
-				res_locks[r].append(op.idx)
-			
-			prev_op[t] = op
+				for t, (other, _) in res_locks[r].items():
+					if t != idx.train:
+						self.collisions.add(Res_col(r, other, idx))
+
+				count = res_locks[r][idx.train][1] if idx.train in res_locks[r] else 0
+				res_locks[r][idx.train] = (idx, count + 1)
+				heapq.heappush(releases, (release, r, idx))
 
 
 	def count_collisions(self):
 		self.group_col_count = defaultdict(lambda: 0)
 
 		for col in self.collisions:
-			g1 = self.train_to_group[col.op1.train] 
-			g2 = self.train_to_group[col.op2.train]
+			self.add_col_count(col, 1)
+
+
+	def add_col_count(self, col: Res_col, value: int):
+		g1 = self.get_group(col.op1.train)
+		g2 = self.get_group(col.op2.train)
+
+		k = (g1, g2) if (g1 < g2) else (g2, g1)
+
+		self.group_col_count[k] += value
 
-			k = (g1, g2) if (g1 < g2) else (g2, g1)
+		if self.group_col_count[k] == 0:
+			del self.group_col_count[k]
 
-			self.group_col_count[k] += 1
 
+	@prof.timed()
+	def update_collisions(self, g: int, old_sol: Solution):
+		trains = old_sol.events.keys()
+
+		for r, idx, _, _ in self.get_res_uses(ev for evs in old_sol.events.values() for ev in evs):
+			del self.res_uses[r][idx]
+
+		# collisions of the merged groups are counted under the old roots, drop them directly
+		self.collisions = { col for col in self.collisions 
+			if not col.op1.train in trains and not col.op2.train in trains }
+
+		for k in [k for k in self.group_col_count.keys() if g in (self.get_group(k[0]), self.get_group(k[1]))]:
+			del self.group_col_count[k]
+
+		new_uses = list(self.get_res_uses(ev for evs in self.groups[g].events.values() for ev in evs))
+
+		for r, idx, start, release in new_uses:
+			self.res_uses[r][idx] = (start, release)
+
+		for r, idx, start, release in new_uses:
+			for other, (start2, release2) in self.res_uses[r].items():
+				if self.get_group(other.train) != g and start < release2 and start2 < release:
+					col = Res_col(r, other, idx)
+					self.collisions.add(col)
+					self.add_col_count(col, 1)
 
 
 if __name__ == '__main__':
@@ -110,3 +283,7 @@ if __name__ == '__main__':
 	heur = Heuristic(inst)
 
 	heur.solve()
+
+	for sol in heur.groups:
+		if sol:
+			print(list(sol.events.keys()))
@@ -0,0 +1,191 @@
+#!.venv/bin/python3
+
+import os
+import sys
+
+from dataclasses import dataclass, field
+from typing import List, Dict, Set, NamedTuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from base_inst import Base_inst, Base_obj
+import prof
+
+
+DEFAULT_DATA = 'data/nor1_critical_0.json'
+
+
+class Op_idx(NamedTuple):
+	train: int
+	op: int
+
+
+@dataclass
+class Op:
+	idx: Op_idx
+	dur: int = 0
+	start_lb: int = 0
+	start_ub: int = -1
+
+	succ: List[int] = field(default_factory=list)
+	prev: List[int] = field(default_factory=list)
+
+	# resource indices, their release times are in res_times
+	res: List[int] = field(default_factory=list)
+	res_times: Dict[int, int] = field(default_factory=dict)
+
+	obj: Base_obj|None = None
+
+	@property
+	def i(self) -> int:
+		return self.idx.op
+
+	@property
+	def n_succ(self) -> int:
+		return len(self.succ)
+
+	@property
+	def n_prev(self) -> int:
+		return len(self.prev)
+
+
+@dataclass
+class Train:
+	idx: int
+	ops: List[Op] = field(default_factory=list)
+
+	res: Set[int] = field(default_factory=set)
+	res_to_op: Dict[int, List[int]] = field(default_factory=dict)
+
+	# resources on which some path from the first to the last op does not lock
+	avoidable_res: Set[int] = field(default_factory=set)
+
+	# no schedule of the train alone takes longer
+	max_dur: int = 0
+
+	@property
+	def n_ops(self) -> int:
+		return len(self.ops)
+
+
+class Instance:
+	base_inst: Base_inst
+	trains: List[Train]
+
+	# number of trains using a resource
+	res_occur: Dict[int, int]
+
+	__res_name_idx: Dict[str, int]
+
+	def __init__(self, jsn_file: str):
+		self.base_inst = Base_inst(jsn_file)
+		self.add_trains()
+
+
+	@prof.timed()
+	def add_trains(self):
+		self.trains = []
+		self.res_occur = {}
+		self.__res_name_idx = {}
+
+		for t, base_train in enumerate(self.base_inst.trains):
+			train = Train(idx=t)
+
+			for o, base_op in enumerate(base_train.ops):
+				op = Op(
+					idx		=Op_idx(t, o),
+					dur		=base_op.dur,
+					start_lb=base_op.start_lb,
+					start_ub=base_op.start_ub,
+					succ	=list(base_op.succ)
+				)
+
+				for base_res in base_op.res:
+					r = self.res_idx(base_res.name)
+					op.res.append(r)
+					op.res_times[r] = base_res.time
+					train.res_to_op.setdefault(r, []).append(o)
+
+				train.ops.append(op)
+
+			for op in train.ops:
+				for s in op.succ:
+					train.ops[s].prev.append(op.i)
+
+			train.res = set(train.res_to_op.keys())
+			train.avoidable_res = { r for r in train.res if self.is_avoidable(train, r) }
+
+			# every op on the train one after the other, each holding its resources
+			train.max_dur = max(op.start_lb for op in train.ops) + sum(op.dur + max(op.res_times.values(), default=0) + 1 for op in train.ops)
+
+			for r in train.res:
+				self.res_occur[r] = self.res_occur.get(r, 0) + 1
+
+			self.trains.append(train)
+
+		# ops without a latest start may start until the last train is done
+		horizon = sum(train.max_dur for train in self.trains)
+
+		for train in self.trains:
+			for op in train.ops:
+				if op.start_ub == -1:
+					op.start_ub = horizon
+
+		for base_obj in self.base_inst.objs:
+			self.trains[base_obj.train].ops[base_obj.op].obj = base_obj
+
+
+	def is_avoidable(self, train: Train, r: int) -> bool:
+		# the first op has no predecessor and the last op no successor
+		stack = [0] if not r in train.ops[0].res else []
+		seen = set(stack)
+
+		while stack:
+			op = train.ops[stack.pop()]
+
+			if op.n_succ == 0:
+				return True
+
+			for s in op.succ:
+				if not s in seen and not r in train.ops[s].res:
+					seen.add(s)
+					stack.append(s)
+
+		return False
+
+
+	def res_idx(self, name: str) -> int:
+		return self.__res_name_idx.setdefault(name, len(self.__res_name_idx))
+
+
+	def op(self, idx: Op_idx) -> Op:
+		return self.trains[idx.train].ops[idx.op]
+
+
+	def res_time(self, r: int, idx: Op_idx, min_time: int = 0) -> int:
+		# the models release at least one second after the end, so two trains never swap
+		# resources at the same instant
+		return max(self.op(idx).res_times[r], min_time)
+
+
+	@property
+	def n_trains(self):
+		return len(self.trains)
+
+
+	@property
+	def n_ops(self):
+		return sum(train.n_ops for train in self.trains)
+
+
+	@property
+	def n_res(self):
+		return len(self.__res_name_idx)
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	print(data)
+	inst = Instance(data)
+
+	for train in inst.trains:
+		print(f'train {train.idx}: {train.n_ops} ops, {len(train.res)} resources, {len(train.avoidable_res)} avoidable, max dur {train.max_dur}')
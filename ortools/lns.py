@@ -0,0 +1,349 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import time
+import random
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Set, Tuple
+from enum import Enum
+
+from solver import Event, Solution, Solver, Persistent_solver, Obj_type, get_obj, get_res_intervals
+from instance import Instance
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
+
+
+DEFAULT_DATA = 'data/nor1_critical_0.json'
+
+
+class Nbhd_type(Enum):
+	CONFLICT = 0
+	WINDOW = 1
+	RANDOM = 2
+
+
+def solve_nbhd(inst: Instance, sol: Solution, free: List[int], max_time: float, num_workers=8, 
+		persistent_solver: Persistent_solver|None = None, obj_type: Obj_type = Obj_type.TIME):
+	if persistent_solver is None:
+		fixed = [t for t in range(inst.n_trains) if not t in free]
+
+		solver = Solver(inst, sol, free=free, fixed=fixed)
+		solver.add_obj(obj_type)
+	else:
+		solver = persistent_solver
+		solver.set_nbhd(sol, free)
+
+	if not solver.solve(max_time, num_workers):
+		return None, solver.is_optimal()
+
+	return solver.get_solution().events, solver.is_optimal()
+
+
+worker_inst: Instance = None
+worker_solver: Persistent_solver|None = None
+worker_obj_type: Obj_type = Obj_type.TIME
+
+def init_worker(inst: Instance, persistent: bool, obj_type: Obj_type):
+	global worker_inst, worker_solver, worker_obj_type
+	worker_inst = inst
+	worker_solver = Persistent_solver(inst, obj_type) if persistent else None
+	worker_obj_type = obj_type
+
+
+def solve_nbhd_worker(sol: Solution, free: List[int], max_time: float, num_workers: int):
+	return solve_nbhd(worker_inst, sol, free, max_time, num_workers, worker_solver, worker_obj_type)
+
+
+class Lns:
+	inst: Instance
+	rng: random.Random
+
+	best_sol: Solution
+	best_obj: int
+
+	sub_time: float
+	min_size: int
+	max_size: int
+	size: Dict[Nbhd_type, float]
+
+	res_intervals: Dict[int, List[Tuple[int, int, int]]]
+	train_conflicts: Dict[int, Dict[int, int]]
+
+	obj_type: Obj_type
+	persistent: bool
+	persistent_solver: Persistent_solver|None
+
+	def __init__(self, inst, init_sol = None, seed = 0, sub_time = 2.0, init_size = 4, min_size = 2, max_size = 50,
+			persistent = False, obj_type = Obj_type.TIME):
+		self.inst = inst
+		self.rng = random.Random(seed)
+		self.obj_type = obj_type
+
+		self.persistent = persistent
+		self.persistent_solver = Persistent_solver(inst, obj_type) if persistent else None
+
+		self.sub_time = sub_time
+		self.min_size = min(min_size, inst.n_trains)
+		self.max_size = min(max_size, inst.n_trains)
+		self.size = { nt: float(init_size) for nt in Nbhd_type }
+
+		if init_sol is None:
+			init_sol = self.make_init_sol()
+
+		self.set_incumbent(init_sol)
+
+
+	def solve(self, max_time=60.0, max_iters=-1):
+		time_start = time.time()
+		nbhd_types = list(Nbhd_type)
+
+		it = 0
+
+		while time.time() - time_start < max_time:
+			if max_iters >= 0 and it >= max_iters:
+				break
+
+			nbhd_type = nbhd_types[it % len(nbhd_types)]
+			it += 1
+
+			size = self.get_size(nbhd_type)
+			free = self.select_nbhd(nbhd_type, size)
+
+			sub_time = min(self.sub_time, max_time - (time.time() - time_start))
+			sol, is_optimal = self.solve_nbhd(free, sub_time)
+			prof.count(f'lns_{nbhd_type.name.lower()}')
+
+			self.update_size(nbhd_type, is_optimal)
+
+			if sol is None:
+				continue
+
+			obj = get_obj(self.inst, sol, self.obj_type)
+
+			if obj < self.best_obj:
+				print(f'it {it} {nbhd_type.name.lower()} size {size}: {self.best_obj} -> {obj}')
+				self.set_incumbent(sol)
+
+		return self.best_sol
+
+
+	@prof.timed()
+	def make_init_sol(self) -> Solution:
+		sol = Solution()
+		sol.events = {}
+
+		order = sorted(range(self.inst.n_trains), key=lambda t: self.inst.trains[t].ops[0].start_lb)
+		done = []
+
+		for t in order:
+			solver = Solver(self.inst, sol, free=[t], fixed=list(done))
+			solver.add_obj(self.obj_type)
+
+			if not solver.solve(self.sub_time):
+				raise RuntimeError(f'initial insertion of train {t} failed')
+
+			sol.events[t] = solver.get_solution().events[t]
+			done.append(t)
+
+		return sol
+
+
+	def set_incumbent(self, sol: Solution):
+		self.best_sol = sol
+		self.best_obj = get_obj(self.inst, sol, self.obj_type)
+
+		self.make_res_intervals()
+		self.make_train_conflicts()
+
+
+	def make_res_intervals(self):
+		self.res_intervals = defaultdict(list)
+
+		for t, events in self.best_sol.events.items():
+			for r, (lock, unlock) in get_res_intervals(self.inst, events).items():
+				self.res_intervals[r].append((lock, unlock, t))
+
+		for intervals in self.res_intervals.values():
+			intervals.sort()
+
+
+	def make_train_conflicts(self):
+		# consecutive users of a resource block each other in the incumbent
+		self.train_conflicts = defaultdict(lambda: defaultdict(int))
+
+		for intervals in self.res_intervals.values():
+			for (_, _, t1), (_, _, t2) in zip(intervals, intervals[1:]):
+				if t1 != t2:
+					self.train_conflicts[t1][t2] += 1
+					self.train_conflicts[t2][t1] += 1
+
+
+	def get_size(self, nbhd_type: Nbhd_type) -> int:
+		return max(self.min_size, min(self.max_size, round(self.size[nbhd_type])))
+
+
+	def update_size(self, nbhd_type: Nbhd_type, is_optimal: bool):
+		if is_optimal:
+			self.size[nbhd_type] = min(self.max_size, self.size[nbhd_type]*1.2)
+		else:
+			self.size[nbhd_type] = max(self.min_size, self.size[nbhd_type]*0.8)
+
+
+	def select_nbhd(self, nbhd_type: Nbhd_type, size: int) -> List[int]:
+		if nbhd_type == Nbhd_type.CONFLICT:
+			return self.select_conflict_nbhd(size)
+
+		if nbhd_type == Nbhd_type.WINDOW:
+			return self.select_window_nbhd(size)
+
+		return self.select_random_nbhd(size)
+
+
+	def select_conflict_nbhd(self, size: int) -> List[int]:
+		seed = self.rng.randrange(self.inst.n_trains)
+
+		nbhd = [seed]
+		score = defaultdict(int)
+
+		while len(nbhd) < size:
+			for t, v in self.train_conflicts[nbhd[-1]].items():
+				if not t in nbhd:
+					score[t] += v
+
+			if not score:
+				break
+
+			t = max(score.keys(), key=lambda x: (score[x], self.rng.random()))
+			del score[t]
+			nbhd.append(t)
+
+		return nbhd + self.select_random_nbhd(size - len(nbhd), exclude=nbhd)
+
+
+	def select_window_nbhd(self, size: int) -> List[int]:
+		order = sorted(self.best_sol.events.keys(), key=lambda t: self.best_sol.events[t][0].start)
+
+		first = self.rng.randrange(max(1, len(order) - size + 1))
+
+		return order[first:first + size]
+
+
+	def select_random_nbhd(self, size: int, exclude: List[int] = []) -> List[int]:
+		trains = [t for t in range(self.inst.n_trains) if not t in exclude]
+
+		return self.rng.sample(trains, min(size, len(trains)))
+
+
+	def solve_nbhd(self, free: List[int], max_time: float) -> Tuple[Solution|None, bool]:
+		events, is_optimal = solve_nbhd(self.inst, self.best_sol, free, max_time, 
+			persistent_solver=self.persistent_solver, obj_type=self.obj_type)
+
+		if events is None:
+			return None, is_optimal
+
+		sol = Solution()
+		sol.events = self.best_sol.events | events
+
+		return sol, is_optimal
+
+
+	def solve_parallel(self, max_time=60.0, n_procs=4, num_workers=2):
+		time_start = time.time()
+		nbhd_types = list(Nbhd_type)
+
+		running = {}
+		busy = set()
+
+		it = 0
+
+		with ProcessPoolExecutor(n_procs, initializer=init_worker, initargs=(self.inst, self.persistent, self.obj_type)) as pool:
+			while True:
+				time_left = max_time - (time.time() - time_start)
+
+				while time_left > 0 and len(running) < n_procs:
+					nbhd_type = nbhd_types[it % len(nbhd_types)]
+					it += 1
+
+					free = self.select_free_nbhd(nbhd_type, self.get_size(nbhd_type), busy)
+					if not free:
+						break
+
+					future = pool.submit(solve_nbhd_worker, self.best_sol, free, 
+						min(self.sub_time, time_left), num_workers)
+
+					running[future] = (it, nbhd_type, free)
+					busy.update(free)
+
+				if not running:
+					break
+
+				done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+				for future in done:
+					it_nbhd, nbhd_type, free = running.pop(future)
+					busy.difference_update(free)
+
+					events, is_optimal = future.result()
+					self.update_size(nbhd_type, is_optimal)
+
+					if events is None:
+						continue
+
+					self.merge_nbhd(it_nbhd, nbhd_type, events)
+
+		return self.best_sol
+
+
+	def select_free_nbhd(self, nbhd_type: Nbhd_type, size: int, busy: Set[int]) -> List[int]:
+		free = [t for t in self.select_nbhd(nbhd_type, size) if not t in busy]
+
+		if len(free) < min(size, self.min_size):
+			free += self.select_random_nbhd(size - len(free), exclude=busy | set(free))
+
+		return free
+
+
+	@prof.timed()
+	def merge_nbhd(self, it: int, nbhd_type: Nbhd_type, events: Dict[int, List[Event]]) -> bool:
+		# the sub-problem was solved against an older incumbent, so the new
+		# positions have to be checked against the current one before merging
+		curr_obj = get_obj(self.inst, Solution({ t: self.best_sol.events[t] for t in events.keys() }), self.obj_type)
+		new_obj = get_obj(self.inst, Solution(events), self.obj_type)
+
+		if new_obj >= curr_obj:
+			return False
+
+		for t, evs in events.items():
+			for r, (lock, unlock) in get_res_intervals(self.inst, evs).items():
+				for lock2, unlock2, t2 in self.res_intervals.get(r, []):
+					if not t2 in events and lock < unlock2 and lock2 < unlock:
+						return False
+
+		sol = Solution()
+		sol.events = self.best_sol.events | events
+
+		print(f'it {it} {nbhd_type.name.lower()} size {len(events)}: {self.best_obj} -> {self.best_obj - curr_obj + new_obj}')
+		self.set_incumbent(sol)
+
+		return True
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	max_time = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+	n_procs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+	print(data)
+	inst = Instance(data)
+	lns = Lns(inst, obj_type=Obj_type.DELAY)
+
+	print(f'init: {lns.best_obj}')
+
+	if n_procs > 1:
+		lns.solve_parallel(max_time, n_procs)
+	else:
+		lns.solve(max_time)
+
+	print(f'best: {lns.best_obj}')
@@ -0,0 +1,209 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import time
+import random
+
+from typing import List, Dict, Set
+
+from ortools.sat.python import cp_model as cp
+
+from lns import Lns
+from solver import Event, Solution, Persistent_solver, Obj_type, get_obj, get_res_intervals
+from instance import Instance, Op_idx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
+
+
+DEFAULT_DATA = 'data/nor1_critical_0.json'
+
+
+class Redispatcher(Persistent_solver):
+	sol: Solution
+	now: int
+	start_lb: Dict[Op_idx, int]
+
+	max_time: float
+	num_workers: int
+	depth: int
+
+	def __init__(self, inst, sol: Solution, obj_type = Obj_type.DELAY, max_time = 1.0, num_workers = 8, depth = 1):
+		# the model over every train is built once, updates only change domains and assumptions
+		super().__init__(inst, obj_type)
+
+		self.now = 0
+		self.start_lb = {}
+
+		self.max_time = max_time
+		self.num_workers = num_workers
+		self.depth = depth
+		self.sol = sol
+
+
+	@prof.timed()
+	def update(self, now: int, start_lb: Dict[Op_idx, int]) -> Solution|None:
+		# everything started before now has been executed, start_lb holds the new earliest
+		# starts of single ops, a late train only frees the trains it now runs into
+		self.now = now
+		self.start_lb.update(start_lb)
+
+		free = self.get_affected({ idx.train for idx in start_lb.keys() })
+
+		if self.solve_free(free, self.max_time):
+			return self.sol
+
+		# the local re-solve failed, so every train still running is freed
+		free = [t for t, events in self.sol.events.items() if events[-1].end > now]
+		print(f'redispatch of {len(free)} trains')
+
+		if self.solve_free(free, 10*self.max_time):
+			return self.sol
+
+		return None
+
+
+	def get_past(self, t: int) -> List[Event]:
+		# a delay reported on an executed op makes the rest of the record stale
+		past = []
+
+		for e in self.sol.events[t]:
+			if e.start >= self.now or self.start_lb.get(e.idx, e.start) > e.start:
+				break
+
+			past.append(e)
+
+		return past
+
+
+	def get_projection(self, t: int) -> List[Event]:
+		# the schedule of a late train if it just ran later on the same path
+		events = []
+		shift = 0
+
+		for e in self.sol.events[t]:
+			shift = max(shift, self.start_lb.get(e.idx, e.start) - e.start)
+			events.append(Event(e.idx, e.start + shift, e.end + shift))
+
+		return events
+
+
+	def get_affected(self, late: Set[int]) -> List[int]:
+		affected = set(late)
+		intervals = { t: get_res_intervals(self.inst, self.get_projection(t)) for t in late }
+		others = {
+			t: get_res_intervals(self.inst, events)
+			for t, events in self.sol.events.items() if not t in late and events[-1].end > self.now
+		}
+
+		for k in range(self.depth):
+			new = set()
+
+			for t, t_intervals in others.items():
+				if t in affected:
+					continue
+
+				for r, (lock, unlock) in t_intervals.items():
+					if any(r in iv and iv[r][0] < unlock and lock < iv[r][1] for iv in intervals.values()):
+						new.add(t)
+						break
+
+			affected |= new
+			intervals = { t: others[t] for t in new }
+
+		return sorted(affected)
+
+
+	@prof.timed()
+	def solve_free(self, free: List[int], max_time: float) -> bool:
+		self.set_nbhd(self.sol, free)
+
+		for t in free:
+			self.fix_past(t)
+
+		if not self.solve(max_time, self.num_workers):
+			return False
+
+		sol = Solution()
+		sol.events = self.sol.events | self.get_solution().events
+		self.sol = sol
+
+		return True
+
+
+	def fix_past(self, t: int):
+		train = self.inst.trains[t]
+		past = self.get_past(t)
+
+		self.model.add_assumptions(self.var_op_used[e.idx] for e in past)
+
+		# an op is over once the next one has started, the last started op runs until at
+		# least now unless it ends the train
+		for k, e in enumerate(past):
+			self.tighten(self.var_op_start[e.idx], e.start)
+
+			if k + 1 < len(past) or train.ops[e.idx.op].n_succ == 0:
+				self.tighten(self.var_op_end[e.idx], e.end)
+			else:
+				self.tighten_lb(self.var_op_end[e.idx], self.now)
+
+		# nothing else of the train can start before now or before its reported start
+		done = { e.idx for e in past }
+
+		for op in train.ops:
+			if not op.idx in done and not self.tighten_lb(self.var_op_start[op.idx], max(self.now, self.start_lb.get(op.idx, 0))):
+				self.model.add_assumption(self.var_op_used[op.idx].Not())
+
+
+	def tighten_lb(self, var: cp.IntVar, lb: int) -> bool:
+		if not var.index in self.domains:
+			self.domains[var.index] = var.domain
+
+		domain = self.domains[var.index]
+
+		if lb > domain.max():
+			return False
+
+		var.with_domain(domain.intersection_with(cp.Domain(lb, domain.max())))
+		self.tight_vars.append(var)
+
+		return True
+
+
+def simulate(rd: Redispatcher, n_updates: int, max_delay: int, seed = 0):
+	# random delays on the future of trains still running, time moves forward between them
+	rng = random.Random(seed)
+	starts = sorted(e.start for events in rd.sol.events.values() for e in events)
+	nows = sorted(rng.choice(starts) for _ in range(n_updates))
+
+	for now in nows:
+		running = [t for t, events in rd.sol.events.items() if any(e.start >= now for e in events)]
+		if not running:
+			continue
+
+		t = rng.choice(running)
+		e = rng.choice([e for e in rd.sol.events[t] if e.start >= now])
+		delay = rng.randint(1, max_delay)
+
+		time_start = time.time()
+		sol = rd.update(now, { e.idx: e.start + delay })
+
+		if sol is None:
+			print(f'{now}: train {t} op {e.idx.op} +{delay}s: no schedule')
+			return
+
+		print(f'{now}: train {t} op {e.idx.op} +{delay}s: obj {get_obj(rd.inst, sol, Obj_type.DELAY)}, '
+			f'{len(rd.free)} trains, {1000*(time.time() - time_start):.0f}ms')
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	n_updates = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+	max_delay = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+	print(data)
+	inst = Instance(data)
+
+	lns = Lns(inst, obj_type=Obj_type.DELAY)
+	print(f'init: {lns.best_obj}')
+
+	simulate(Redispatcher(inst, lns.best_sol), n_updates, max_delay)
@@ -1,15 +1,23 @@
 #!.venv/bin/python3
 
+import os
 import sys
+import json
+import time
+import threading
 
 from dataclasses import dataclass, field
 from collections import defaultdict
-from typing import List, Dict, NamedTuple
+from typing import List, Dict, Tuple
 from enum import Enum
+from queue import Queue
 
 from ortools.sat.python import cp_model as cp
 
-from instance import Instance, Op, Op_idx
+from instance import Instance, Op_idx
+# the shared modules are in the repo root, also when a script here is run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
 
 
 DEFAULT_DATA = 'data/nor1_critical_0.json'
@@ -29,6 +37,110 @@ class Event:
 class Solution:
 	events: Dict[int, List[Event]] = field(default_factory=lambda: defaultdict(list))
 
+	def get_jsn_events(self) -> List[dict]:
+		jsn_events = [
+			{ 'train': e.idx.train, 'operation': e.idx.op, 'time': e.start }
+			for events in self.events.values() for e in events
+		]
+
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
+@dataclass
+class Incumbent:
+	sol: Solution
+	obj: float
+	bound: float
+	time: float
+
+
+def get_res_intervals(inst: Instance, events: List[Event]) -> Dict[int, Tuple[int, int]]:
+	intervals = {}
+
+	for e in events:
+		op = inst.trains[e.idx.train].ops[e.idx.op]
+
+		for r in op.res:
+			unlock = e.end + inst.res_time(r, e.idx, 1)
+
+			if r in intervals:
+				lock, prev_unlock = intervals[r]
+				intervals[r] = (min(lock, e.start), max(prev_unlock, unlock))
+			else:
+				intervals[r] = (e.start, unlock)
+
+	return intervals
+
+
+def make_solution(inst: Instance, jsn_events: List[dict]) -> Solution:
+	sol = Solution()
+	sol.events = {}
+
+	topo_pos = {}
+
+	for ev in jsn_events:
+		t = ev['train']
+
+		if not t in sol.events:
+			sol.events[t] = []
+			topo_pos[t] = { o: k for k, o in enumerate(get_topo_order(inst.trains[t])) }
+
+		sol.events[t].append(Event(Op_idx(t, ev['operation']), ev['time'], ev['time']))
+
+	for t, events in sol.events.items():
+		events.sort(key=lambda x: (x.start, topo_pos[t][x.idx.op]))
+
+		for e1, e2 in zip(events, events[1:]):
+			e1.end = e2.start
+
+		events[-1].end = events[-1].start + inst.trains[t].ops[events[-1].idx.op].dur
+
+	return sol
+
+
+def get_topo_order(train) -> List[int]:
+	n_prev = [op.n_prev for op in train.ops]
+	order = [op.i for op in train.ops if op.n_prev == 0]
+
+	for i in order:
+		for s in train.ops[i].succ:
+			n_prev[s] -= 1
+			if n_prev[s] == 0:
+				order.append(s)
+
+	return order
+
+
+def get_delay_obj(inst: Instance, events: List[Event]) -> int:
+	obj = 0
+
+	for e in events:
+		op = inst.trains[e.idx.train].ops[e.idx.op]
+
+		if op.obj is None or e.start <= op.obj.threshold:
+			continue
+
+		obj += op.obj.coeff*(e.start - op.obj.threshold) + op.obj.increment
+
+	return obj
+
+
+def get_time_obj(inst: Instance, events: List[Event]) -> int:
+	return events[-1].start
+
+
+class Obj_type(Enum):
+	TIME = 0
+	DELAY = 1
+
+
+def get_obj(inst: Instance, sol: Solution, obj_type: Obj_type = Obj_type.TIME) -> int:
+	obj_func = get_delay_obj if obj_type == Obj_type.DELAY else get_time_obj
+
+	return sum(obj_func(inst, events) for events in sol.events.values())
+
 
 class Train_type(Enum):
 	FREE = 0
@@ -48,10 +160,14 @@ class Solver:
 
 	max_dur: int
 	res_used: Dict[int, List[int]]
+	fixed_res: Dict[Tuple[int, int], Tuple[int, int]]
 
 	model: cp.CpModel
 	solver: cp.CpSolver
+	status: int
+	incumbents: List[Incumbent]
 
+	@prof.timed()
 	def __init__(self, inst, curr_sol = None, free = [], semi = [], fixed = []):
 		self.inst = inst
 		self.curr_sol = curr_sol
@@ -80,19 +196,103 @@ class Solver:
 		self.add_hint()
 
 
-	def solve(self, max_time=float('inf')):
-		self.solver.parameters.num_workers = 8
+	@prof.timed()
+	def solve(self, max_time=float('inf'), num_workers=8, callback=None):
+		self.solver.parameters.num_workers = num_workers
 		self.solver.parameters.max_time_in_seconds = max_time
 
-		status = self.solver.Solve(self.model)
+		self.status = self.solver.Solve(self.model, callback)
 
-		if status == cp.INFEASIBLE:
-			return False
-		
-		return True
+		return self.status in (cp.OPTIMAL, cp.FEASIBLE)
+
+
+	def solve_stream(self, max_time=float('inf'), num_workers=8, queue=None, out_file=None, stop_obj=None, client=None):
+		callback = Solution_callback(self, queue, out_file, stop_obj, client)
+
+		try:
+			rv = self.solve(max_time, num_workers, callback)
+		finally:
+			callback.close()
+
+		self.incumbents = callback.incumbents
+
+		return rv
+
+
+	def solve_client(self, client, max_time=float('inf'), num_workers=8, round_time=5.0) -> float|None:
+		time_start = time.time()
+
+		done = threading.Event()
+		stopper = threading.Thread(target=self.stop_on_client, args=(client, done), daemon=True)
+		stopper.start()
+
+		try:
+			bound = self.solve_rounds(client, max_time, num_workers, round_time, time_start)
+		finally:
+			done.set()
+			stopper.join()
+
+		return bound
+
+
+	def solve_rounds(self, client, max_time, num_workers, round_time, time_start) -> float|None:
+		# hints are read once per solve, so the budget is split into growing rounds
+		# and every round starts from the best solution known to the portfolio
+		best_obj = float('inf')
+		bound = None
+
+		while not client.is_stopped():
+			time_left = max_time - (time.time() - time_start)
+			if time_left <= 0:
+				break
+
+			start = client.get_start()
+			if start is not None and start[0] < best_obj:
+				best_obj = start[0]
+				self.set_hint(make_solution(self.inst, start[1]))
+
+			self.solve_stream(min(round_time, time_left), num_workers, client=client)
+
+			if self.status in (cp.OPTIMAL, cp.FEASIBLE):
+				bound = self.solver.best_objective_bound
+
+				if self.solver.objective_value < best_obj:
+					best_obj = self.solver.objective_value
+					self.set_hint(self.get_solution())
+
+			if self.status in (cp.OPTIMAL, cp.INFEASIBLE, cp.MODEL_INVALID):
+				break
+
+			round_time *= 2
 
+		return bound
+
+
+	def set_hint(self, sol: Solution):
+		self.curr_sol = sol
+		self.model.clear_hints()
+		self.add_hint()
+
+
+	def stop_on_client(self, client, done):
+		# a process that exits while waiting on the portfolio's event leaves it counted as a
+		# sleeper and the portfolio then blocks in set(), so the wait ends with the solve
+		while not client.wait_stopped(0.1):
+			if done.is_set():
+				return
+
+		self.solver.stop_search()
+
+
+	def is_optimal(self):
+		return self.status == cp.OPTIMAL
+
+
+	def get_solution(self, values=None) -> Solution:
+		# values is anything with a value() method, the solver or a solution callback
+		if values is None:
+			values = self.solver
 
-	def get_solution(self) -> Solution:
 		sol = Solution()
 		sol.events = {}
 
@@ -102,9 +302,9 @@ class Solver:
 			train = self.inst.trains[t]
 
 			for op in train.ops:
-				if round(self.solver.value(self.var_op_used[op.idx])) == 1:
-					start = round(self.solver.value(self.var_op_start[op.idx]))
-					end = round(self.solver.value(self.var_op_end[op.idx]))
+				if round(values.value(self.var_op_used[op.idx])) == 1:
+					start = round(values.value(self.var_op_start[op.idx]))
+					end = round(values.value(self.var_op_end[op.idx]))
 					events.append(Event(op.idx, start, end))
 			
 			sol.events[t] = events
@@ -120,18 +320,52 @@ class Solver:
 
 		for t in self.free:
 			train = self.inst.trains[t]
+			start_lb, start_ub, end_ub = self.get_time_windows(t)
 
 			for op in train.ops:
 				self.var_op_used[op.idx] 	= self.model.NewBoolVar(name=f'used_{t}_{op.i}')
-				self.var_op_start[op.idx] 	= self.model.NewIntVar(name=f'start_{t}_{op.i}', lb=op.start_lb, ub=op.start_ub)
-				self.var_op_end[op.idx] 	= self.model.NewIntVar(name=f'end_{t}_{op.i}', lb=op.start_lb + op.dur, ub=self.max_dur)
+
+				if start_lb[op.i] <= start_ub[op.i]:
+					self.var_op_start[op.idx] 	= self.model.NewIntVar(name=f'start_{t}_{op.i}', lb=start_lb[op.i], ub=start_ub[op.i])
+					self.var_op_end[op.idx] 	= self.model.NewIntVar(name=f'end_{t}_{op.i}', lb=start_lb[op.i] + op.dur, ub=end_ub[op.i])
+				else:
+					# the op cannot be reached within its time window
+					self.var_op_start[op.idx] 	= self.model.NewIntVar(name=f'start_{t}_{op.i}', lb=op.start_lb, ub=op.start_ub)
+					self.var_op_end[op.idx] 	= self.model.NewIntVar(name=f'end_{t}_{op.i}', lb=op.start_lb + op.dur, ub=self.max_dur)
+					self.model.add(self.var_op_used[op.idx] == 0)
 
 				for s in op.succ:
 					self.var_op_path[t, op.i, s] = self.model.NewBoolVar(name=f'path_{t}_{op.i}_{s}')
 
 
+	def get_time_windows(self, t: int) -> Tuple[List[int], List[int], List[int]]:
+		train = self.inst.trains[t]
+		order = get_topo_order(train)
+
+		start_lb = [op.start_lb for op in train.ops]
+		start_ub = [min(op.start_ub, self.max_dur - op.dur) for op in train.ops]
+
+		for i in order:
+			op = train.ops[i]
+			if op.n_prev > 0:
+				start_lb[i] = max(start_lb[i], min(start_lb[p] + train.ops[p].dur for p in op.prev))
+
+		for i in reversed(order):
+			op = train.ops[i]
+			if op.n_succ > 0:
+				start_ub[i] = min(start_ub[i], max(start_ub[s] for s in op.succ) - op.dur)
+
+		end_ub = [
+			max(start_ub[s] for s in op.succ) if op.n_succ > 0 else start_ub[op.i] + op.dur
+			for op in train.ops
+		]
+
+		return start_lb, start_ub, end_ub
+
+
 	def create_res_used(self):
 		self.res_used = defaultdict(set)
+		self.fixed_res = {}
 
 		for t in self.free:
 			train = self.inst.trains[t]
@@ -140,6 +374,23 @@ class Solver:
 				for r in op.res:
 					self.res_used[r].add(t)
 
+		if self.curr_sol is None:
+			return
+
+		# fixed and semi trains only block resources with constant intervals
+		for t in self.semi + self.fixed:
+			if not t in self.curr_sol.events:
+				continue
+
+			for r, interval in get_res_intervals(self.inst, self.curr_sol.events[t]).items():
+				if r in self.res_used:
+					self.res_used[r].add(t)
+					self.fixed_res[r, t] = interval
+
+
+	def is_res_contended(self, r: int) -> bool:
+		return len(self.res_used[r]) > 1
+
 
 	def create_res_vars(self):
 		self.var_res_lock 	= {}
@@ -148,6 +399,9 @@ class Solver:
 		self.var_res_used	= {}
 
 		for r, trains in self.res_used.items():
+			if not self.is_res_contended(r):
+				continue
+
 			for t in trains:
 				if self.train_type[t] == Train_type.FREE:
 					self.var_res_lock[r, t] 	= self.model.NewIntVar(lb=0, ub=self.max_dur, name=f'lock_{r}_{t}')
@@ -158,6 +412,19 @@ class Solver:
 						self.var_res_used[r, t] = self.model.NewBoolVar(name=f'res_used_{r}_{t}')
 
 
+	def get_var_res_used(self, r: int, t: int):
+		# uncontended resources have no interval, their usage literal is created on demand
+		if not (r, t) in self.var_res_used:
+			self.var_res_used[r, t] = self.model.NewBoolVar(name=f'res_used_{r}_{t}')
+
+			train = self.inst.trains[t]
+			self.model.add(
+				sum(self.var_op_used[train.ops[i].idx] for i in train.res_to_op[r]) == 0
+			).OnlyEnforceIf(self.var_res_used[r, t].Not())
+
+		return self.var_res_used[r, t]
+
+
 	def add_path_cons(self):
 		for t in self.free:
 			train = self.inst.trains[t]
@@ -198,7 +465,7 @@ class Solver:
 	def add_res_interval_cons(self):
 
 		for r, trains in self.res_used.items():
-			if len(trains) == 1:
+			if not self.is_res_contended(r):
 				continue
 
 			interval_vars = []
@@ -235,6 +502,13 @@ class Solver:
 							size	=self.var_res_size[r, t], 
 							end		=self.var_res_unlock[r, t],
 							name	=f'interval_{r}_{t}'))
+
+				else:
+					lock, unlock = self.fixed_res[r, t]
+					interval_vars.append(self.model.NewFixedSizeIntervalVar(
+						start	=lock,
+						size	=unlock - lock,
+						name	=f'interval_{r}_{t}'))
 				
 				
 			self.model.AddNoOverlap(interval_vars)
@@ -257,7 +531,7 @@ class Solver:
 					self.model.add_hint(self.var_op_path[t, prev, curr], 1)
 				prev = curr
 
-		for t in self.free + self.semi:
+		for t in self.free:
 			if not t in self.curr_sol.events:
 				continue
 
@@ -268,15 +542,65 @@ class Solver:
 
 	def add_res_obj(self):
 		self.model.minimize(sum(sum(
-			self.inst.res_occur[r]*self.var_res_used[r, t]
+			self.inst.res_occur[r]*self.get_var_res_used(r, t)
 			for r in self.inst.trains[t].avoidable_res)
 			for t in self.free))
 		
 
 	def add_time_obj(self):
-		self.model.minimize(sum(
+		semi_obj = sum(self.curr_sol.events[t][-1].start for t in self.semi) if self.semi else 0
+
+		self.model.minimize(semi_obj + sum(
 			self.var_op_start[self.inst.trains[t].ops[-1].idx] 
-			for t in self.free + self.semi))
+			for t in self.free))
+
+
+	def add_delay_obj(self):
+		self.var_obj_delay = {}
+		self.var_obj_late = {}
+
+		terms = []
+
+		for t in self.free:
+			for op in self.inst.trains[t].ops:
+				if op.obj is None:
+					continue
+
+				start = self.var_op_start[op.idx]
+				used = self.var_op_used[op.idx]
+				threshold = op.obj.threshold
+
+				if start.domain.max() <= threshold:
+					continue
+
+				if op.obj.coeff > 0:
+					delay = self.model.NewIntVar(lb=0, ub=start.domain.max() - threshold, name=f'delay_{t}_{op.i}')
+					self.model.add(delay >= start - threshold).OnlyEnforceIf(used)
+
+					self.var_obj_delay[op.idx] = delay
+					terms.append(op.obj.coeff*delay)
+
+				if op.obj.increment > 0:
+					if start.domain.min() > threshold:
+						terms.append(op.obj.increment*used)
+						continue
+
+					late = self.model.NewBoolVar(name=f'late_{t}_{op.i}')
+					self.model.add(start <= threshold).OnlyEnforceIf([used, late.Not()])
+
+					self.var_obj_late[op.idx] = late
+					terms.append(op.obj.increment*late)
+
+		semi_obj = sum(get_delay_obj(self.inst, self.curr_sol.events[t]) for t in self.semi) if self.semi else 0
+
+		self.model.minimize(semi_obj + sum(terms))
+
+
+	def add_obj(self, obj_type: Obj_type):
+		if obj_type == Obj_type.DELAY:
+			self.add_delay_obj()
+		else:
+			self.add_time_obj()
 
 
 	def fix_path(self):
@@ -288,17 +612,142 @@ class Solver:
 					self.model.add(self.var_op_used[op.idx] == 1)
 
 
+class Solution_callback(cp.CpSolverSolutionCallback):
+	solver: Solver
+	incumbents: List[Incumbent]
+
+	def __init__(self, solver: Solver, queue=None, out_file=None, stop_obj=None, client=None):
+		super().__init__()
+		self.solver = solver
+		self.queue = queue
+		self.client = client
+		self.stop_obj = stop_obj
+		self.incumbents = []
+
+		self.fd = open(out_file, 'a') if out_file else None
+		self.time_start = time.time()
+
+
+	def on_solution_callback(self):
+		prof.count('cpsat_solutions')
+
+		inc = Incumbent(
+			sol		=self.solver.get_solution(self),
+			obj		=self.objective_value,
+			bound	=self.best_objective_bound,
+			time	=time.time() - self.time_start
+		)
+
+		self.incumbents.append(inc)
+
+		if self.queue is not None:
+			self.queue.put(inc)
+
+		if self.client is not None:
+			self.client.send(inc.sol.get_jsn_events(), inc.bound)
+
+		if self.fd:
+			jsn = {
+				'time': inc.time,
+				'objective_value': inc.obj,
+				'bound': inc.bound,
+				'events': inc.sol.get_jsn_events()
+			}
+			self.fd.write(json.dumps(jsn) + '\n')
+			self.fd.flush()
+
+		if self.stop_obj is not None and inc.obj <= self.stop_obj:
+			self.stop_search()
+
+
+	def close(self):
+		if self.fd:
+			self.fd.close()
+			self.fd = None
+
+
+class Persistent_solver(Solver):
+	all_trains: List[int]
+	domains: Dict[int, cp.Domain]
+	tight_vars: List[cp.IntVar]
+
+	def __init__(self, inst, obj_type: Obj_type = Obj_type.TIME):
+		self.all_trains = list(range(inst.n_trains))
+		super().__init__(inst, None, free=self.all_trains)
+		self.add_obj(obj_type)
+
+		self.domains = {}
+		self.tight_vars = []
+
+
+	@prof.timed()
+	def set_nbhd(self, curr_sol: Solution, free: List[int]):
+		# fixed trains keep their path through assumptions on the used literals
+		# and their times through tightened domains, the model itself is not rebuilt
+		for var in self.tight_vars:
+			var.with_domain(self.domains[var.index])
+
+		self.tight_vars = []
+		self.model.clear_hints()
+		self.model.clear_assumptions()
+
+		self.curr_sol = curr_sol
+		self.free = free
+		self.fixed = [t for t in self.all_trains if not t in free]
+
+		for t in self.fixed:
+			self.fix_train(t, curr_sol.events[t])
+
+		self.add_hint()
+
+
+	def fix_train(self, t: int, events: List[Event]):
+		train = self.inst.trains[t]
+		used = { e.idx for e in events }
+
+		self.model.add_assumptions(
+			self.var_op_used[op.idx] if op.idx in used else self.var_op_used[op.idx].Not()
+			for op in train.ops)
+
+		for e in events:
+			self.tighten(self.var_op_start[e.idx], e.start)
+			self.tighten(self.var_op_end[e.idx], e.end)
+
+		intervals = get_res_intervals(self.inst, events)
+
+		for r in train.avoidable_res:
+			if (r, t) in self.var_res_used and not r in intervals:
+				self.model.add_assumption(self.var_res_used[r, t].Not())
+
+		for r, (lock, unlock) in intervals.items():
+			if (r, t) in self.var_res_lock:
+				self.tighten(self.var_res_lock[r, t], lock)
+				self.tighten(self.var_res_unlock[r, t], unlock)
+
+
+	def tighten(self, var: cp.IntVar, value: int):
+		if not var.index in self.domains:
+			self.domains[var.index] = var.domain
+
+		var.with_domain(cp.Domain(value, value))
+		self.tight_vars.append(var)
+
+
 if __name__ == '__main__':
 	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
 	print(data)
 	inst = Instance(data)
 	solver = Solver(inst=inst, free=list(range(inst.n_trains)))
-	
-	sol = solver.solve()
+	solver.add_time_obj()
+
+	queue = Queue()
+	if solver.solve_stream(max_time=60, queue=queue):
+		while not queue.empty():
+			inc = queue.get()
+			print(f'{inc.time:.2f}s obj {inc.obj} bound {inc.bound}')
 
-	if sol:
-		for k, v in sol.events.items():
-			print(k, v)
+		for k, v in solver.get_solution().events.items():
+			print(k, [str(e) for e in v])
 
 	else:
 		print('infeasible')
\ No newline at end of file
@@ -0,0 +1,333 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import math
+import time
+import queue
+import importlib
+import multiprocessing as mp
+
+from typing import List, Dict, Tuple, Callable
+
+from base_inst import Base_inst
+from instance import Instance
+from shared_inst import Shared_inst, Shared_handle
+from solution import Sol_checker
+from sol_file import Sol_writer, make_records
+from result_cache import Result_cache
+
+
+DEFAULT_DATA = 'data/nor1_critical_0.json'
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# every backend has its own instance module, so each one runs in a fresh
+# process with its directories in front of the path
+BACKEND_PATHS = {
+	'gurobi': [],
+	'cpsat': ['ortools'],
+	'scip': ['scip', 'old'],
+}
+
+# backends on the root instance attach to the parent's copy instead of parsing the file
+SHARED_BACKENDS = {'gurobi'}
+
+
+def load_backend(name: str, module: str):
+	# the caller may have loaded modules of the same name, e.g. the root instance
+	for k, m in list(sys.modules.items()):
+		if not k in ('__main__', '__mp_main__', __name__) and (getattr(m, '__file__', None) or '').startswith(ROOT_DIR):
+			del sys.modules[k]
+
+	for path in reversed(BACKEND_PATHS[name]):
+		sys.path.insert(0, os.path.join(ROOT_DIR, path))
+
+	return importlib.import_module(module)
+
+
+def get_jsn_obj(base_inst: Base_inst, jsn_events: List[dict]) -> int:
+	start = { (ev['train'], ev['operation']): ev['time'] for ev in jsn_events }
+	obj = 0
+
+	for base_obj in base_inst.objs:
+		t = start.get((base_obj.train, base_obj.op))
+
+		if t is None or t <= base_obj.threshold:
+			continue
+
+		obj += base_obj.coeff*(t - base_obj.threshold) + base_obj.increment
+
+	return obj
+
+
+def send_latest(in_queue: mp.Queue, msg):
+	# the queue holds one message, an unread older one is replaced. if the backend is
+	# reading it right now the new one is skipped, the next improvement goes through
+	try:
+		in_queue.put_nowait(msg)
+		return
+	except queue.Full:
+		pass
+
+	try:
+		in_queue.get(timeout=0.1)
+	except queue.Empty:
+		pass
+
+	try:
+		in_queue.put_nowait(msg)
+	except queue.Full:
+		pass
+
+
+class Client:
+	name: str
+
+	def __init__(self, name, out_queue, in_queue, stop_event):
+		self.name = name
+		self.out_queue = out_queue
+		self.in_queue = in_queue
+		self.stop_event = stop_event
+
+
+	def send(self, jsn_events: List[dict]|None, bound: float|None = None):
+		# bounds have to be valid for the instance objective, the events are re-evaluated
+		self.out_queue.put(('sol', self.name, bound, jsn_events))
+
+
+	def get_start(self) -> Tuple[float, List[dict]]|None:
+		# only improvements are forwarded, so the last message is the best one
+		start = None
+
+		while True:
+			try:
+				start = self.in_queue.get_nowait()
+			except queue.Empty:
+				break
+
+		return start
+
+
+	def is_stopped(self) -> bool:
+		return self.stop_event.is_set()
+
+
+	def wait_stopped(self, timeout=None) -> bool:
+		return self.stop_event.wait(timeout)
+
+
+def run_gurobi(client: Client, data: str, handle: Shared_handle|None, max_time: float) -> float|None:
+	heur = load_backend('gurobi', 'heur')
+	# imported after the backend so its ops are of the same instance module
+	shared_inst = importlib.import_module('shared_inst')
+
+	with shared_inst.Shared_inst.attach(handle) as inst:
+		return heur.Heur(inst).solve(max_time, client)
+
+
+def run_cpsat(client: Client, data: str, handle: Shared_handle|None, max_time: float) -> float|None:
+	solver = load_backend('cpsat', 'solver')
+	inst = solver.Instance(data)
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	return s.solve_client(client, max_time)
+
+
+def run_scip(client: Client, data: str, handle: Shared_handle|None, max_time: float) -> float|None:
+	solver = load_backend('scip', 'solver')
+
+	return solver.Solver(solver.Instance(data)).solve(max_time, client)
+
+
+BACKENDS: Dict[str, Callable] = {
+	'gurobi': run_gurobi,
+	'cpsat': run_cpsat,
+	'scip': run_scip,
+}
+
+
+def run_backend(name: str, client: Client, data: str, handle: Shared_handle|None, max_time: float):
+	bound = None
+
+	try:
+		bound = BACKENDS[name](client, data, handle, max_time)
+	finally:
+		client.out_queue.put(('done', name, bound, None))
+
+
+class Portfolio:
+	data: str
+	base_inst: Base_inst
+	checker: Sol_checker
+	backends: List[str]
+
+	best_obj: float
+	best_events: List[dict]|None
+	best_backend: str|None
+	bound: float
+
+	cache: Result_cache|None
+
+	def __init__(self, data, backends=list(BACKENDS.keys()), max_time=60.0, grace_time=5.0, out_file=None, cache=None):
+		self.data = data
+		self.base_inst = Base_inst(data)
+		self.checker = Sol_checker(Instance(data))
+		self.backends = backends
+		self.max_time = max_time
+		self.grace_time = grace_time
+		self.out_file = out_file
+		self.writer = None
+		self.cache = cache
+
+		self.best_obj = float('inf')
+		self.best_events = None
+		self.best_backend = None
+		self.bound = 0
+
+
+	def get_config(self) -> dict:
+		return { 'runner': 'portfolio', 'backends': sorted(self.backends), 'max_time': self.max_time }
+
+
+	def solve(self) -> List[dict]|None:
+		time_start = time.time()
+
+		if self.cache:
+			entry = self.cache.get(self.base_inst.inst_hash, self.get_config())
+
+			if entry is not None and entry['events'] is not None:
+				print(f"cached obj {entry['obj']}, bound {entry['bound']}")
+
+				self.best_obj = entry['obj']
+				self.best_events = entry['events']
+				self.best_backend = entry['stats'].get('backend')
+				self.bound = entry['bound'] or 0
+
+				return self.best_events
+
+		ctx = mp.get_context('spawn')
+		out_queue = ctx.Queue()
+		stop_event = ctx.Event()
+
+		in_queues = {}
+		procs = {}
+
+		shared = Shared_inst.publish(self.checker.inst) if SHARED_BACKENDS & set(self.backends) else None
+		handle = shared.handle if shared else None
+
+		# a backend only needs the latest incumbent, older ones are replaced
+		for name in self.backends:
+			in_queues[name] = ctx.Queue(maxsize=1)
+			client = Client(name, out_queue, in_queues[name], stop_event)
+
+			procs[name] = ctx.Process(target=run_backend, args=(name, client, self.data, handle, self.max_time), daemon=True)
+			procs[name].start()
+
+		if self.out_file:
+			self.writer = Sol_writer(self.out_file, self.base_inst.inst_hash)
+
+		# other runs on the instance give the backends a start and a bound
+		if self.cache:
+			best = self.cache.get_best(self.base_inst.inst_hash)
+
+			if best is not None and best['bound'] is not None:
+				self.bound = best['bound']
+
+			if best is not None and best['events'] is not None:
+				self.add_incumbent('cache', best['events'], in_queues, time.time() - time_start)
+
+		running = set(self.backends)
+
+		while running and self.best_obj > self.bound:
+			time_left = self.max_time - (time.time() - time_start)
+			if time_left <= 0:
+				break
+
+			try:
+				kind, name, bound, jsn_events = out_queue.get(timeout=min(time_left, 1.0))
+			except queue.Empty:
+				running = { name for name in running if procs[name].is_alive() }
+				continue
+
+			# times and objective coefficients are integral, so are optimal objectives
+			if bound is not None:
+				bound = math.ceil(bound - 1e-6)
+
+			if bound is not None and bound > self.bound:
+				self.bound = bound
+				print(f'{time.time() - time_start:.2f}s {name} bound {bound}')
+
+			if kind == 'done':
+				running.discard(name)
+				continue
+
+			if jsn_events is not None:
+				self.add_incumbent(name, jsn_events, in_queues, time.time() - time_start)
+
+		stop_event.set()
+
+		for proc in procs.values():
+			proc.join(self.grace_time)
+			if proc.is_alive():
+				proc.terminate()
+
+		if shared:
+			shared.close()
+
+		# stopped backends never read what is left, the feeder threads must not wait for them on exit
+		for q in list(in_queues.values()) + [out_queue]:
+			q.cancel_join_thread()
+			q.close()
+
+		if self.writer:
+			self.writer.close()
+
+		if self.cache and self.best_events is not None:
+			self.cache.put(self.base_inst.inst_hash, self.get_config(), self.best_obj, self.bound, self.best_events,
+				{ 'backend': self.best_backend, 'time': time.time() - time_start })
+
+		return self.best_events
+
+
+	def add_incumbent(self, name: str, jsn_events: List[dict], in_queues: Dict[str, mp.Queue], time: float):
+		# the backends model the instance differently, only schedules that pass the checker count
+		sol = self.checker.make_solution(jsn_events)
+		violations = self.checker.check(sol)
+
+		if violations:
+			print(f'{time:.2f}s {name} invalid {violations}')
+			return
+
+		obj = self.checker.get_obj(sol)
+
+		if obj >= self.best_obj:
+			return
+
+		print(f'{time:.2f}s {name} obj {obj}')
+
+		self.best_obj = obj
+		self.best_events = jsn_events
+		self.best_backend = name
+
+		if self.writer:
+			self.writer.write(obj, make_records(self.base_inst, jsn_events), time)
+
+		for other, in_queue in in_queues.items():
+			if other != name:
+				send_latest(in_queue, (obj, jsn_events))
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	max_time = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+	backends = sys.argv[3].split(',') if len(sys.argv) > 3 else list(BACKENDS.keys())
+	out_file = sys.argv[4] if len(sys.argv) > 4 else None
+	cache = Result_cache(sys.argv[5]) if len(sys.argv) > 5 else None
+	print(data)
+
+	portfolio = Portfolio(data, backends, max_time, out_file=out_file, cache=cache)
+	portfolio.solve()
+
+	print(f'best: {portfolio.best_obj} ({portfolio.best_backend}), bound {portfolio.bound}')
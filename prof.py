@@ -0,0 +1,136 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import json
+import time
+import functools
+import multiprocessing as mp
+import multiprocessing.util
+
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import List, Dict
+
+
+# PROF=<path> profiles the run and writes <path>.json and <path>.folded at exit,
+# decorated functions are only wrapped when it is set before they are imported
+PROF_ENV = 'PROF'
+DEFAULT_OUT = 'profile'
+
+enabled: bool = os.environ.get(PROF_ENV, '') not in ('', '0')
+
+stack: List[str] = []
+times: Dict[str, float] = defaultdict(float)
+calls: Dict[str, int] = defaultdict(int)
+counters: Dict[str, int] = defaultdict(int)
+
+NULL_TIMER = nullcontext()
+
+
+class Timer:
+	name: str
+
+	def __init__(self, name: str):
+		self.name = name
+
+	def __enter__(self):
+		stack.append(self.name)
+		self.time_start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		key = ';'.join(stack)
+		times[key] += time.perf_counter() - self.time_start
+		calls[key] += 1
+		stack.pop()
+
+
+def timer(name: str):
+	return Timer(name) if enabled else NULL_TIMER
+
+
+def timed(name: str|None = None):
+	def decorator(func):
+		if not enabled:
+			return func
+
+		key = name or func.__qualname__
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			with Timer(key):
+				return func(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+def count(name: str, n: int = 1):
+	if enabled:
+		counters[name] += n
+
+
+def enable():
+	global enabled
+	enabled = True
+
+
+def get_self_times() -> Dict[str, float]:
+	# flame graphs sum the children into their parents, so every stack keeps only its own time
+	self_times = dict(times)
+
+	for key, t in times.items():
+		parent = key.rpartition(';')[0]
+		if parent in self_times:
+			self_times[parent] -= t
+
+	return self_times
+
+
+def get_profile() -> dict:
+	return {
+		'timers': { key: { 'time': times[key], 'calls': calls[key] } for key in sorted(times.keys()) },
+		'counters': dict(sorted(counters.items())),
+	}
+
+
+def write_profile(path: str):
+	with open(path + '.json', 'w') as fd:
+		json.dump(get_profile(), fd, indent=1)
+
+	with open(path + '.folded', 'w') as fd:
+		for key, t in sorted(get_self_times().items()):
+			fd.write(f'{key} {max(round(t*1e6), 0)}\n')
+
+
+def write_at_exit():
+	if not enabled or not (times or counters):
+		return
+
+	path = os.environ.get(PROF_ENV, '')
+	if path in ('', '0', '1'):
+		path = DEFAULT_OUT
+
+	# processes of a portfolio or benchmark run write their own files
+	proc = mp.current_process()
+	if proc.name != 'MainProcess':
+		path += f'.{proc.pid}'
+
+	write_profile(path)
+
+
+# unlike atexit, finalizers also run when a multiprocessing child exits
+mp.util.Finalize(None, write_at_exit, exitpriority=0)
+
+
+if __name__ == '__main__':
+	with open(sys.argv[1], 'r') as fd:
+		profile = json.load(fd)
+
+	for key, v in sorted(profile['timers'].items(), key=lambda x: -x[1]['time']):
+		print(f"{v['time']:10.3f}s {v['calls']:8d}  {key}")
+
+	for key, v in profile['counters'].items():
+		print(f'{v:10d}  {key}')
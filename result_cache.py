@@ -0,0 +1,147 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+
+from typing import List
+
+
+CACHE_DIR = 'cache/results'
+MAX_SIZE = 1 << 30
+
+# backends whose dual bounds are merged across configurations, other runners report no bounds
+BOUND_SOLVERS = { 'gurobi', 'cpsat', 'scip' }
+
+
+def has_valid_bound(config: dict) -> bool:
+	solvers = config.get('backends', [config.get('solver')])
+
+	return all(solver in BOUND_SOLVERS for solver in solvers)
+
+
+def get_config_key(config: dict) -> str:
+	# equal settings give equal keys regardless of the order they were given in
+	jsn = json.dumps(config, sort_keys=True, separators=(',', ':'))
+
+	return hashlib.sha1(jsn.encode()).hexdigest()
+
+
+class Result_cache:
+	cache_dir: str
+	max_size: int
+
+	def __init__(self, cache_dir=CACHE_DIR, max_size=MAX_SIZE):
+		self.cache_dir = cache_dir
+		self.max_size = max_size
+
+
+	def get_file(self, inst_hash: str, config: dict) -> str:
+		return os.path.join(self.cache_dir, inst_hash, get_config_key(config) + '.json')
+
+
+	def get(self, inst_hash: str, config: dict) -> dict|None:
+		path = self.get_file(inst_hash, config)
+
+		try:
+			with open(path, 'r') as fd:
+				entry = json.load(fd)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return None
+
+		# eviction drops the least recently used entries first
+		os.utime(path)
+
+		return entry
+
+
+	def put(self, inst_hash: str, config: dict, obj: int|None, bound: float|None, events: List[dict]|None, stats: dict = {}):
+		path = self.get_file(inst_hash, config)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		entry = {
+			'inst_hash': inst_hash,
+			'config': config,
+			'obj': obj,
+			'bound': bound,
+			'events': events,
+			'stats': stats,
+			'time': time.time(),
+		}
+
+		with open(path + '.tmp', 'w') as fd:
+			json.dump(entry, fd)
+
+		os.replace(path + '.tmp', path)
+
+		self.evict()
+
+
+	def get_entries(self, inst_hash: str) -> List[dict]:
+		entries = []
+
+		for path in glob.glob(os.path.join(self.cache_dir, inst_hash, '*.json')):
+			try:
+				with open(path, 'r') as fd:
+					entries.append(json.load(fd))
+			except (FileNotFoundError, json.JSONDecodeError):
+				continue
+
+		return entries
+
+
+	def get_best(self, inst_hash: str) -> dict|None:
+		# the best schedule of any configuration and the best bound of those with valid bounds
+		entries = self.get_entries(inst_hash)
+		sols = [e for e in entries if e['events'] is not None and e['obj'] is not None]
+		bounds = [e['bound'] for e in entries if e['bound'] is not None and has_valid_bound(e['config'])]
+
+		if not sols and not bounds:
+			return None
+
+		best = min(sols, key=lambda e: e['obj']) if sols else {}
+
+		return {
+			'obj': best.get('obj'),
+			'events': best.get('events'),
+			'bound': max(bounds) if bounds else None,
+		}
+
+
+	def get_size(self) -> int:
+		return sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.cache_dir, '*', '*.json')))
+
+
+	def evict(self):
+		files = []
+		for path in glob.glob(os.path.join(self.cache_dir, '*', '*.json')):
+			try:
+				st = os.stat(path)
+			except FileNotFoundError:
+				continue
+			files.append((st.st_mtime, st.st_size, path))
+
+		size = sum(f[1] for f in files)
+
+		for _, file_size, path in sorted(files):
+			if size <= self.max_size:
+				break
+
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+
+			size -= file_size
+
+
+if __name__ == '__main__':
+	cache = Result_cache(sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR)
+	print(f'{cache.cache_dir}: {cache.get_size()/(1 << 20):.2f} MiB')
+
+	for inst_dir in sorted(glob.glob(os.path.join(cache.cache_dir, '*'))):
+		for e in cache.get_entries(os.path.basename(inst_dir)):
+			print(f"{e['inst_hash'][:8]} {json.dumps(e['config'], sort_keys=True)}: obj {e['obj']}, bound {e['bound']}")
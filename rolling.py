@@ -0,0 +1,207 @@
+#!.venv/bin/python3
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+from typing import List, Dict
+
+from base_inst import Base_inst, Base_train
+from portfolio import Portfolio, get_jsn_obj
+from sol_file import Sol_writer, make_records
+
+
+DEFAULT_DATA = 'data/nor5_large_1.json'
+
+
+def get_train_start(train: Base_train) -> int:
+	# the first op is a dummy starting at 0, the departure is on its successors
+	return max(train.ops[0].start_lb, min(train.ops[s].start_lb for s in train.ops[0].succ))
+
+
+def get_jsn_train(train: Base_train) -> List[dict]:
+	jsn_train = []
+
+	for op in train.ops:
+		jsn_op = {
+			'min_duration': op.dur,
+			'start_lb': op.start_lb,
+			'successors': op.succ,
+			'resources': [{ 'resource': res.name, 'release_time': res.time } for res in op.res],
+		}
+
+		if op.start_ub >= 0:
+			jsn_op['start_ub'] = op.start_ub
+
+		jsn_train.append(jsn_op)
+
+	return jsn_train
+
+
+def get_jsn_fixed_train(train: Base_train, jsn_events: List[dict]) -> List[dict]:
+	# only the chosen path is kept and every op starts exactly at its solution time
+	# the path follows the successors, ops of zero duration start together with the next op
+	times = { ev['operation']: ev['time'] for ev in jsn_events }
+	path = [0]
+
+	while train.ops[path[-1]].succ:
+		path.append(next(s for s in train.ops[path[-1]].succ if s in times))
+
+	jsn_train = []
+
+	for i, o in enumerate(path):
+		op = train.ops[o]
+
+		jsn_train.append({
+			'min_duration': op.dur,
+			'start_lb': times[o],
+			'start_ub': times[o],
+			'successors': [i + 1] if i + 1 < len(path) else [],
+			'resources': [{ 'resource': res.name, 'release_time': res.time } for res in op.res],
+		})
+
+	return jsn_train
+
+
+def solve_sub_inst(base_inst: Base_inst, free: List[int], fixed: Dict[int, List[dict]], backends: List[str],
+		max_time: float, max_retries=0) -> Dict[int, List[dict]]|None:
+	# solves the free trains around the fixed ones, returns the events of the free trains
+	trains = free + list(fixed.keys())
+	sub_train = { t: i for i, t in enumerate(free) }
+
+	jsn = {
+		'trains': [get_jsn_train(base_inst.trains[t]) for t in free] +
+			[get_jsn_fixed_train(base_inst.trains[t], events) for t, events in fixed.items()],
+		'objective': [
+			{ 'type': 'op_delay', 'train': sub_train[obj.train], 'operation': obj.op,
+				'threshold': obj.threshold, 'coeff': obj.coeff, 'increment': obj.increment }
+			for obj in base_inst.objs if obj.train in sub_train
+		],
+	}
+
+	with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as fd:
+		json.dump(jsn, fd)
+
+	# no schedule is retried with twice the time
+	try:
+		for k in range(max_retries + 1):
+			sub_events = Portfolio(fd.name, backends, max_time*2**k).solve()
+			if sub_events is not None:
+				break
+	finally:
+		os.remove(fd.name)
+
+	if sub_events is None:
+		return None
+
+	events = { t: [] for t in free }
+
+	for ev in sub_events:
+		if ev['train'] < len(free):
+			events[trains[ev['train']]].append(dict(ev, train=trains[ev['train']]))
+
+	return events
+
+
+class Rolling_horizon:
+	data: str
+	base_inst: Base_inst
+	backends: List[str]
+
+	window: int
+	overlap: int
+	window_time: float
+	max_retries: int
+
+	# committed events and the time the last resource is released, per train
+	events: Dict[int, List[dict]]
+	train_end: Dict[int, int]
+
+	def __init__(self, data, backends=['cpsat'], window=3600, overlap=1800, window_time=30.0, max_retries=2):
+		self.data = data
+		self.base_inst = Base_inst(data)
+		self.backends = backends
+		self.window = window
+		self.overlap = overlap
+		self.window_time = window_time
+		self.max_retries = max_retries
+
+		self.events = {}
+		self.train_end = {}
+
+
+	def solve(self) -> List[dict]|None:
+		train_start = [get_train_start(train) for train in self.base_inst.trains]
+		order = sorted(range(self.base_inst.n_trains), key=lambda t: train_start[t])
+		pos = 0
+
+		while pos < len(order):
+			begin = train_start[order[pos]]
+			commit_end = begin + self.window
+
+			# trains of the overlap are solved again in the next window
+			free = [t for t in order[pos:] if train_start[t] < commit_end + self.overlap]
+			n_commit = max(sum(1 for t in free if train_start[t] < commit_end), 1)
+
+			# committed trains still holding resources when the window starts are kept fixed
+			fixed = [t for t in self.events.keys() if self.train_end[t] > begin]
+
+			time_start = time.time()
+			window_events = self.solve_window(free, fixed)
+
+			if window_events is None:
+				print(f'window at {begin}: no solution')
+				return None
+
+			for t in free[:n_commit]:
+				self.commit_train(t, window_events[t])
+
+			print(f'window at {begin}: {len(free)} trains, {len(fixed)} fixed, {n_commit} committed, '
+				f'{time.time() - time_start:.2f}s')
+
+			pos += n_commit
+
+		return self.get_jsn_events()
+
+
+	def solve_window(self, free: List[int], fixed: List[int]) -> Dict[int, List[dict]]|None:
+		return solve_sub_inst(self.base_inst, free, { t: self.events[t] for t in fixed }, self.backends,
+			self.window_time, self.max_retries)
+
+
+	def commit_train(self, t: int, jsn_events: List[dict]):
+		self.events[t] = jsn_events
+
+		records = make_records(self.base_inst, jsn_events)
+		ops = self.base_inst.trains[t].ops
+
+		self.train_end[t] = max(int(r['end']) + max((res.time for res in ops[r['op']].res), default=0) for r in records)
+
+
+	def get_jsn_events(self) -> List[dict]:
+		jsn_events = [ev for events in self.events.values() for ev in events]
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	window = int(sys.argv[2]) if len(sys.argv) > 2 else 3600
+	window_time = float(sys.argv[3]) if len(sys.argv) > 3 else 30.0
+	backends = sys.argv[4].split(',') if len(sys.argv) > 4 else ['cpsat']
+	out_file = sys.argv[5] if len(sys.argv) > 5 else None
+	print(data)
+
+	rh = Rolling_horizon(data, backends, window, window//2, window_time)
+	jsn_events = rh.solve()
+
+	if jsn_events is not None:
+		obj = get_jsn_obj(rh.base_inst, jsn_events)
+		print(f'obj {obj}')
+
+		if out_file:
+			with Sol_writer(out_file, rh.base_inst.inst_hash) as writer:
+				writer.write(obj, make_records(rh.base_inst, jsn_events))
@@ -1,5 +1,6 @@
 #!.venv/bin/python3
 
+import os
 import sys
 
 import pyscipopt as scip
@@ -8,6 +9,17 @@ import numpy as np
 
 from typing import List, Tuple, Dict, Set
 from instance import Instance, Op, Res_use
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
+
+# resources are released at least a second after the op ends, like in the ortools model, so two
+# trains never swap resources at the same instant
+MIN_RES_TIME = 1
+
+
+def res_time(time: int) -> int:
+	return max(time, MIN_RES_TIME)
+
 
 class Res_conshdlr(scip.Conshdlr):
 	def __init__(self, model, res_uses, max_train_dur):
@@ -15,51 +27,105 @@ class Res_conshdlr(scip.Conshdlr):
 		self.model = model
 		self.res_uses = res_uses
 		self.max_train_dur = max_train_dur
+		# all trains one after the other, an order of two ops never needs more slack
+		self.big_m = sum(max_train_dur)
+		self.trans = None
+		self.cut_pairs = set()
 
-	def get_res_collisions(self, solution):
-		eps = 1e-5
+		self.make_index()
 
+	@prof.timed()
+	def make_index(self):
+		# flat arrays over the ops that use a resource, so that one callback
+		# reads every solution value once and detects collisions on arrays
 		model = self.model
 
 		s = model.data['s']
 		e = model.data['e']
 		f = model.data['f']
 
-		collisions = []
+		self.ops = []
+		op_idx = {}
 
-		used = {}
+		for res_uses in self.res_uses.values():
+			for ru in res_uses:
+				if not ru.op in op_idx:
+					op_idx[ru.op] = len(self.ops)
+					self.ops.append(ru.op)
 
-		for res_idx, res_uses in self.res_uses.items():
-			for i, ru1 in enumerate(res_uses):
-				op1 = ru1.op
-				if not op1 in used:
-					used[op1] = (op1.n_succ == 0) or \
-						(sum(model.getSolVal(solution, f[op1, succ1]) for succ1 in op1.succ) >= 1 - eps)
-				
-				if not used[op1]:
-					continue
+		self.s_vars = [s[op] for op in self.ops]
+		self.e_vars = [e[op] for op in self.ops]
+		self.f_vars = [f[op, succ] for op in self.ops for succ in op.succ]
 
-				s1 = int(round(model.getSolVal(solution, s[op1])))
-				e1 = int(round(model.getSolVal(solution, e[op1]) + ru1.time))
+		# the propagator changes their bounds, which scip refuses on multi-aggregated vars
+		for var in self.s_vars + self.e_vars:
+			model.markDoNotMultaggrVar(var)
 
-				for ru2 in res_uses[i+1:]:
-					op2 = ru2.op
+		n_succ = np.array([op.n_succ for op in self.ops], dtype=int)
+		self.f_start = np.concatenate(([0], np.cumsum(n_succ)[:-1])).astype(int)
+		self.op_no_succ = n_succ == 0
 
-					if op1.train_idx == op2.train_idx:
-						continue
+		self.res_arrays = {}
 
-					if not op2 in used:
-						used[op2] = (op2.n_succ == 0) or \
-							(sum(model.getSolVal(solution, f[op2, succ2]) for succ2 in op2.succ) >= 1 - eps)
-				
-					if not used[op2]:
-						continue
+		for res_idx, res_uses in self.res_uses.items():
+			self.res_arrays[res_idx] = (
+				np.array([op_idx[ru.op] for ru in res_uses], dtype=int),
+				np.array([res_time(ru.time) for ru in res_uses], dtype=float),
+				np.array([ru.op.train_idx for ru in res_uses], dtype=int),
+			)
+
+		# every pair of ops of different trains on a resource, built once for the propagator
+		pairs = []
+
+		for ops, times, trains in self.res_arrays.values():
+			i, j = np.triu_indices(len(ops), k=1)
+			keep = trains[i] != trains[j]
+			pairs.append((ops[i[keep]], ops[j[keep]], times[i[keep]], times[j[keep]]))
+
+		self.pair_op1 = np.concatenate([p[0] for p in pairs] + [np.zeros(0, dtype=int)])
+		self.pair_op2 = np.concatenate([p[1] for p in pairs] + [np.zeros(0, dtype=int)])
+		self.pair_time1 = np.concatenate([p[2] for p in pairs] + [np.zeros(0)])
+		self.pair_time2 = np.concatenate([p[3] for p in pairs] + [np.zeros(0)])
+
+		# an op used in a route holds its resource for at least dur + release from its start
+		hold = np.array([op.dur for op in self.ops], dtype=float)
+		self.pair_hold1 = hold[self.pair_op1] + self.pair_time1
+		self.pair_hold2 = hold[self.pair_op2] + self.pair_time2
+
+		start_lb = np.array([op.start_lb for op in self.ops], dtype=float)
+		self.pair_start_lb = np.minimum(start_lb[self.pair_op1], start_lb[self.pair_op2])
+
+	def get_sol_vals(self, solution, variables):
+		get_sol_val = self.model.getSolVal
+		return np.fromiter((get_sol_val(solution, v) for v in variables), dtype=float, count=len(variables))
+
+	@prof.timed()
+	def get_res_collisions(self, solution, min_use=1 - 1e-5):
+		s_val = np.rint(self.get_sol_vals(solution, self.s_vars))
+		e_val = self.get_sol_vals(solution, self.e_vars)
+		f_val = self.get_sol_vals(solution, self.f_vars)
+
+		use = np.add.reduceat(np.append(f_val, 0), self.f_start)
+		used = self.op_no_succ | (use >= min_use)
 
-					s2 = int(round(model.getSolVal(solution, s[op2])))
-					e2 = int(round(model.getSolVal(solution, e[op2]) + ru2.time))
+		collisions = []
 
-					if (s1 < e2) and (s2 < e1):
-						collisions.append((res_idx, ru1, ru2))
+		for res_idx, (ops, times, trains) in self.res_arrays.items():
+			res_used = used[ops]
+			if np.count_nonzero(res_used) < 2:
+				continue
+
+			idx = np.flatnonzero(res_used)
+
+			s1 = s_val[ops[idx]]
+			e1 = np.rint(e_val[ops[idx]] + times[idx])
+			t1 = trains[idx]
+
+			overlap = (s1[:, None] < e1[None, :]) & (s1[None, :] < e1[:, None]) & (t1[:, None] != t1[None, :])
+			
+			for i, j in zip(*np.nonzero(np.triu(overlap, k=1))):
+				res_uses = self.res_uses[res_idx]
+				collisions.append((res_idx, res_uses[idx[i]], res_uses[idx[j]]))
 
 		return collisions
 
@@ -88,7 +154,7 @@ class Res_conshdlr(scip.Conshdlr):
 		use_op1 = scip.quicksum(f[op1, succ1] for succ1 in op1.succ) if op1.n_succ > 0 else 1
 		use_op2 = scip.quicksum(f[op2, succ2] for succ2 in op2.succ) if op2.n_succ > 0 else 1
 
-		M1 = max(self.max_train_dur[op1.train_idx],	self.max_train_dur[op2.train_idx])
+		M1 = self.big_m
 
 		k1 = (res_idx, op1, op2)
 		k2 = (res_idx, op2, op1)
@@ -107,8 +173,8 @@ class Res_conshdlr(scip.Conshdlr):
 		model.addCons(name=f'ch{res_idx},{op1},{op2}', cons=cons, 
 			removable=True)		
 
-		cons1 = e[op1] + ru1.time <= s[op2] + M1*(1 - v1)
-		cons2 = e[op2] + ru2.time <= s[op1] + M1*(1 - v2)
+		cons1 = e[op1] + res_time(ru1.time) <= s[op2] + M1*(1 - v1)
+		cons2 = e[op2] + res_time(ru2.time) <= s[op1] + M1*(1 - v2)
 		
 		model.addCons(name=f'res{res_idx},{op1},{op2}', cons=cons1,
 			modifiable=True, removable=True)
@@ -120,10 +186,162 @@ class Res_conshdlr(scip.Conshdlr):
 		if not 'r' in model.data:
 			model.data['r'] = {}
 
+		prof.count('conshdlr_res_conss', len(collisions))
+
 		for col in collisions:
 			self.make_res_cons(col)
+
+
+	def get_trans_vars(self):
+		# transformed vars in the order of the flat arrays
+		model = self.model
+
+		if self.trans is None:
+			s = model.data['s']
+			e = model.data['e']
+			f = model.data['f']
+
+			self.trans = {
+				's': [model.getTransformedVar(s[op]) for op in self.ops],
+				'e': [model.getTransformedVar(e[op]) for op in self.ops],
+				'f': [model.getTransformedVar(f[op, succ]) for op in self.ops for succ in op.succ],
+			}
+
+		return self.trans
+
+
+	def get_local_bounds(self, variables):
+		lb = np.fromiter((v.getLbLocal() for v in variables), dtype=float, count=len(variables))
+		ub = np.fromiter((v.getUbLocal() for v in variables), dtype=float, count=len(variables))
+
+		return lb, ub
+
+
+	@prof.timed()
+	def consprop(self, constraints, nusefulconss, nmarkedconss, proptiming):
+		# the disjunction e1 + t1 <= s2 or e2 + t2 <= s1 of every pair of forced used ops,
+		# checked on the local bounds of all pairs at once
+		model = self.model
+		trans = self.get_trans_vars()
+		s = trans['s']
+		e = trans['e']
+
+		s_lb, s_ub = self.get_local_bounds(s)
+		e_lb, e_ub = self.get_local_bounds(e)
+		f_lb, _ = self.get_local_bounds(trans['f'])
+
+		use = np.add.reduceat(np.append(f_lb, 0), self.f_start)
+		forced = self.op_no_succ | (use >= 1 - 1e-5)
+
+		p1, p2, t1, t2 = self.pair_op1, self.pair_op2, self.pair_time1, self.pair_time2
+		active = forced[p1] & forced[p2]
+
+		before = e_lb[p1] + t1 <= s_ub[p2]
+		after = e_lb[p2] + t2 <= s_ub[p1]
+
+		if np.any(active & ~before & ~after):
+			return {"result": scip.SCIP_RESULT.CUTOFF}
+
+		# pairs with one order left, only those where it still moves a bound
+		first = np.where(before, p1, p2)
+		second = np.where(before, p2, p1)
+		time = np.where(before, t1, t2)
+
+		move = active & (before != after) & ((s_lb[second] < e_lb[first] + time) | (e_ub[first] > s_ub[second] - time))
+
+		n_tightened = 0
+
+		for k in np.flatnonzero(move):
+			op1, op2, t = first[k], second[k], time[k]
+
+			infeasible, tightened = model.tightenVarLb(s[op2], e[op1].getLbLocal() + t)
+			if infeasible:
+				return {"result": scip.SCIP_RESULT.CUTOFF}
+			n_tightened += tightened
+
+			if not model.isInfinity(s[op2].getUbLocal()):
+				infeasible, tightened = model.tightenVarUb(e[op1], s[op2].getUbLocal() - t)
+				if infeasible:
+					return {"result": scip.SCIP_RESULT.CUTOFF}
+				n_tightened += tightened
+
+		prof.count('conshdlr_tightened', n_tightened)
+
+		if n_tightened > 0:
+			return {"result": scip.SCIP_RESULT.REDUCEDDOM}
+
+		return {"result": scip.SCIP_RESULT.DIDNOTFIND}
+
+
+	@prof.timed()
+	def conssepalp(self, constraints, nusefulconss):
+		# two ops on a resource with holds p1, p2 that start after L run one after the other,
+		# so p1*(s1 - L) + p2*(s2 - L) >= p1*p2 once both are used, the right side drops
+		# to p1*p2*(u1 + u2 - 1) <= 0 when one of them is not
+		model = self.model
+		trans = self.get_trans_vars()
+		s = trans['s']
+		f = trans['f']
+
+		s_val = self.get_sol_vals(None, s)
+		f_val = self.get_sol_vals(None, f)
+		use = np.add.reduceat(np.append(f_val, 0), self.f_start)
+		use[self.op_no_succ] = 1
+
+		p1, p2 = self.pair_op1, self.pair_op2
+		h1, h2, lb = self.pair_hold1, self.pair_hold2, self.pair_start_lb
+
+		lhs = h1*(s_val[p1] - lb) + h2*(s_val[p2] - lb)
+		rhs = h1*h2*(use[p1] + use[p2] - 1)
+		violated = np.flatnonzero((h1 > 0) & (h2 > 0) & (lhs < rhs - 1e-4))
+
+		n_cuts = 0
+
+		for k in violated:
+			op1, op2 = int(p1[k]), int(p2[k])
+			if (op1, op2) in self.cut_pairs:
+				continue
+
+			# terms with a constant usage move to the left hand side
+			row_lhs = lb[k]*(h1[k] + h2[k]) - h1[k]*h2[k]
+			for op in (op1, op2):
+				if self.op_no_succ[op]:
+					row_lhs += h1[k]*h2[k]
+
+			row = model.createEmptyRowUnspec(name=f'disj{op1},{op2}', lhs=row_lhs, rhs=None, local=False, removable=True)
+			model.cacheRowExtensions(row)
+
+			model.addVarToRow(row, s[op1], h1[k])
+			model.addVarToRow(row, s[op2], h2[k])
+
+			for op in (op1, op2):
+				start = self.f_start[op]
+				for var in f[start:start + self.ops[op].n_succ]:
+					model.addVarToRow(row, var, -h1[k]*h2[k])
+
+			model.flushRowExtensions(row)
+
+			if model.isCutEfficacious(row):
+				model.addCut(row)
+				self.cut_pairs.add((op1, op2))
+				n_cuts += 1
+
+			model.releaseRow(row)
+
+		prof.count('conshdlr_cuts', n_cuts)
+
+		if n_cuts > 0:
+			return {"result": scip.SCIP_RESULT.SEPARATED}
+
+		return {"result": scip.SCIP_RESULT.DIDNOTFIND}
+
+
+	def consexitsol(self, constraints, restart):
+		self.trans = None
+		self.cut_pairs = set()
 			
 
+	@prof.timed()
 	def conscheck(self, constraints, solution, checkintegrality, checklprows, printreason, completely):
 		collisions = self.get_res_collisions(solution)
 	
@@ -132,19 +350,18 @@ class Res_conshdlr(scip.Conshdlr):
 		
 		return {"result": scip.SCIP_RESULT.INFEASIBLE}
 
+	@prof.timed()
 	def consenfolp(self, constraints, nusefulconss, solinfeasible):
 		collisions = self.get_res_collisions(solution=None)
-		# print(nusefulconss, constraints)
-		print('enf lp')
 		if len(collisions) == 0:
 			return {"result": scip.SCIP_RESULT.FEASIBLE}
 		
 		self.make_conss_from_collisions(collisions)
 		return {"result": scip.SCIP_RESULT.CONSADDED}
 	
+	@prof.timed()
 	def consenfops(self, constraints, nusefulconss, solinfeasible, objinfeasible):
 		collisions = self.get_res_collisions(solution=None)
-		print('enf pseudo')
 		if len(collisions) == 0:
 			return {"result": scip.SCIP_RESULT.FEASIBLE}
 		
@@ -1,5 +1,6 @@
 #!.venv/bin/python3
 
+import os
 import sys
 
 import pyscipopt as scip
@@ -8,8 +9,10 @@ import numpy as np
 
 from instance import Instance, Op
 from model import Model
-from conshdlr import Res_conshdlr
+from conshdlr import Res_conshdlr, res_time
 from utils import is_bin, round_to_int
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
 
 DEFAULT_DATA = 'data/testing/headway1.json'
 
@@ -34,13 +37,13 @@ class Heur_solver:
 			if abs(rhs - v) > eps:
 				m.chgRhs(fix_conss[var][k], v)
 		
-	def solve(self):
-		model = Model(self.inst, is_heur=True)
+	def solve(self, dive=True):
+		model = Model(self.inst)
 
 		conshdlr = Res_conshdlr(model, self.inst.res_uses, self.inst.max_train_dur)
 
 		model.includeConshdlr(conshdlr, "Train_opt", "Constraint handler resource constrains",
-			sepapriority=0, enfopriority=-1, chckpriority=-1, sepafreq=-1, propfreq=-1,
+			sepapriority=0, enfopriority=-1, chckpriority=-1, sepafreq=1, propfreq=10,
 			eagerfreq=-1, maxprerounds=0, delaysepa=False, delayprop=False, needscons=False,
 			presoltiming=scip.SCIP_PRESOLTIMING.FAST, proptiming=scip.SCIP_PROPTIMING.BEFORELP)
 
@@ -48,7 +51,11 @@ class Heur_solver:
 
 		model.setParam("misc/allowstrongdualreds", False)
 
-		
+		if dive:
+			self.solve_dive(model, conshdlr)
+			print(conshdlr.conscheck(None, model.getBestSol(), None , None , None, None))
+			return
+
 		while True:
 			model.optimize()
 			assert(model.getStatus() == "optimal")
@@ -68,35 +75,356 @@ class Heur_solver:
 			self.fix_var(model, 'f', non_bin_ks[0], 1)
 
 		print(conshdlr.conscheck(None, model.getBestSol(), None , None , None, None))
-			
+
+	def solve_dive(self, model, conshdlr):
+		# one solve, the root LP is dived on instead of re-optimizing after every fixing
+		heuristic = Dive_heuristic(self.inst, conshdlr)
+		model.includeHeur(heuristic, "Dive_fix", "batch dive and fix on flow variables", "D",
+			priority=100000, freq=0, timingmask=scip.SCIP_HEURTIMING.AFTERLPNODE)
+
+		model.setParam('limits/nodes', 1)
+		model.optimize()
+
+
 class Flow_max_heuristic(scip.Heur):
+	def __init__(self, inst):
+		self.inst = inst
 
+	@prof.timed()
 	def heurexec(self, heurtiming, nodeinfeasible):
-		solver = self.solver
 		model = self.model
-		
 
+		if model.getLPSolstat() != scip.SCIP_LPSOLSTAT.OPTIMAL:
+			return {"result": scip.SCIP_RESULT.DIDNOTRUN}
+
+		s_val, f_val = self.get_lp_vals()
+		f_cost = { k : model.getVarRedcost(v) for k, v in model.data['f'].items() }
+
+		routes = [self.get_route(t_ops, f_val, f_cost) for t_ops in self.inst.ops]
+
+		if self.try_schedule(routes, s_val):
+			return {"result": scip.SCIP_RESULT.FOUNDSOL}
+
+		return {"result": scip.SCIP_RESULT.DIDNOTFIND}
+
+	def get_lp_vals(self):
+		model = self.model
+		s = model.data['s']
+		f = model.data['f']
+
+		s_val = { k : model.getSolVal(None, s[k]) for k in s.keys() }
+		f_val = { k : model.getSolVal(None, f[k]) for k in f.keys() }
+
+		return s_val, f_val
+
+	def try_schedule(self, routes, s_val) -> bool:
+		start = self.make_schedule(routes, s_val)
+
+		if start is None:
+			return False
+
+		return self.model.trySol(self.make_sol(routes, start))
+
+	@staticmethod
+	def get_route(t_ops, f_val, f_cost):
+		# follow the largest LP flow, reduced cost breaks ties
+		route = [t_ops[0]]
+
+		while route[-1].n_succ > 0:
+			op = route[-1]
+			route.append(max(op.succ, key=lambda succ: (f_val[op, succ], -f_cost[op, succ])))
+
+		return route
+
+	@staticmethod
+	def get_res_delay(booked, res, start, end):
+		delay = None
+
+		for a, b in booked[res.idx]:
+			if a < end + res_time(res.time) and start < b:
+				delay = b if delay is None else max(delay, b)
+
+		return delay
+
+	@prof.timed()
+	def make_schedule(self, routes, s_val, max_iters=10000):
+		booked = {}
+		for res_idx in self.inst.res_uses.keys():
+			booked[res_idx] = []
+
+		start = {}
+
+		# trains are inserted by their LP departure, each op as early as the booked resources allow
+		for route in sorted(routes, key=lambda x: (s_val[x[0]], x[0].start_lb)):
+			times = [route[0].start_lb]
+			for prev, op in zip(route, route[1:]):
+				times.append(max(op.start_lb, times[-1] + prev.dur))
+
+			i = 0
+			it = 0
+
+			while i < len(route):
+				op = route[i]
+
+				it += 1
+				if it > max_iters or (op.start_ub is not None and times[i] > op.start_ub):
+					return None
+
+				end = times[i+1] if i + 1 < len(route) else times[i] + op.dur
+				delays = [self.get_res_delay(booked, res, times[i], end) for res in op.res]
+				delays = [d for d in delays if d is not None]
+
+				if not delays:
+					i += 1
+					continue
+
+				# waiting before op i keeps the previous op holding its resources longer
+				times[i] = max(delays)
+				for j in range(i + 1, len(route)):
+					times[j] = max(times[j], times[j-1] + route[j-1].dur)
+
+				i = max(i - 1, 0)
+
+			for i, op in enumerate(route):
+				end = times[i+1] if i + 1 < len(route) else times[i] + op.dur
+				for res in op.res:
+					booked[res.idx].append((times[i], end + res_time(res.time)))
+
+				start[op] = times[i]
+
+		return start
+
+	def make_sol(self, routes, start):
+		model = self.model
+
+		s = model.data['s']
 		e = model.data['e']
 		f = model.data['f']
+		u = model.data['u']
+		v = model.data['v']
+
+		s_val = dict(start)
+		e_val = {}
+
+		for route in routes:
+			for op, succ in zip(route, route[1:]):
+				e_val[op] = start[succ]
+			e_val[route[-1]] = start[route[-1]] + route[-1].dur
+
+		# unused ops still take part in the end constraints e[op] == s[succ]
+		for op in it.chain(*self.inst.ops):
+			if not op in s_val:
+				s_val[op] = next((e_val[prev] for prev in op.prev if prev in e_val), op.start_lb)
+
+			if not op in e_val:
+				e_val[op] = next((s_val[succ] for succ in op.succ if succ in s_val), s_val[op] + op.dur)
+
+			for succ in op.succ:
+				if not succ in s_val:
+					s_val[succ] = e_val[op]
+
+		used_arcs = { (op, succ) for route in routes for op, succ in zip(route, route[1:]) }
+
+		# order variables added by the constraint handler exist only in the transformed 
+		# problem, the solution is set in the original space and completed by SCIP
+		sol = model.createOrigSol(self)
+
+		for op in it.chain(*self.inst.ops):
+			model.setSolVal(sol, s[op], s_val[op])
+			model.setSolVal(sol, e[op], e_val[op])
+
+			for succ in op.succ:
+				model.setSolVal(sol, f[op, succ], 1 if (op, succ) in used_arcs else 0)
+
+			if op in u:
+				delay = s_val[op] - op.obj.threshold
+				model.setSolVal(sol, u[op], max(delay, 0))
+				model.setSolVal(sol, v[op], max(-delay, 0))
+
+		return sol
 	
-		e_val = { k : model.getSolVal(None, e[k]) for k in e.keys() }
-		f_val = { k : model.getSolVal(None, f[k]) for k in f.keys() }
 
-		eps = 1e-06
+class Dive_heuristic(Flow_max_heuristic):
+	def __init__(self, inst, conshdlr, near_one=0.9, batch_size=20, max_backtracks=20, max_order_rounds=50, eps=1e-6):
+		super().__init__(inst)
+		self.conshdlr = conshdlr
+		self.max_order_rounds = max_order_rounds
+		self.near_one = near_one
+		self.batch_size = batch_size
+		self.max_backtracks = max_backtracks
+		self.eps = eps
 
-		for k, v in f.items():
-			c = model.getVarRedcost(v)
-			x = f_val[k]
-			if (c > eps and not is_bin(x)):
-				print(k, x, c)
+	def get_dive_vars(self):
+		model = self.model
+		f = model.data['f']
 
-		
-		heur_solv = Heur_solver(solver.inst)
-		heur_solv.get_flow(f_val)
+		dive_vars = []
+
+		for v in f.values():
+			tv = model.getTransformedVar(v)
+			if tv.vtype() == 'BINARY' and tv.getStatus() in ('LOOSE', 'COLUMN'):
+				dive_vars.append(tv)
+
+		return dive_vars
+
+	def get_batch(self, dive_vars):
+		model = self.model
+
+		vals = [(model.getSolVal(None, v), v) for v in dive_vars]
+
+		if all(is_bin(x, self.eps) for x, _ in vals):
+			return []
+
+		cands = [(x, v) for x, v in vals if x > self.eps and model.getVarLbDive(v) < 0.5]
+
+		if not cands:
+			return None
+
+		cands.sort(key=lambda x: x[0], reverse=True)
+		batch = [v for x, v in cands[:self.batch_size] if x >= self.near_one]
+
+		return batch if batch else [cands[0][1]]
+
+	def add_order_rows(self, collisions):
+		# routes are integral but collide, order each pair by its current LP start
+		model = self.model
+		s = model.data['s']
+		e = model.data['e']
+
+		for res_idx, ru1, ru2 in collisions:
+			if model.getSolVal(None, s[ru1.op]) > model.getSolVal(None, s[ru2.op]):
+				ru1, ru2 = ru2, ru1
+
+			row = model.createEmptyRowUnspec(name=f'order{res_idx},{ru1.op},{ru2.op}', lhs=None, rhs=-res_time(ru1.time))
+			model.addVarToRow(row, model.getTransformedVar(e[ru1.op]), 1)
+			model.addVarToRow(row, model.getTransformedVar(s[ru2.op]), -1)
+			model.addRowDive(row)
+
+	def try_lp_sol(self):
+		model = self.model
+
+		sol = model.createSol(self)
+		for v in model.getVars(transformed=True):
+			model.setSolVal(sol, v, model.getSolVal(None, v))
+
+		# the LP may keep order variables fractional, round them to the order the starts imply
+		s = model.data['s']
+		e = model.data['e']
+		r = model.data.get('r', {})
+
+		for (res_idx, op1, op2), var in r.items():
+			t = next(res_time(res.time) for res in op1.res if res.idx == res_idx)
+			before = model.getSolVal(None, e[op1]) + t <= model.getSolVal(None, s[op2]) + self.eps
+			model.setSolVal(sol, var, 1 if before else 0)
+
+		return model.trySol(sol)
+
+	@prof.timed()
+	def heurexec(self, heurtiming, nodeinfeasible):
+		model = self.model
+
+		if model.getLPSolstat() != scip.SCIP_LPSOLSTAT.OPTIMAL:
+			return {"result": scip.SCIP_RESULT.DIDNOTRUN}
+
+		dive_vars = self.get_dive_vars()
+		result = scip.SCIP_RESULT.DIDNOTFIND
+
+		backtracks = 0
+		order_rounds = 0
+		batch = []
+		routes = None
+
+		model.startDive()
+
+		while True:
+			lperror, cutoff = model.solveDiveLP()
+			if lperror:
+				break
+
+			if cutoff:
+				if not batch or backtracks >= self.max_backtracks:
+					break
+
+				# undo the last batch and forbid its strongest candidate instead
+				backtracks += 1
+				for v in batch:
+					model.chgVarLbDive(v, 0)
+				model.chgVarUbDive(batch[0], 0)
+
+				batch = []
+				continue
+
+			batch = self.get_batch(dive_vars)
+
+			if batch is None:
+				break
+
+			if len(batch) == 0:
+				# the routes are integral, if ordering them by the LP fails they are scheduled greedily
+				s_val, f_val = self.get_lp_vals()
+				routes = [self.get_route(t_ops, f_val, { k: 0 for k in f_val }) for t_ops in self.inst.ops]
+
+				collisions = self.conshdlr.get_res_collisions(solution=None)
+
+				if collisions and order_rounds < self.max_order_rounds:
+					order_rounds += 1
+					self.add_order_rows(collisions)
+					continue
+
+				if not collisions and self.try_lp_sol():
+					result = scip.SCIP_RESULT.FOUNDSOL
+				break
+
+			for v in batch:
+				model.chgVarLbDive(v, 1)
+
+		model.endDive()
+
+		if result != scip.SCIP_RESULT.FOUNDSOL and routes is not None and self.try_schedule(routes, s_val):
+			result = scip.SCIP_RESULT.FOUNDSOL
+
+		return {"result": result}
+
+
+class Start_heuristic(Flow_max_heuristic):
+	# tries the solutions other solvers send in the common event format
+	def __init__(self, inst, client):
+		super().__init__(inst)
+		self.client = client
+
+	@prof.timed()
+	def heurexec(self, heurtiming, nodeinfeasible):
+		model = self.model
+
+		if self.client.is_stopped():
+			model.interruptSolve()
+			return {"result": scip.SCIP_RESULT.DIDNOTRUN}
+
+		start = self.client.get_start()
+
+		if start is None:
+			return {"result": scip.SCIP_RESULT.DIDNOTRUN}
+
+		times = { (ev['train'], ev['operation']): ev['time'] for ev in start[1] }
+		routes = [self.get_start_route(t_ops, times) for t_ops in self.inst.ops]
+
+		op_start = { op: times[op.idx] for route in routes for op in route }
+		sol = self.make_sol(routes, op_start)
+
+		if model.trySol(sol):
+			return {"result": scip.SCIP_RESULT.FOUNDSOL}
 
-		
 		return {"result": scip.SCIP_RESULT.DIDNOTFIND}
-	
+
+	@staticmethod
+	def get_start_route(t_ops, times):
+		route = [t_ops[0]]
+
+		while route[-1].n_succ > 0:
+			route.append(next(succ for succ in route[-1].succ if succ.idx in times))
+
+		return route
+
 
 if __name__ == '__main__':
 	inst = Instance(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA)
@@ -1,5 +1,6 @@
 #!.venv/bin/python3
 
+import os
 import sys
 
 import pyscipopt as scip
@@ -8,6 +9,9 @@ import numpy as np
 
 from typing import List, Tuple, Dict, Set
 from instance import Instance, Op, Res_use
+# prof is in the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
 
 
 class Model(scip.Model):
@@ -74,10 +78,8 @@ class Model(scip.Model):
 
 		M = op.dur
 
-		if op.n_succ == 0:
-			return
-
-		use = scip.quicksum(f[op, succ] for succ in op.succ)
+		# the last op is on every route, it holds its resources for its duration too
+		use = scip.quicksum(f[op, succ] for succ in op.succ) if op.n_succ > 0 else 1
 
 		cons = s[op] + op.dur <= e[op] + M*(1 - use)
 		m.addCons(name=f'dur{op}', cons=cons)
@@ -139,6 +141,7 @@ class Model(scip.Model):
 
 
 	@staticmethod
+	@prof.timed()
 	def make_init_model(m, inst: Instance):
 		m.data = {}
 
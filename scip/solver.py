@@ -1,5 +1,6 @@
 #!.venv/bin/python3
 
+import os
 import sys
 
 import pyscipopt as scip
@@ -12,11 +13,37 @@ from dataclasses import dataclass, field
 
 from model import Model
 from conshdlr import Res_conshdlr
+from heuristic import Flow_max_heuristic, Start_heuristic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prof
 
 DEFAULT_DATA = 'data/testing/headway1.json'
 # DEFAUL_DATA = 'data/phase1/line1_critical_0.json'
 
 
+class Client_eventhdlr(scip.Eventhdlr):
+	def __init__(self, solver, client):
+		self.solver = solver
+		self.client = client
+
+	def eventinit(self):
+		self.model.catchEvent(scip.SCIP_EVENTTYPE.BESTSOLFOUND | scip.SCIP_EVENTTYPE.NODESOLVED, self)
+
+	def eventexit(self):
+		self.model.dropEvent(scip.SCIP_EVENTTYPE.BESTSOLFOUND | scip.SCIP_EVENTTYPE.NODESOLVED, self)
+
+	def eventexec(self, event):
+		model = self.model
+
+		if self.client.is_stopped():
+			model.interruptSolve()
+			return
+
+		if event.getType() == scip.SCIP_EVENTTYPE.BESTSOLFOUND:
+			# the objective leaves out increments, so the dual bound stays a valid lower bound
+			self.client.send(self.solver.get_jsn_events(model, model.getBestSol()), model.getDualbound())
+
+
 class Solver:
 	inst: Instance
 
@@ -43,22 +70,52 @@ class Solver:
 			m.chgVarType(m.data[var][k], vtype='B')
 
 
-	def solve(self):
+	def get_jsn_events(self, model, sol) -> List[dict]:
+		s = model.data['s']
+		f = model.data['f']
+
+		jsn_events = []
+
+		for t_ops in self.inst.ops:
+			op = t_ops[0]
+
+			while True:
+				jsn_events.append({ 'train': op.train_idx, 'operation': op.op_idx, 
+					'time': int(round(model.getSolVal(sol, s[op]))) })
+
+				if op.n_succ == 0:
+					break
+
+				op = max(op.succ, key=lambda succ: model.getSolVal(sol, f[op, succ]))
+
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
+	@prof.timed()
+	def make_model(self, client=None):
 		model = Model(self.inst)
 		# model.hideOutput()
 		
 		conshdlr = Res_conshdlr(model, self.inst.res_uses, self.inst.max_train_dur)
 
 		model.includeConshdlr(conshdlr, "Train_opt", "Constraint handler resource constrains",
-			sepapriority=0, enfopriority=-1, chckpriority=-1, sepafreq=-1, propfreq=-1,
+			sepapriority=0, enfopriority=-1, chckpriority=-1, sepafreq=1, propfreq=10,
 			eagerfreq=-1, maxprerounds=0, delaysepa=False, delayprop=False, needscons=False,
 			presoltiming=scip.SCIP_PRESOLTIMING.FAST, proptiming=scip.SCIP_PROPTIMING.BEFORELP)
 
-		# heuristic = Flow_max_heuristic()
-		# heuristic.model = model
-		# heuristic.solver = self
-		# model.includeHeur(heuristic, "SimpleRounding", "custom heuristic implemented in python", "Y",
-		# 		 timingmask=scip.SCIP_HEURTIMING.DURINGLPLOOP)
+		heuristic = Flow_max_heuristic(self.inst)
+		model.includeHeur(heuristic, "Flow_max", "LP flow rounding with greedy scheduling", "Y",
+			priority=10000, freq=1, timingmask=scip.SCIP_HEURTIMING.AFTERLPNODE)
+
+		if client is not None:
+			model.hideOutput()
+
+			model.includeHeur(Start_heuristic(self.inst, client), "Start", "solutions from the portfolio", "P",
+				priority=20000, freq=1, timingmask=scip.SCIP_HEURTIMING.BEFORENODE)
+
+			model.includeEventhdlr(Client_eventhdlr(self, client), "Client", "reports solutions to the portfolio")
 
 
 		model.setParam("misc/allowstrongdualreds", False)
@@ -68,12 +125,23 @@ class Solver:
 		
 		# model.setParam('parallel/mode', 0)
 
+		model.setParam('parallel/mode', 0)
 
-		model.setParam('limits/time', 120)
+		return model, conshdlr
+
+
+	def solve(self, max_time=120, client=None) -> float|None:
+		model, conshdlr = self.make_model(client)
+
+		model.setParam('limits/time', max_time)
 
-		model.setParam('parallel/mode', 0)
 		# model.solveConcurrent()
-		model.optimize()
+		with prof.timer('optimize'):
+			model.optimize()
+
+		if client is not None:
+			return model.getDualbound()
+
 		model.writeProblem()
 
 		# m.hideOutput()
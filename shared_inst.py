@@ -0,0 +1,293 @@
+#!.venv/bin/python3
+
+import sys
+import time
+import pickle
+
+import numpy as np
+import multiprocessing as mp
+
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, NamedTuple, Callable
+
+from instance import Instance, Op, Level, Train, Res, Obj
+import prof
+
+
+DEFAULT_DATA = 'data/nor5_large_3.json'
+
+
+class Shared_handle(NamedTuple):
+	# all a worker needs to attach, its size does not depend on the instance
+	name: str
+	n_res: int
+	layout: Tuple[Tuple[str, int, int], ...]
+
+
+class Lazy_list:
+	# read access like a list, items are built on demand
+	n: int
+	get: Callable
+
+	def __init__(self, n: int, get: Callable):
+		self.n = n
+		self.get = get
+
+	def __len__(self):
+		return self.n
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self.get(j) for j in range(*i.indices(self.n))]
+
+		if i < 0:
+			i += self.n
+
+		if not 0 <= i < self.n:
+			raise IndexError(i)
+
+		return self.get(i)
+
+	def __iter__(self):
+		return (self.get(i) for i in range(self.n))
+
+
+class Shared_inst:
+	shm: shared_memory.SharedMemory
+	handle: Shared_handle
+	is_owner: bool
+
+	op_train: np.ndarray
+	op_level_start: np.ndarray
+	op_level_end: np.ndarray
+	op_dur: np.ndarray
+	op_start_lb: np.ndarray
+	op_start_ub: np.ndarray
+
+	# the resources of op i are use_res[op_use[i]:op_use[i + 1]]
+	op_use: np.ndarray
+	use_res: np.ndarray
+	use_time: np.ndarray
+
+	op_has_obj: np.ndarray
+	op_obj_time: np.ndarray
+	op_obj_value: np.ndarray
+	op_obj_is_bin: np.ndarray
+
+	# ops into and out of level i are in_op[level_in[i]:level_in[i + 1]], same for out
+	level_train: np.ndarray
+	level_time_lb: np.ndarray
+	level_time_ub: np.ndarray
+	level_in: np.ndarray
+	in_op: np.ndarray
+	level_out: np.ndarray
+	out_op: np.ndarray
+
+	train_op_start: np.ndarray
+	train_op_end: np.ndarray
+	train_level_start: np.ndarray
+	train_level_end: np.ndarray
+	train_use: np.ndarray
+	train_res: np.ndarray
+
+	ops: Lazy_list
+	levels: Lazy_list
+	trains: Lazy_list
+
+	def __init__(self, shm: shared_memory.SharedMemory, handle: Shared_handle, is_owner: bool):
+		self.shm = shm
+		self.handle = handle
+		self.is_owner = is_owner
+
+		# views on the shared block, nothing is copied
+		for name, offset, length in handle.layout:
+			a = np.ndarray((length,), dtype=np.int64, buffer=shm.buf, offset=offset*8)
+			a.flags.writeable = False
+			setattr(self, name, a)
+
+		self.ops = Lazy_list(len(self.op_train), self.get_op)
+		self.levels = Lazy_list(len(self.level_train), self.get_level)
+		self.trains = Lazy_list(len(self.train_op_start), self.get_train)
+
+
+	@classmethod
+	@prof.timed()
+	def publish(cls, inst: Instance) -> 'Shared_inst':
+		ops, levels, trains = inst.ops, inst.levels, inst.trains
+		obj_ops = [op if op.has_obj else Op(obj=Obj()) for op in ops]
+
+		arrays = {
+			'op_train': [op.train for op in ops],
+			'op_level_start': [op.level_start for op in ops],
+			'op_level_end': [op.level_end for op in ops],
+			'op_dur': [op.dur for op in ops],
+			'op_start_lb': [op.start_lb for op in ops],
+			'op_start_ub': [op.start_ub for op in ops],
+
+			'op_use': np.cumsum([0] + [op.n_res for op in ops]),
+			'use_res': [res.idx for op in ops for res in op.res],
+			'use_time': [res.time for op in ops for res in op.res],
+
+			'op_has_obj': [op.has_obj for op in ops],
+			'op_obj_time': [op.obj.time for op in obj_ops],
+			'op_obj_value': [op.obj.value for op in obj_ops],
+			'op_obj_is_bin': [op.obj.is_bin for op in obj_ops],
+
+			'level_train': [level.train for level in levels],
+			'level_time_lb': [level.time_lb for level in levels],
+			'level_time_ub': [level.time_ub for level in levels],
+			'level_in': np.cumsum([0] + [level.n_ops_in for level in levels]),
+			'in_op': [o for level in levels for o in level.ops_in],
+			'level_out': np.cumsum([0] + [level.n_ops_out for level in levels]),
+			'out_op': [o for level in levels for o in level.ops_out],
+
+			'train_op_start': [train.op_start for train in trains],
+			'train_op_end': [train.op_end for train in trains],
+			'train_level_start': [train.level_start for train in trains],
+			'train_level_end': [train.level_end for train in trains],
+			'train_use': np.cumsum([0] + [len(train.res) for train in trains]),
+			'train_res': [r for train in trains for r in sorted(train.res)],
+		}
+
+		layout = []
+		offset = 0
+
+		for name, a in arrays.items():
+			layout.append((name, offset, len(a)))
+			offset += len(a)
+
+		shm = shared_memory.SharedMemory(create=True, size=max(offset*8, 1))
+		handle = Shared_handle(shm.name, inst.n_res, tuple(layout))
+
+		for (name, offset, length), a in zip(layout, arrays.values()):
+			np.ndarray((length,), dtype=np.int64, buffer=shm.buf, offset=offset*8)[:] = a
+
+		return cls(shm, handle, True)
+
+
+	@classmethod
+	def attach(cls, handle: Shared_handle) -> 'Shared_inst':
+		shm = shared_memory.SharedMemory(name=handle.name)
+
+		# the parent owns the block and unlinks it, a worker's tracker would unlink it on exit
+		resource_tracker.unregister(shm._name, 'shared_memory')
+
+		return cls(shm, handle, False)
+
+
+	def close(self):
+		# views have to go before the buffer is released
+		for name, _, _ in self.handle.layout:
+			delattr(self, name)
+
+		self.shm.close()
+
+		# the parent owns the unlink, register again since workers sharing our tracker unregistered it
+		if self.is_owner:
+			resource_tracker.register(self.shm._name, 'shared_memory')
+			self.shm.unlink()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *args):
+		self.close()
+
+
+	def get_op(self, i: int) -> Op:
+		res = [Res(idx=int(r), time=int(t)) for r, t in zip(self.get_slice(self.use_res, self.op_use, i), self.get_slice(self.use_time, self.op_use, i))]
+		obj = Obj(time=int(self.op_obj_time[i]), value=int(self.op_obj_value[i]), is_bin=bool(self.op_obj_is_bin[i])) if self.op_has_obj[i] else None
+
+		return Op(
+			idx			=i,
+			train		=int(self.op_train[i]),
+			level_start	=int(self.op_level_start[i]),
+			level_end	=int(self.op_level_end[i]),
+			dur			=int(self.op_dur[i]),
+			start_lb	=int(self.op_start_lb[i]),
+			start_ub	=int(self.op_start_ub[i]),
+			res			=res,
+			obj			=obj
+		)
+
+
+	def get_level(self, i: int) -> Level:
+		return Level(
+			idx		=i,
+			train	=int(self.level_train[i]),
+			time_lb	=int(self.level_time_lb[i]),
+			time_ub	=int(self.level_time_ub[i]),
+			ops_in	=self.get_slice(self.in_op, self.level_in, i).tolist(),
+			ops_out	=self.get_slice(self.out_op, self.level_out, i).tolist()
+		)
+
+
+	def get_train(self, i: int) -> Train:
+		return Train(
+			idx			=i,
+			op_start	=int(self.train_op_start[i]),
+			op_end		=int(self.train_op_end[i]),
+			level_start	=int(self.train_level_start[i]),
+			level_end	=int(self.train_level_end[i]),
+			res			=set(self.get_slice(self.train_res, self.train_use, i).tolist())
+		)
+
+
+	def get_slice(self, a: np.ndarray, ptr: np.ndarray, i: int) -> np.ndarray:
+		return a[ptr[i]:ptr[i + 1]]
+
+
+	@property
+	def n_trains(self):
+		return len(self.train_op_start)
+
+
+	@property
+	def n_levels(self):
+		return len(self.level_train)
+
+
+	@property
+	def n_ops(self):
+		return len(self.op_train)
+
+
+	@property
+	def n_res(self):
+		return self.handle.n_res
+
+
+worker_inst: Shared_inst|None = None
+
+def init_worker(handle: Shared_handle):
+	global worker_inst
+	worker_inst = Shared_inst.attach(handle)
+
+
+def get_train_dur_worker(t: int) -> int:
+	inst = worker_inst
+	return int(inst.op_dur[inst.train_op_start[t]:inst.train_op_end[t]].sum())
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	n_procs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+	print(data)
+	inst = Instance(data)
+
+	with Shared_inst.publish(inst) as shared:
+		print(f'{shared.shm.size/(1 << 20):.2f} MiB shared, handle {len(pickle.dumps(shared.handle))} bytes, '
+			f'instance {len(pickle.dumps(inst))/(1 << 20):.2f} MiB pickled')
+
+		time_start = time.time()
+
+		# spawned workers get nothing from the parent but the handle
+		with ProcessPoolExecutor(n_procs, mp.get_context('spawn'), initializer=init_worker, initargs=(shared.handle,)) as pool:
+			durs = list(pool.map(get_train_dur_worker, range(shared.n_trains)))
+
+		print(f'{n_procs} workers: {time.time() - time_start:.2f}s')
+
+		assert durs == [sum(op.dur for op in inst.ops[train.op_start:train.op_end]) for train in inst.trains]
@@ -0,0 +1,198 @@
+#!.venv/bin/python3
+
+import os
+import sys
+
+import numpy as np
+
+from typing import List, Tuple
+
+from base_inst import Base_inst
+
+
+MAGIC = b'TSOL'
+VERSION = 1
+
+# a file header, then one block per written solution, each a block header and its records
+# the hash is raw bytes, an S20 field would strip trailing zero bytes
+FILE_HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('inst_hash', 'u1', 20)])
+BLOCK_HEADER = np.dtype([('obj', '<i8'), ('time', '<f8'), ('n_records', '<u4')])
+RECORD = np.dtype([('train', '<i4'), ('op', '<i4'), ('start', '<i4'), ('end', '<i4')])
+
+
+def make_records(base_inst: Base_inst, jsn_events: List[dict]) -> np.ndarray:
+	# the events only have starts, an op ends where the next op of its train starts
+	records = np.zeros(len(jsn_events), dtype=RECORD)
+
+	records['train'] = [ev['train'] for ev in jsn_events]
+	records['op'] = [ev['operation'] for ev in jsn_events]
+	records['start'] = [ev['time'] for ev in jsn_events]
+
+	records = records[np.lexsort((records['op'], records['start'], records['train']))]
+
+	last = np.append(records['train'][1:] != records['train'][:-1], True)
+
+	records['end'][:-1] = records['start'][1:]
+	records['end'][last] = records['start'][last] + [
+		base_inst.trains[t].ops[o].dur for t, o in zip(records['train'][last], records['op'][last])]
+
+	return records
+
+
+def get_jsn_events(records: np.ndarray) -> List[dict]:
+	jsn_events = [
+		{ 'train': int(t), 'operation': int(o), 'time': int(s) }
+		for t, o, s in zip(records['train'], records['op'], records['start'])
+	]
+
+	jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+	return jsn_events
+
+
+def diff_records(rec1: np.ndarray, rec2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+	# ops used only in rec1, ops used only in rec2, and records of rec2 whose times moved
+	key1 = (rec1['train'].astype(np.int64) << 32) | rec1['op'].astype(np.int64)
+	key2 = (rec2['train'].astype(np.int64) << 32) | rec2['op'].astype(np.int64)
+
+	_, idx1, idx2 = np.intersect1d(key1, key2, assume_unique=True, return_indices=True)
+
+	only1 = np.ones(len(rec1), dtype=bool)
+	only1[idx1] = False
+
+	only2 = np.ones(len(rec2), dtype=bool)
+	only2[idx2] = False
+
+	moved = (rec1['start'][idx1] != rec2['start'][idx2]) | (rec1['end'][idx1] != rec2['end'][idx2])
+
+	return rec1[only1], rec2[only2], rec2[idx2[moved]]
+
+
+class Sol_writer:
+	path: str
+	inst_hash: str
+
+	def __init__(self, path: str, inst_hash: str):
+		self.path = path
+		self.inst_hash = inst_hash
+
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			reader = Sol_reader(path)
+			if reader.inst_hash != inst_hash:
+				raise ValueError(f'{path} belongs to instance {reader.inst_hash}')
+
+			# a block cut short by a crash is dropped before appending
+			size = reader.size
+			del reader
+			os.truncate(path, size)
+
+			self.fd = open(path, 'ab')
+		else:
+			self.fd = open(path, 'wb')
+
+			header = np.zeros(1, dtype=FILE_HEADER)
+			header['magic'] = MAGIC
+			header['version'] = VERSION
+			header['inst_hash'] = np.frombuffer(bytes.fromhex(inst_hash), dtype=np.uint8)
+
+			self.fd.write(header.tobytes())
+			self.fd.flush()
+
+
+	def write(self, obj: int, records: np.ndarray, time: float = 0):
+		header = np.zeros(1, dtype=BLOCK_HEADER)
+		header['obj'] = obj
+		header['time'] = time
+		header['n_records'] = len(records)
+
+		self.fd.write(header.tobytes() + records.astype(RECORD, copy=False).tobytes())
+		self.fd.flush()
+
+
+	def close(self):
+		if self.fd:
+			self.fd.close()
+			self.fd = None
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *args):
+		self.close()
+
+
+class Sol_reader:
+	path: str
+	inst_hash: str
+	size: int
+
+	blocks: List[Tuple[int, float, int, int]]
+
+	def __init__(self, path: str):
+		self.path = path
+		self.data = np.memmap(path, dtype=np.uint8, mode='r')
+
+		header = self.data[:FILE_HEADER.itemsize].view(FILE_HEADER)[0]
+
+		if header['magic'] != MAGIC or header['version'] != VERSION:
+			raise ValueError(f'{path} is not a solution file')
+
+		self.inst_hash = header['inst_hash'].tobytes().hex()
+		self.make_index()
+
+
+	def make_index(self):
+		# only the block headers are read, records stay in the mapping
+		self.blocks = []
+		pos = FILE_HEADER.itemsize
+
+		while pos + BLOCK_HEADER.itemsize <= len(self.data):
+			header = self.data[pos:pos + BLOCK_HEADER.itemsize].view(BLOCK_HEADER)[0]
+			start = pos + BLOCK_HEADER.itemsize
+			end = start + int(header['n_records'])*RECORD.itemsize
+
+			if end > len(self.data):
+				break
+
+			self.blocks.append((int(header['obj']), float(header['time']), start, end))
+			pos = end
+
+		self.size = pos
+
+
+	@property
+	def n_sols(self) -> int:
+		return len(self.blocks)
+
+
+	def get_obj(self, k=-1) -> int:
+		return self.blocks[k][0]
+
+
+	def get_time(self, k=-1) -> float:
+		return self.blocks[k][1]
+
+
+	def get_records(self, k=-1) -> np.ndarray:
+		_, _, start, end = self.blocks[k]
+
+		return self.data[start:end].view(RECORD)
+
+
+	def get_jsn_events(self, k=-1) -> List[dict]:
+		return get_jsn_events(self.get_records(k))
+
+
+if __name__ == '__main__':
+	reader = Sol_reader(sys.argv[1])
+	print(f'{sys.argv[1]}: instance {reader.inst_hash}, {reader.n_sols} solutions')
+
+	for k in range(reader.n_sols):
+		print(f'{reader.get_time(k):.2f}s obj {reader.get_obj(k)}, {len(reader.get_records(k))} ops')
+
+	if len(sys.argv) > 2:
+		other = Sol_reader(sys.argv[2])
+		only1, only2, moved = diff_records(reader.get_records(), other.get_records())
+		print(f'diff: {len(only1)} ops only in first, {len(only2)} only in second, {len(moved)} moved')
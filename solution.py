@@ -0,0 +1,392 @@
+#!.venv/bin/python3
+
+import sys
+import json
+import time
+
+import numpy as np
+
+from dataclasses import dataclass
+from collections import defaultdict
+from typing import List, Dict, Tuple
+
+from instance import Instance
+
+
+DEFAULT_DATA = 'data/nor1_critical_0.json'
+
+
+@dataclass
+class Solution:
+	# op leaving each level, -1 for the last level of a train and levels off the path
+	level_op: np.ndarray
+	# time each level is reached, only meaningful on the path
+	level_time: np.ndarray
+
+
+def count_overlaps(res: np.ndarray, lock: np.ndarray, unlock: np.ndarray) -> int:
+	# pairs of intervals on the same resource that share more than an instant, and empty
+	# intervals strictly inside another one. intervals touching at one instant are left to
+	# the order of the events at that time
+	empty = unlock == lock
+	res_e, time_e = res[empty], lock[empty]
+	res, lock, unlock = res[~empty], lock[~empty], unlock[~empty]
+
+	if len(res) == 0:
+		return 0
+
+	# resource and time in one sort key
+	t0 = min(lock.min(), time_e.min(initial=lock.min()))
+	span = int(max(unlock.max(), time_e.max(initial=0)) - t0) + 1
+	base = res*span
+	lock_key = base + lock - t0
+	unlock_key = np.sort(base + unlock - t0)
+
+	order = np.argsort(lock_key, kind='stable')
+	lock_key = lock_key[order]
+	base = base[order]
+
+	# every interval overlaps the ones on its resource before it by lock, except those
+	# already released at its lock
+	n_before = np.arange(len(lock_key)) - np.searchsorted(lock_key, base, side='left')
+	n_released = np.searchsorted(unlock_key, lock_key, side='right') - np.searchsorted(unlock_key, base, side='left')
+
+	# an empty interval is inside the intervals locked before it and not yet released
+	key_e = res_e*span + time_e - t0
+	n_inside = np.searchsorted(lock_key, key_e, side='left') - np.searchsorted(unlock_key, key_e, side='right')
+
+	return int((n_before - n_released).sum() + n_inside.sum())
+
+
+def get_overlapping(res: np.ndarray, lock: np.ndarray, unlock: np.ndarray) -> np.ndarray:
+	# intervals overlapping another one by the rule of count_overlaps, two intervals overlap
+	# if each locks before the other unlocks, so empty intervals only overlap from inside
+	if len(res) == 0:
+		return np.zeros(0, dtype=bool)
+
+	order = np.lexsort((unlock, lock, res))
+	t0 = lock.min()
+	span = int(unlock.max() - t0) + 1
+	base = res[order]*span
+	lock_key = base + lock[order] - t0
+	unlock_key = base + unlock[order] - t0
+
+	# by lock, an interval overlaps the ones before it still held at its lock, empty ones
+	# go first on equal locks. the next one by lock is the first locked after it
+	with_before = np.maximum.accumulate(unlock_key)[:-1] > lock_key[1:]
+	with_after = lock_key[1:] < unlock_key[:-1]
+
+	overlapping = np.zeros(len(res), dtype=bool)
+	overlapping[order[1:]] |= with_before
+	overlapping[order[:-1]] |= with_after
+
+	return overlapping
+
+
+def has_cycle(edges: List[Tuple[tuple, tuple]]) -> bool:
+	succ = defaultdict(list)
+	n_in = defaultdict(int)
+
+	for u, v in edges:
+		succ[u].append(v)
+		n_in[v] += 1
+
+	nodes = set(succ.keys()) | set(n_in.keys())
+	queue = [u for u in nodes if n_in[u] == 0]
+	n_done = 0
+
+	while queue:
+		u = queue.pop()
+		n_done += 1
+
+		for v in succ[u]:
+			n_in[v] -= 1
+			if n_in[v] == 0:
+				queue.append(v)
+
+	return n_done < len(nodes)
+
+
+class Sol_checker:
+	inst: Instance
+
+	op_train: np.ndarray
+	op_level_start: np.ndarray
+	op_level_end: np.ndarray
+	op_dur: np.ndarray
+	op_start_lb: np.ndarray
+	op_start_ub: np.ndarray
+
+	level_is_first: np.ndarray
+	level_is_last: np.ndarray
+
+	use_op: np.ndarray
+	use_res: np.ndarray
+	use_time: np.ndarray
+
+	obj_op: np.ndarray
+	obj_time: np.ndarray
+	obj_value: np.ndarray
+	obj_is_bin: np.ndarray
+
+	def __init__(self, inst: Instance):
+		self.inst = inst
+
+		ops = inst.ops
+
+		self.op_train = np.array([op.train for op in ops], dtype=np.int64)
+		self.op_level_start = np.array([op.level_start for op in ops], dtype=np.int64)
+		self.op_level_end = np.array([op.level_end for op in ops], dtype=np.int64)
+		self.op_dur = np.array([op.dur for op in ops], dtype=np.int64)
+		self.op_start_lb = np.array([op.start_lb for op in ops], dtype=np.int64)
+		self.op_start_ub = np.array([op.start_ub for op in ops], dtype=np.int64)
+
+		self.level_is_first = np.array([level.n_ops_in == 0 for level in inst.levels])
+		self.level_is_last = np.array([level.n_ops_out == 0 for level in inst.levels])
+
+		self.use_op = np.array([op.idx for op in ops for res in op.res], dtype=np.int64)
+		self.use_res = np.array([res.idx for op in ops for res in op.res], dtype=np.int64)
+		self.use_time = np.array([res.time for op in ops for res in op.res], dtype=np.int64)
+
+		obj_ops = [op for op in ops if op.has_obj]
+
+		self.obj_op = np.array([op.idx for op in obj_ops], dtype=np.int64)
+		self.obj_time = np.array([op.obj.time for op in obj_ops], dtype=np.int64)
+		self.obj_value = np.array([op.obj.value for op in obj_ops], dtype=np.int64)
+		self.obj_is_bin = np.array([op.obj.is_bin for op in obj_ops], dtype=bool)
+
+		# any topological order of the levels orders the events of a path at equal times
+		self.level_rank = self.get_level_rank()
+
+
+	def get_level_rank(self) -> np.ndarray:
+		levels = self.inst.levels
+		n_in = [level.n_ops_in for level in levels]
+		order = [level.idx for level in levels if level.n_ops_in == 0]
+
+		for l in order:
+			for o in levels[l].ops_out:
+				end = self.op_level_end[o]
+				n_in[end] -= 1
+
+				if n_in[end] == 0:
+					order.append(end)
+
+		rank = np.zeros(len(levels), dtype=np.int64)
+		rank[order] = np.arange(len(order))
+
+		return rank
+
+
+	def make_solution(self, jsn_events: List[dict]) -> Solution:
+		# from the events of the solution files, ops are (train, operation) pairs
+		op_start = np.array([t.op_start for t in self.inst.trains], dtype=np.int64)
+
+		train = np.fromiter((ev['train'] for ev in jsn_events), dtype=np.int64, count=len(jsn_events))
+		op = op_start[train] + np.fromiter((ev['operation'] for ev in jsn_events), dtype=np.int64, count=len(jsn_events))
+		start = np.fromiter((ev['time'] for ev in jsn_events), dtype=np.int64, count=len(jsn_events))
+
+		n_levels = self.inst.n_levels
+
+		sol = Solution(
+			level_op	=np.full(n_levels, -1, dtype=np.int64),
+			level_time	=np.zeros(n_levels, dtype=np.int64)
+		)
+
+		sol.level_op[self.op_level_start[op]] = op
+		sol.level_time[self.op_level_start[op]] = start
+
+		# the last op of a path ends as early as its duration allows
+		last = self.level_is_last[self.op_level_end[op]]
+		sol.level_time[self.op_level_end[op[last]]] = start[last] + self.op_dur[op[last]]
+
+		return sol
+
+
+	def get_jsn_events(self, sol: Solution) -> List[dict]:
+		op = self.get_used_ops(sol)
+		op_start = np.array([t.op_start for t in self.inst.trains], dtype=np.int64)
+
+		train = self.op_train[op]
+		start = sol.level_time[self.op_level_start[op]]
+
+		jsn_events = [
+			{ 'train': int(t), 'operation': int(o - op_start[t]), 'time': int(s) }
+			for t, o, s in zip(train, op, start)
+		]
+
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
+	def get_used_ops(self, sol: Solution) -> np.ndarray:
+		return sol.level_op[sol.level_op >= 0]
+
+
+	def get_used(self, sol: Solution) -> np.ndarray:
+		used = np.zeros(self.inst.n_ops, dtype=bool)
+		used[self.get_used_ops(sol)] = True
+
+		return used
+
+
+	def count_path_violations(self, sol: Solution) -> int:
+		op = self.get_used_ops(sol)
+		level = np.flatnonzero(sol.level_op >= 0)
+
+		has_op = sol.level_op >= 0
+
+		# each chosen op leaves its own level and every level is entered at most once,
+		# with a start at every first level this leaves exactly one path per train
+		end = self.op_level_end[op]
+		n_in = np.bincount(end, minlength=self.inst.n_levels)
+
+		return int(
+			np.count_nonzero(self.op_level_start[op] != level) +
+			np.count_nonzero(~has_op[self.level_is_first]) +
+			np.count_nonzero(~(has_op[end] | self.level_is_last[end])) +
+			np.count_nonzero(n_in > 1) +
+			np.count_nonzero(has_op & ~self.level_is_first & (n_in == 0))
+		)
+
+
+	def count_dur_violations(self, sol: Solution) -> int:
+		op = self.get_used_ops(sol)
+		start = sol.level_time[self.op_level_start[op]]
+		end = sol.level_time[self.op_level_end[op]]
+
+		return int(np.count_nonzero(end - start < self.op_dur[op]))
+
+
+	def count_window_violations(self, sol: Solution) -> int:
+		op = self.get_used_ops(sol)
+		start = sol.level_time[self.op_level_start[op]]
+
+		return int(np.count_nonzero((start < self.op_start_lb[op]) | (start > self.op_start_ub[op])))
+
+
+	def count_res_violations(self, sol: Solution) -> int:
+		# a train holds a resource from its first lock to its last release, like the models do
+		sel = self.get_used(sol)[self.use_op]
+		if not sel.any():
+			return 0
+
+		op = self.use_op[sel]
+		res = self.use_res[sel]
+		train = self.op_train[op]
+		release = self.use_time[sel]
+
+		lock_level = self.op_level_start[op]
+		unlock_level = self.op_level_end[op]
+		lock = sol.level_time[lock_level]
+		unlock = sol.level_time[unlock_level] + release
+
+		key = res*self.inst.n_trains + train
+
+		# the first lock and the last release of every train on a resource, ties in path order
+		order = np.lexsort((self.level_rank[lock_level], lock, key))
+		first = order[np.concatenate(([True], key[order][1:] != key[order][:-1]))]
+
+		order = np.lexsort((self.level_rank[unlock_level], unlock, key))
+		last = order[np.concatenate((key[order][1:] != key[order][:-1], [True]))]
+
+		n_overlaps = count_overlaps(res[first], lock[first], unlock[last])
+
+		return n_overlaps + self.count_swap_violations(
+			res[first], train[first], lock[first], unlock[last], lock_level[first], unlock_level[last], release[last] == 0)
+
+
+	def count_swap_violations(self, res, train, lock, unlock, lock_level, unlock_level, is_event) -> int:
+		# with a release time of 0 the resource is free from the event that ends the use on.
+		# a train taking over a resource at the same time has to come after that event, so
+		# the hand-overs at one time must not form a cycle, like two trains swapping
+		t0 = lock.min()
+		span = int(unlock.max() - t0) + 1
+		lock_key = res*span + lock - t0
+		unlock_key = res*span + unlock - t0
+
+		common = np.intersect1d(lock_key, unlock_key)
+		if len(common) == 0:
+			return 0
+
+		points = defaultdict(lambda: ([], []))
+
+		for i in np.flatnonzero(np.isin(unlock_key, common)):
+			points[unlock_key[i]][0].append(i)
+
+		for i in np.flatnonzero(np.isin(lock_key, common)):
+			points[lock_key[i]][1].append(i)
+
+		edges = defaultdict(list)
+
+		for ends, starts in points.values():
+			for i in ends:
+				for j in starts:
+					# two empty intervals at the same time go in any order
+					if train[i] == train[j] or not is_event[i] or (lock[i] == unlock[i] and lock[j] == unlock[j]):
+						continue
+
+					edges[unlock[i]].append(((train[i], unlock_level[i]), (train[j], lock_level[j])))
+
+		n_cycles = 0
+
+		for time_edges in edges.values():
+			# the events of a train at one time follow its path
+			train_nodes = defaultdict(set)
+
+			for u, v in time_edges:
+				train_nodes[u[0]].add(u)
+				train_nodes[v[0]].add(v)
+
+			for nodes in train_nodes.values():
+				nodes = sorted(nodes, key=lambda u: self.level_rank[u[1]])
+				time_edges += zip(nodes, nodes[1:])
+
+			n_cycles += has_cycle(time_edges)
+
+		return n_cycles
+
+
+	def check(self, sol: Solution) -> Dict[str, int]:
+		violations = {
+			'path': self.count_path_violations(sol),
+			'dur': self.count_dur_violations(sol),
+			'window': self.count_window_violations(sol),
+			'res': self.count_res_violations(sol),
+		}
+
+		return { k: v for k, v in violations.items() if v > 0 }
+
+
+	def is_valid(self, sol: Solution) -> bool:
+		return len(self.check(sol)) == 0
+
+
+	def get_obj(self, sol: Solution) -> int:
+		used = self.get_used(sol)[self.obj_op]
+
+		start = sol.level_time[self.op_level_start[self.obj_op]]
+		delay = np.maximum(start - self.obj_time, 0)*used
+
+		return int(np.sum(np.where(self.obj_is_bin, self.obj_value*(delay > 0), self.obj_value*delay)))
+
+
+if __name__ == '__main__':
+	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
+	sol_file = sys.argv[2] if len(sys.argv) > 2 else None
+	print(data)
+	inst = Instance(data)
+	checker = Sol_checker(inst)
+
+	if sol_file:
+		with open(sol_file, 'r') as fd:
+			jsn = json.load(fd)
+
+		sol = checker.make_solution(jsn['events'])
+
+		time_start = time.time()
+		violations = checker.check(sol)
+		obj = checker.get_obj(sol)
+
+		print(f'violations {violations}, obj {obj}, {1000*(time.time() - time_start):.2f}ms')
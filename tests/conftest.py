@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from portfolio import load_backend
+from instance import Instance
+from solution import Sol_checker
+from generator import Generator, write_jsn
+
+
+def get_data(name: str) -> str:
+	return os.path.join(ROOT_DIR, 'data', name)
+
+
+def make_data(tmp_path, n_trains=6, seed=1) -> str:
+	data = str(tmp_path/'gen.json')
+	write_jsn(Generator(n_trains, n_sections=12, seed=seed).generate(), data)
+
+	return data
+
+
+def check_events(data: str, jsn_events: list) -> int:
+	# the objective of a schedule that passes the checker
+	checker = Sol_checker(Instance(data))
+	sol = checker.make_solution(jsn_events)
+
+	assert checker.check(sol) == {}
+
+	return checker.get_obj(sol)
+
+
+@pytest.fixture
+def backend():
+	# backends bring their own instance module, their imports are undone after the test
+	path = list(sys.path)
+	modules = dict(sys.modules)
+
+	yield load_backend
+
+	sys.path[:] = path
+
+	# library modules imported meanwhile stay, reloading them breaks pickling in later tests
+	for k in set(sys.modules) - set(modules):
+		if getattr(sys.modules[k], '__file__', None) and sys.modules[k].__file__.startswith(ROOT_DIR + os.sep):
+			del sys.modules[k]
+
+	sys.modules.update(modules)
@@ -0,0 +1,28 @@
+import json
+
+import batch
+
+from conftest import get_data, check_events
+
+
+def test_threads():
+	b = batch.Batch(n_cores=8)
+	b.add(get_data('testing/headway1.json'), 'cpsat', 10.0, 0)
+	b.add(get_data('nor1_full_3.json'), 'cpsat', 10.0, 0)
+	b.add(get_data('nor5_large_3.json'), 'cpsat', 10.0, 0)
+	b.add(get_data('nor5_large_3.json'), 'scip', 10.0, 0)
+
+	assert [job.threads for job in b.jobs] == [1, 6, 8, 1]
+
+
+def test_main(tmp_path, monkeypatch):
+	# the default solvers, the results go to the working directory
+	monkeypatch.chdir(tmp_path)
+	data = get_data('testing/headway1.json')
+	batch.main([data, '--max-time', '10'])
+
+	with open(tmp_path/'batch.jsonl') as fd:
+		results = [json.loads(line) for line in fd]
+
+	assert sorted(r['solver'] for r in results) == ['cpsat', 'scip']
+	assert all(r['obj'] == 34 for r in results)
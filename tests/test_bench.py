@@ -0,0 +1,37 @@
+import queue
+
+import pytest
+
+import bench
+from conftest import get_data
+
+
+@pytest.mark.parametrize('solver, name, status, obj', [
+	('cpsat', 'headway1', 'feasible', 34),
+	('cpsat', 'infeasible2', 'no solution', None),
+	('graph', 'swapping1', "invalid {'res': 1}", None),
+])
+def test_run_case(solver, name, status, obj):
+	# every schedule goes through the checker, a swap is not reported as feasible
+	result = bench.run_case(solver, get_data(f'testing/{name}.json'), 10.0, 0)
+
+	assert result['status'] == status
+	assert result['obj'] == obj
+
+
+def test_import_error(monkeypatch):
+	def run_missing(data, max_time, seed, threads=0):
+		import no_such_backend
+
+	monkeypatch.setitem(bench.SOLVERS, 'missing', run_missing)
+
+	q = queue.Queue()
+	bench.run_case_worker(q, 'missing', get_data('testing/headway1.json'), 1.0, 0)
+
+	assert q.get()['import_error']
+
+
+def test_main(tmp_path):
+	bench.main(['--solvers', 'cpsat,scip', '--families', 'testing', '--max-time', '10', '--out', str(tmp_path/'bench.json')])
+
+	assert (tmp_path/'bench.json').exists()
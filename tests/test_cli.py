@@ -0,0 +1,58 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from conftest import ROOT_DIR, get_data
+
+HEADWAY = get_data('testing/headway1.json')
+
+
+def run_cli(cwd, *args, timeout=120):
+	# from another directory, so files the backends write do not end up in the repo
+	return subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'cli.py')] + list(args), cwd=cwd,
+		capture_output=True, text=True, timeout=timeout)
+
+
+@pytest.mark.parametrize('args', [
+	['gurobi', HEADWAY, '--max-time', '5'],
+	['cpsat', HEADWAY, '--max-time', '5'],
+	['lns', HEADWAY, '--max-time', '2'],
+	['lns', HEADWAY, '--max-time', '2', '--procs', '2'],
+	['lns', HEADWAY, '--max-time', '2', '--persistent'],
+	['redispatch', HEADWAY, '--updates', '2'],
+	['groups', HEADWAY, '--group-time', '5'],
+	['scip', HEADWAY, '--max-time', '5'],
+	['dive', HEADWAY],
+	['graph', HEADWAY],
+	['portfolio', HEADWAY, '--max-time', '10'],
+	['rolling', HEADWAY, '--window-time', '5'],
+	['decomp', HEADWAY, '--cluster-time', '5'],
+	['info', HEADWAY],
+])
+def test_command(tmp_path, args):
+	rv = run_cli(tmp_path, *args)
+
+	assert rv.returncode == 0, rv.stderr
+
+
+def test_check(tmp_path):
+	sol = str(tmp_path/'sol.jsonl')
+	assert run_cli(tmp_path, 'cpsat', HEADWAY, '--max-time', '5', '--out', sol).returncode == 0
+
+	rv = run_cli(tmp_path, 'check', HEADWAY, '--sol', sol)
+	assert 'violations {}, obj 34' in rv.stdout
+
+	# a run that found nothing leaves an empty file
+	open(sol, 'w').close()
+	rv = run_cli(tmp_path, 'check', HEADWAY, '--sol', sol)
+	assert rv.returncode == 1
+	assert 'holds no solution' in rv.stdout
+
+
+def test_generate(tmp_path):
+	out = str(tmp_path/'gen.json')
+
+	assert run_cli(tmp_path, 'generate', '--out', out, '--trains', '4', '--sections', '8').returncode == 0
+	assert run_cli(tmp_path, 'info', out).returncode == 0
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from conftest import get_data, make_data, check_events
+
+
+@pytest.mark.parametrize('name, obj', [('headway1', 34), ('example_problem', 11)])
+def test_solve(backend, name, obj):
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(get_data(f'testing/{name}.json'))
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	assert s.solve(10.0, 1)
+	assert s.is_optimal()
+	assert s.solver.objective_value == obj
+
+	assert check_events(get_data(f'testing/{name}.json'), s.get_solution().get_jsn_events()) == obj
+
+
+@pytest.mark.parametrize('name', ['infeasible1', 'infeasible2'])
+def test_infeasible(backend, name):
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(get_data(f'testing/{name}.json'))
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	assert not s.solve(10.0, 1)
+
+
+def test_swapping(backend):
+	# the model releases a second late, so it cannot hand over at the reference time of 30
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(get_data('testing/swapping1.json'))
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	assert s.solve(10.0, 1)
+	assert check_events(get_data('testing/swapping1.json'), s.get_solution().get_jsn_events()) == 31
+
+
+def test_instance(backend):
+	instance = backend('cpsat', 'instance')
+	inst = instance.Instance(get_data('testing/headway1.json'))
+
+	for train in inst.trains:
+		assert train.ops[-1].n_succ == 0
+		assert all(op.i in train.ops[p].succ for op in train.ops for p in op.prev)
+		assert all(r in train.ops[o].res for r, ops in train.res_to_op.items() for o in ops)
+		assert train.avoidable_res <= train.res
+
+
+def test_solve_stream(backend, tmp_path):
+	data = make_data(tmp_path)
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(data)
+	out_file = str(tmp_path/'incumbents.jsonl')
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	queue = solver.Queue()
+	assert s.solve_stream(2.0, 1, queue=queue, out_file=out_file)
+
+	with open(out_file, 'r') as fd:
+		lines = [json.loads(line) for line in fd]
+
+	assert len(lines) == len(s.incumbents) == queue.qsize() > 0
+	assert all(a['objective_value'] >= b['objective_value'] for a, b in zip(lines, lines[1:]))
+	assert lines[-1]['objective_value'] == s.solver.objective_value
+
+	for line in lines:
+		assert check_events(data, line['events']) == line['objective_value']
+
+
+def test_stop_obj(backend, tmp_path):
+	data = make_data(tmp_path)
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(data)
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+
+	# the first incumbent is below any objective, the search stops there
+	assert s.solve_stream(10.0, 1, stop_obj=float('inf'))
+	assert len(s.incumbents) == 1
+
+
+def test_contended(backend, tmp_path):
+	data = make_data(tmp_path)
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(data)
+
+	# a single train contends for nothing, its resource usage literals are made on demand
+	s = solver.Solver(inst, None, free=[0])
+	assert not s.var_res_lock
+
+	s.add_res_obj()
+	assert s.solve(1.0, 1)
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.TIME)
+	assert s.solve(5.0, 1)
+	sol = s.get_solution()
+
+	# the other trains only block with their intervals in sol, their last starts are constants
+	s = solver.Solver(inst, sol, free=[0], semi=list(range(1, inst.n_trains)))
+	s.add_obj(solver.Obj_type.TIME)
+	assert s.solve(5.0, 1)
+	assert all((r, t) in s.fixed_res for r, trains in s.res_used.items() for t in trains if t != 0)
+	assert s.solver.objective_value <= solver.get_obj(inst, sol, solver.Obj_type.TIME)
+
+	sol.events |= s.get_solution().events
+	check_events(data, sol.get_jsn_events())
+
+
+def test_time_windows(backend, tmp_path):
+	data = make_data(tmp_path)
+	solver = backend('cpsat', 'solver')
+	inst = solver.Instance(data)
+
+	s = solver.Solver(inst, None, free=list(range(inst.n_trains)))
+	s.add_obj(solver.Obj_type.DELAY)
+	assert s.solve(2.0, 1)
+
+	for t, events in s.get_solution().events.items():
+		start_lb, start_ub, end_ub = s.get_time_windows(t)
+
+		for e in events:
+			assert start_lb[e.idx.op] <= e.start <= start_ub[e.idx.op]
+			assert e.end <= end_ub[e.idx.op]
+
+	# the objective counts what the instance objective counts
+	assert check_events(data, s.get_solution().get_jsn_events()) == solver.get_obj(inst, s.get_solution(), solver.Obj_type.DELAY)
@@ -0,0 +1,40 @@
+import json
+
+from conftest import make_data, check_events
+
+from decomp import Decomposition
+
+
+def test_conflicts(tmp_path):
+	# every train holds r on its first op only
+	data = str(tmp_path/'trains.json')
+	train = [
+		{ 'min_duration': 0, 'successors': [1], 'resources': [{ 'resource': 'r' }] },
+		{ 'min_duration': 0, 'successors': [] },
+	]
+
+	with open(data, 'w') as fd:
+		json.dump({ 'trains': [train]*3, 'objective': [] }, fd)
+
+	decomp = Decomposition(data)
+
+	def set_use(t, lock, unlock):
+		decomp.events[t] = [{ 'train': t, 'operation': 0, 'time': lock }, { 'train': t, 'operation': 1, 'time': unlock }]
+
+	# an empty use where another one ends is left to the order of the events
+	set_use(0, 0, 5)
+	set_use(1, 5, 5)
+	set_use(2, 5, 8)
+	assert decomp.get_conflicts() == set()
+
+	# inside another use it is a conflict
+	set_use(1, 3, 3)
+	assert decomp.get_conflicts() == { 0, 1 }
+
+
+def test_decomp(tmp_path):
+	data = make_data(tmp_path, n_trains=8)
+	jsn_events = Decomposition(data, max_size=3, cluster_time=5.0, n_procs=2).solve()
+
+	assert jsn_events is not None
+	check_events(data, jsn_events)
@@ -0,0 +1,33 @@
+from conftest import make_data, check_events
+
+
+def test_solve_trains(backend, tmp_path):
+	data = make_data(tmp_path)
+	heuristic = backend('cpsat', 'heuristic')
+	inst = heuristic.Instance(data)
+	cache_dir = str(tmp_path/'cache')
+
+	train_events = heuristic.Heuristic(inst, n_procs=2, cache_dir=cache_dir).solve_trains()
+
+	assert len(train_events) == inst.n_trains
+	assert all(events[-1].idx.op == inst.trains[t].ops[-1].i for t, events in enumerate(train_events))
+
+	# the second run reads every train from the cache
+	heur = heuristic.Heuristic(inst, n_procs=2, cache_dir=cache_dir)
+	assert all(heur.load_train(t) == events for t, events in enumerate(train_events))
+	assert heur.solve_trains() == train_events
+
+
+def test_merge_groups(backend, tmp_path):
+	data = make_data(tmp_path)
+	heuristic = backend('cpsat', 'heuristic')
+	inst = heuristic.Instance(data)
+
+	heur = heuristic.Heuristic(inst, n_procs=1, cache_dir=None)
+	assert heur.solve(5.0)
+
+	sol = heuristic.Solution()
+	sol.events = { t: events for group in heur.groups if group for t, events in group.events.items() }
+
+	assert sorted(sol.events.keys()) == list(range(inst.n_trains))
+	check_events(data, sol.get_jsn_events())
@@ -0,0 +1,54 @@
+from conftest import make_data, check_events
+
+
+def test_lns(backend, tmp_path):
+	data = make_data(tmp_path)
+	lns = backend('cpsat', 'lns')
+
+	l = lns.Lns(lns.Instance(data), sub_time=1.0, obj_type=lns.Obj_type.DELAY)
+	init_obj = l.best_obj
+
+	assert check_events(data, l.best_sol.get_jsn_events()) == init_obj
+
+	l.solve(5.0, max_iters=4)
+
+	assert l.best_obj <= init_obj
+	assert check_events(data, l.best_sol.get_jsn_events()) == l.best_obj
+
+
+def test_lns_parallel(backend, tmp_path):
+	data = make_data(tmp_path)
+	lns = backend('cpsat', 'lns')
+
+	l = lns.Lns(lns.Instance(data), sub_time=1.0, obj_type=lns.Obj_type.DELAY)
+	init_obj = l.best_obj
+
+	l.solve_parallel(3.0, n_procs=2, num_workers=1)
+
+	assert l.best_obj <= init_obj
+	assert check_events(data, l.best_sol.get_jsn_events()) == l.best_obj
+
+
+def test_persistent(backend, tmp_path):
+	data = make_data(tmp_path)
+	lns = backend('cpsat', 'lns')
+	inst = lns.Instance(data)
+
+	l = lns.Lns(inst, sub_time=1.0, obj_type=lns.Obj_type.DELAY)
+	solver = lns.Persistent_solver(inst, lns.Obj_type.DELAY)
+
+	# domains tightened for one neighbourhood are restored for the next
+	for free in ([0, 1], [2, 3, 4], [0, 5]):
+		solver.set_nbhd(l.best_sol, free)
+		assert solver.solve(5.0, 1)
+
+		sol = lns.Solution()
+		sol.events = l.best_sol.events | solver.get_solution().events
+
+		assert check_events(data, sol.get_jsn_events()) == lns.get_obj(inst, sol, lns.Obj_type.DELAY)
+		assert lns.get_obj(inst, sol, lns.Obj_type.DELAY) <= l.best_obj
+
+	l = lns.Lns(inst, sub_time=1.0, persistent=True, obj_type=lns.Obj_type.DELAY)
+	l.solve(5.0, max_iters=4)
+
+	assert check_events(data, l.best_sol.get_jsn_events()) == l.best_obj
@@ -0,0 +1,52 @@
+import sys
+import json
+import subprocess
+
+from conftest import ROOT_DIR, get_data, check_events
+from portfolio import Portfolio
+
+
+def test_portfolio():
+	portfolio = Portfolio(get_data('testing/headway1.json'), ['cpsat', 'scip'], max_time=20.0)
+	jsn_events = portfolio.solve()
+
+	assert portfolio.best_obj == 34
+	assert portfolio.bound == 34
+	assert check_events(get_data('testing/headway1.json'), jsn_events) == 34
+
+
+def test_single_backend():
+	# the portfolio stops the backend once it proves optimality, in a process so a hang fails the test
+	rv = subprocess.run([sys.executable, 'cli.py', 'portfolio', get_data('testing/headway1.json'), '--backends', 'cpsat',
+		'--max-time', '20'], cwd=ROOT_DIR, capture_output=True, text=True, timeout=15)
+
+	assert rv.returncode == 0
+	assert 'best: 34 (cpsat), bound 34' in rv.stdout
+
+
+def test_invalid_incumbent():
+	# both trains swap their resources at time 5, the portfolio has to keep the reference instead
+	portfolio = Portfolio(get_data('testing/swapping1.json'), [])
+
+	swap = [{ 'train': t, 'operation': o, 'time': time } for t in range(2) for o, time in enumerate([0, 0, 5, 10])]
+	portfolio.add_incumbent('swap', swap, {}, 0.0)
+
+	assert portfolio.best_events is None
+
+	with open(get_data('testing_solution/swapping1.json'), 'r') as fd:
+		jsn = json.load(fd)
+
+	portfolio.add_incumbent('reference', jsn['events'], {}, 0.0)
+
+	assert portfolio.best_obj == jsn['objective_value']
+	assert portfolio.best_backend == 'reference'
+
+
+def test_shared_instance(tmp_path, monkeypatch):
+	# the gurobi backend works on the parent's instance in shared memory, and writes model.lp
+	monkeypatch.chdir(tmp_path)
+	portfolio = Portfolio(get_data('testing/headway1.json'), ['gurobi', 'cpsat'], max_time=20.0)
+	jsn_events = portfolio.solve()
+
+	assert portfolio.best_obj == 34
+	assert check_events(get_data('testing/headway1.json'), jsn_events) == 34
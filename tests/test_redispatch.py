@@ -0,0 +1,44 @@
+from conftest import make_data, check_events
+
+
+def make_redispatcher(redispatch, data):
+	inst = redispatch.Instance(data)
+	lns = redispatch.Lns(inst, sub_time=1.0, obj_type=redispatch.Obj_type.DELAY)
+
+	return redispatch.Redispatcher(inst, lns.best_sol, max_time=1.0, num_workers=1)
+
+
+def test_update(backend, tmp_path):
+	data = make_data(tmp_path)
+	redispatch = backend('cpsat', 'redispatch')
+	rd = make_redispatcher(redispatch, data)
+
+	old = { t: list(events) for t, events in rd.sol.events.items() }
+	# the op before ends right now and every way on from it is late, so it has to wait
+	events = old[0]
+	prev = events[len(events)//2 - 1]
+	now = prev.end
+	late = { redispatch.Op_idx(0, s): now + 100 for s in rd.inst.op(prev.idx).succ }
+
+	sol = rd.update(now, late)
+	assert sol is not None
+
+	# the executed part stays, the late ops start no earlier than reported
+	for old_e in events:
+		if old_e.end < now:
+			assert old_e in sol.events[0]
+
+	assert all(new_e.start >= now + 100 for new_e in sol.events[0] if new_e.idx in late)
+	assert all(sol.events[t] == old[t] for t in range(rd.inst.n_trains) if not t in rd.free)
+
+	check_events(data, sol.get_jsn_events())
+
+
+def test_simulate(backend, tmp_path):
+	data = make_data(tmp_path)
+	redispatch = backend('cpsat', 'redispatch')
+	rd = make_redispatcher(redispatch, data)
+
+	redispatch.simulate(rd, 5, 300)
+
+	check_events(data, rd.sol.get_jsn_events())
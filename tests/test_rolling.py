@@ -0,0 +1,36 @@
+import json
+
+from conftest import make_data, check_events
+
+from base_inst import Base_inst
+from rolling import Rolling_horizon, get_jsn_fixed_train
+
+
+def test_fixed_train(tmp_path):
+	# op 2 comes before op 1 on the path, both last no time and start together
+	data = str(tmp_path/'train.json')
+	ops = [
+		{ 'min_duration': 5, 'successors': [2] },
+		{ 'min_duration': 0, 'successors': [3], 'resources': [{ 'resource': 'b' }] },
+		{ 'min_duration': 0, 'successors': [1], 'resources': [{ 'resource': 'a' }] },
+		{ 'min_duration': 3, 'successors': [] },
+	]
+
+	with open(data, 'w') as fd:
+		json.dump({ 'trains': [ops], 'objective': [] }, fd)
+
+	train = Base_inst(data).trains[0]
+	events = [{ 'train': 0, 'operation': o, 'time': t } for o, t in [(0, 0), (1, 5), (2, 5), (3, 5)]]
+	jsn_train = get_jsn_fixed_train(train, events)
+
+	assert [[r['resource'] for r in op['resources']] for op in jsn_train] == [[], ['a'], ['b'], []]
+	assert [op['start_lb'] for op in jsn_train] == [0, 5, 5, 5]
+
+
+def test_rolling(tmp_path):
+	# the trains start far apart, so later windows are solved around fixed trains
+	data = make_data(tmp_path)
+	jsn_events = Rolling_horizon(data, window=600, overlap=300, window_time=5.0).solve()
+
+	assert jsn_events is not None
+	check_events(data, jsn_events)
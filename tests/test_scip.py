@@ -0,0 +1,137 @@
+import pytest
+import pyscipopt as scip
+
+from conftest import get_data, make_data, check_events
+
+
+def solve(solver, data, max_time=20.0):
+	s = solver.Solver(solver.Instance(data))
+	model, conshdlr = s.make_model()
+	model.hideOutput()
+	model.setParam('limits/time', max_time)
+	model.optimize()
+
+	return s, model, conshdlr
+
+
+@pytest.mark.parametrize('name, obj', [('headway1', 34), ('example_problem', 11), ('swapping1', 31)])
+def test_solve(backend, name, obj):
+	# like the ortools model, resources are released a second late, so swapping1 ends at 31
+	solver = backend('scip', 'solver')
+	s, model, _ = solve(solver, get_data(f'testing/{name}.json'))
+
+	assert model.getStatus() == 'optimal'
+	assert round(model.getObjVal()) == obj
+	assert check_events(get_data(f'testing/{name}.json'), s.get_jsn_events(model, model.getBestSol())) == obj
+
+
+@pytest.mark.parametrize('name', ['infeasible1', 'infeasible2'])
+def test_infeasible(backend, name):
+	solver = backend('scip', 'solver')
+	_, model, _ = solve(solver, get_data(f'testing/{name}.json'))
+
+	assert model.getStatus() == 'infeasible'
+
+
+def test_separation(backend, tmp_path):
+	data = make_data(tmp_path, n_trains=10, seed=2)
+	solver = backend('scip', 'solver')
+	s, model, conshdlr = solve(solver, data)
+
+	assert model.getNSols() > 0
+	assert len(conshdlr.cut_pairs) > 0
+	check_events(data, s.get_jsn_events(model, model.getBestSol()))
+
+
+def test_max_train_dur(backend):
+	instance = backend('scip', 'instance')
+	inst = instance.Instance(get_data('testing/headway1.json'))
+
+	assert len(inst.max_train_dur) == inst.n_trains
+	assert all(d >= sum(op.dur for op in t_ops) for d, t_ops in zip(inst.max_train_dur, inst.ops))
+
+
+def test_res_collisions(backend, tmp_path):
+	# every train on its first route from time 0, the arrays have to find the same pairs as a loop
+	data = make_data(tmp_path)
+	solver = backend('scip', 'solver')
+	conshdlr = backend('scip', 'conshdlr')
+	inst = solver.Instance(data)
+	model, ch = solver.Solver(inst).make_model()
+
+	s = model.data['s']
+	e = model.data['e']
+	f = model.data['f']
+
+	sol = model.createSol()
+	used = set()
+
+	for t_ops in inst.ops:
+		op, time = t_ops[0], 0
+
+		while True:
+			used.add(op)
+			model.setSolVal(sol, s[op], time)
+			model.setSolVal(sol, e[op], time + op.dur)
+			time += op.dur
+
+			if op.n_succ == 0:
+				break
+
+			model.setSolVal(sol, f[op, op.succ[0]], 1)
+			op = op.succ[0]
+
+	expected = set()
+
+	for res_idx, res_uses in inst.res_uses.items():
+		for i, ru1 in enumerate(res_uses):
+			for ru2 in res_uses[i+1:]:
+				op1, op2 = ru1.op, ru2.op
+				if op1.train_idx == op2.train_idx or not (op1 in used and op2 in used):
+					continue
+
+				s1, e1 = model.getSolVal(sol, s[op1]), model.getSolVal(sol, e[op1]) + conshdlr.res_time(ru1.time)
+				s2, e2 = model.getSolVal(sol, s[op2]), model.getSolVal(sol, e[op2]) + conshdlr.res_time(ru2.time)
+
+				if s1 < e2 and s2 < e1:
+					expected.add((res_idx, op1, op2))
+
+	collisions = { (res_idx, ru1.op, ru2.op) for res_idx, ru1, ru2 in ch.get_res_collisions(sol) }
+
+	assert len(expected) > 0
+	assert collisions == expected
+
+
+def test_flow_max(backend, tmp_path):
+	# with the other heuristics off, the root node only has the flow rounding to find a schedule
+	data = make_data(tmp_path, n_trains=10, seed=2)
+	solver = backend('scip', 'solver')
+	s = solver.Solver(solver.Instance(data))
+	model, _ = s.make_model()
+
+	model.hideOutput()
+	model.setHeuristics(scip.SCIP_PARAMSETTING.OFF)
+	model.setParam('heuristics/Flow_max/freq', 1)
+	model.setParam('limits/nodes', 1)
+	model.optimize()
+
+	assert model.getNSols() > 0
+	check_events(data, s.get_jsn_events(model, model.getBestSol()))
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_dive(backend, tmp_path, seed):
+	data = make_data(tmp_path, n_trains=10, seed=seed)
+	solver = backend('scip', 'solver')
+	heuristic = backend('scip', 'heuristic')
+
+	inst = solver.Instance(data)
+	s = solver.Solver(inst)
+	model, conshdlr = s.make_model()
+
+	model.hideOutput()
+	model.setHeuristics(scip.SCIP_PARAMSETTING.OFF)
+	heuristic.Heur_solver(inst).solve_dive(model, conshdlr)
+
+	assert model.getNSols() > 0
+	check_events(data, s.get_jsn_events(model, model.getBestSol()))
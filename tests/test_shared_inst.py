@@ -0,0 +1,31 @@
+import multiprocessing as mp
+
+from concurrent.futures import ProcessPoolExecutor
+
+from conftest import make_data
+from instance import Instance
+from shared_inst import Shared_inst, init_worker, get_train_dur_worker
+
+
+def test_attach(tmp_path):
+	inst = Instance(make_data(tmp_path))
+
+	with Shared_inst.publish(inst) as shared:
+		attached = Shared_inst.attach(shared.handle)
+
+		assert list(attached.ops) == inst.ops
+		assert list(attached.levels) == inst.levels
+		assert list(attached.trains) == inst.trains
+		assert attached.n_res == inst.n_res
+
+		attached.close()
+
+
+def test_workers(tmp_path):
+	inst = Instance(make_data(tmp_path))
+
+	with Shared_inst.publish(inst) as shared:
+		with ProcessPoolExecutor(2, mp.get_context('spawn'), initializer=init_worker, initargs=(shared.handle,)) as pool:
+			durs = list(pool.map(get_train_dur_worker, range(shared.n_trains)))
+
+	assert durs == [sum(op.dur for op in inst.ops[train.op_start:train.op_end]) for train in inst.trains]
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from conftest import get_data
+from instance import Instance
+from solution import Sol_checker, count_overlaps, get_overlapping
+
+import numpy as np
+
+
+def make_checker(name: str) -> Sol_checker:
+	return Sol_checker(Instance(get_data(f'testing/{name}.json')))
+
+
+def make_events(train_times: dict) -> list:
+	return [{ 'train': t, 'operation': o, 'time': time } for t, times in train_times.items() for o, time in enumerate(times)]
+
+
+@pytest.mark.parametrize('name', ['headway1', 'swapping1', 'swapping2'])
+def test_reference_solutions(name):
+	checker = make_checker(name)
+
+	with open(get_data(f'testing_solution/{name}.json'), 'r') as fd:
+		jsn = json.load(fd)
+
+	sol = checker.make_solution(jsn['events'])
+
+	assert checker.check(sol) == {}
+	assert checker.get_obj(sol) == jsn['objective_value']
+
+
+def test_simultaneous_swap():
+	# both trains leave their first resource for the other's at time 5
+	checker = make_checker('swapping1')
+	sol = checker.make_solution(make_events({ 0: [0, 0, 5, 10], 1: [0, 0, 5, 10] }))
+
+	assert checker.check(sol) == { 'res': 1 }
+
+
+def test_infeasible():
+	checker = make_checker('infeasible2')
+	sol = checker.make_solution(make_events({ 0: [0, 5, 10], 1: [0, 5, 10] }))
+
+	assert not checker.is_valid(sol)
+
+
+def test_late_start():
+	checker = make_checker('swapping1')
+	sol = checker.make_solution(make_events({ 0: [1, 1, 6, 11], 1: [0, 11, 16, 21] }))
+
+	assert checker.check(sol) == { 'window': 1 }
+
+
+def test_count_overlaps():
+	res = np.array([0, 0, 0, 0, 1])
+	lock = np.array([0, 5, 3, 5, 4])
+	unlock = np.array([5, 10, 3, 5, 4])
+
+	# 0 and 1 touch, the empty interval at 3 is inside 0, the one at 5 inside neither
+	assert count_overlaps(res, lock, unlock) == 1
+
+
+def test_get_overlapping():
+	rng = np.random.default_rng(1)
+
+	for _ in range(100):
+		n = rng.integers(1, 10)
+		res = rng.integers(0, 3, n)
+		lock = rng.integers(0, 10, n)
+		unlock = lock + rng.integers(0, 4, n)
+
+		expected = [any(res[i] == res[j] and lock[i] < unlock[j] and lock[j] < unlock[i] for j in range(n) if j != i) for i in range(n)]
+
+		assert list(get_overlapping(res, lock, unlock)) == expected
+		assert (count_overlaps(res, lock, unlock) > 0) == any(expected)
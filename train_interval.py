@@ -3,11 +3,13 @@
 import sys
 
 from collections import defaultdict
+from typing import List, Dict
 import gurobipy as gp
 
 from gurobipy import GRB
 
 from instance import Instance
+import prof
 
 
 MAX_DUR = 100000
@@ -22,6 +24,7 @@ class Model:
 		self.gm = gp.Model()
 
 	
+	@prof.timed()
 	def build(self):
 		self.add_var_level_time()
 		self.add_var_op_used()
@@ -153,6 +156,8 @@ class Model:
 
 			exit(-1)
 
+		prof.count('res_overlap_cons')
+
 		order[k] = self.gm.addVar(vtype=GRB.BINARY, name=f'res_order_{res}_{train1}_{train2}')
 		
 		self.gm.addConstr(unlock[res, train1] <= lock[res, train2] + M*(1 - order[k]))
@@ -187,6 +192,46 @@ class Model:
 		return res_uses
 
 
+	def get_start_values(self, jsn_events) -> Dict[gp.Var, float]:
+		# partial start in the common event format, times of levels off the path are left open
+		values = {}
+		used = set()
+
+		for ev in jsn_events:
+			op = self.inst.ops[self.inst.trains[ev['train']].op_start + ev['operation']]
+			used.add(op.idx)
+			values[self.var_level_time[op.level_start]] = ev['time']
+
+		for op in self.inst.ops:
+			values[self.var_op_used[op.idx]] = 1 if op.idx in used else 0
+
+		for ev in jsn_events:
+			op = self.inst.ops[self.inst.trains[ev['train']].op_start + ev['operation']]
+			values.setdefault(self.var_level_time[op.level_end], ev['time'] + op.dur)
+
+		return values
+
+
+	def set_start(self, jsn_events):
+		for var, value in self.get_start_values(jsn_events).items():
+			var.Start = value
+
+
+	def get_jsn_events(self) -> List[dict]:
+		used = self.var_op_used
+		time = self.var_level_time
+
+		jsn_events = [
+			{ 'train': op.train, 'operation': op.idx - self.inst.trains[op.train].op_start, 
+				'time': round(time[op.level_start].X) }
+			for op in self.inst.ops if used[op.idx].X > 0.5
+		]
+
+		jsn_events.sort(key=lambda x: (x['time'], x['train']))
+
+		return jsn_events
+
+
 if __name__ == '__main__':
 	data = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA
 	print(data)